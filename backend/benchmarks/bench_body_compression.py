@@ -0,0 +1,124 @@
+"""
+Compare capture throughput and disk footprint of the body compression codecs.
+
+Builds a synthetic corpus of unique JSON, HTML, JavaScript and base64-encoded
+binary bodies, writes it through ``FlowStore.append_many`` in writer-sized
+batches once per codec, and reports flows/sec, MB/sec and bytes on disk.
+
+    cd backend && python benchmarks/bench_body_compression.py --flows 5000
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from api.flow_store import FlowStore  # noqa: E402
+
+
+def _json_body(i, rng):
+    return json.dumps({
+        "page": i,
+        "items": [
+            {"id": i * 100 + n, "name": f"user-{rng.randrange(10**6)}", "active": rng.random() > 0.5,
+             "tags": rng.sample(["admin", "beta", "staff", "trial", "paid"], 2)}
+            for n in range(rng.randrange(20, 200))
+        ],
+    })
+
+
+def _html_body(i, rng):
+    rows = "".join(
+        f"<tr><td>{i}-{n}</td><td><a href=\"/item/{rng.randrange(10**6)}\">Item {n}</a></td></tr>"
+        for n in range(rng.randrange(50, 300))
+    )
+    return f"<!doctype html><html><head><title>Page {i}</title></head><body><table>{rows}</table></body></html>"
+
+
+def _js_body(i, rng):
+    return ";".join(
+        f"function f{i}_{n}(a,b){{return a*{rng.randrange(1000)}+b.map(x=>x+{n})}}"
+        for n in range(rng.randrange(100, 600))
+    )
+
+
+def _binary_body(i, rng):
+    return base64.b64encode(os.urandom(rng.randrange(1024, 16384))).decode("ascii")
+
+
+GENERATORS = [_json_body, _html_body, _js_body, _binary_body]
+
+
+def build_corpus(count, seed=1):
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        body = GENERATORS[i % len(GENERATORS)](i, rng)
+        corpus.append({
+            "timestamp": "2024-03-20T10:00:00",
+            "method": "GET",
+            "url": f"https://example.com/resource/{i}",
+            "status": 200,
+            "content_length": len(body),
+            "request": {"method": "GET", "url": f"https://example.com/resource/{i}",
+                        "headers": {"User-Agent": "bench"}, "content": None},
+            "response": {"status_code": 200, "headers": {"Content-Type": "text/plain"}, "content": body},
+        })
+    return corpus
+
+
+def run(codec, corpus, batch_size, level):
+    with tempfile.TemporaryDirectory() as tmp:
+        store = FlowStore(Path(tmp) / "flows.db", compression=codec, compression_level=level)
+        started = time.perf_counter()
+        for start in range(0, len(corpus), batch_size):
+            batch = [dict(entry) for entry in corpus[start:start + batch_size]]
+            store.append_many(batch)
+        elapsed = time.perf_counter() - started
+
+        read_started = time.perf_counter()
+        store.get(len(corpus))
+        store.entries(include_bodies=False)
+        list_ms = (time.perf_counter() - read_started) * 1000
+
+        stats = store.blob_stats()
+        store.close()
+    return {
+        "codec": codec,
+        "flows_per_sec": len(corpus) / elapsed,
+        "mb_per_sec": stats["stored_bytes"] / elapsed / 1e6,
+        "body_bytes": stats["stored_bytes"],
+        "disk_bytes": stats["disk_bytes"],
+        "list_ms": list_ms,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--flows", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--level", type=int, default=None)
+    parser.add_argument("--codecs", nargs="+", default=["none", "gzip", "zstd"])
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.flows)
+    print(f"{args.flows} flows, {sum(len(e['response']['content']) for e in corpus) / 1e6:.1f} MB of bodies")
+    print(f"{'codec':<6} {'flows/s':>9} {'MB/s':>8} {'on disk':>10} {'ratio':>6} {'list+get ms':>12}")
+    for codec in args.codecs:
+        result = run(codec, corpus, args.batch_size, args.level)
+        ratio = result["body_bytes"] / max(1, result["disk_bytes"])
+        print(
+            f"{result['codec']:<6} {result['flows_per_sec']:>9.0f} {result['mb_per_sec']:>8.1f} "
+            f"{result['disk_bytes'] / 1e6:>8.1f}MB {ratio:>6.2f} {result['list_ms']:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
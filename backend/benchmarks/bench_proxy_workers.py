@@ -0,0 +1,155 @@
+"""
+Measure proxy throughput as the number of mitmdump workers grows.
+
+Starts a minimal keep-alive HTTP origin, then for each worker count runs the
+proxy through ``ProxyServer`` (workers share the port with SO_REUSEPORT) and
+drives it with concurrent keep-alive clients spread over several load
+processes. Reports requests/sec and the speed-up over the first count. Flows
+are captured into the regular flow store as usual and deleted again afterwards.
+
+    cd backend && python benchmarks/bench_proxy_workers.py --workers 1 2 4 --seconds 10
+
+Scaling is bounded by free cores: load processes and the origin need CPU too.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from api.config import settings  # noqa: E402
+from api.flow_store import get_flow_store  # noqa: E402
+from api.id_allocator import peek_next_id  # noqa: E402
+from api.proxy_server import ProxyServer  # noqa: E402
+
+RESPONSE = b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 12\r\n\r\nhello, proxy"
+
+
+async def _origin(port, ready):
+    async def handle(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                if not head:
+                    break
+                writer.write(RESPONSE)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", port, backlog=1024)
+    ready.set()
+    async with server:
+        await server.serve_forever()
+
+
+def run_origin(port, ready):
+    asyncio.run(_origin(port, ready))
+
+
+async def _client(proxy_port, origin_port, deadline, counts):
+    reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+    request = (
+        f"GET http://127.0.0.1:{origin_port}/bench HTTP/1.1\r\n"
+        f"Host: 127.0.0.1:{origin_port}\r\n\r\n"
+    ).encode()
+    try:
+        while time.monotonic() < deadline:
+            writer.write(request)
+            await reader.readuntil(b"\r\n\r\n")
+            await reader.readexactly(len(RESPONSE) - RESPONSE.index(b"\r\n\r\n") - 4)
+            counts[0] += 1
+    except (asyncio.IncompleteReadError, ConnectionError):
+        counts[1] += 1
+    finally:
+        writer.close()
+
+
+def run_load(proxy_port, origin_port, clients, seconds, results):
+    async def main():
+        counts = [0, 0]
+        deadline = time.monotonic() + seconds
+        await asyncio.gather(*[_client(proxy_port, origin_port, deadline, counts) for _ in range(clients)])
+        return counts
+
+    results.put(asyncio.run(main()))
+
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Proxy did not start listening on {port}")
+
+
+def measure(workers, args):
+    settings.proxy_workers = workers
+    settings.proxy_port = args.proxy_port
+    settings.proxy_host = "127.0.0.1"
+    proxy = ProxyServer()
+    proxy.start()
+    try:
+        wait_for_port(args.proxy_port)
+        # Give every worker time to bind before load starts
+        time.sleep(1.0 + 0.5 * workers)
+        results = multiprocessing.Queue()
+        loaders = [
+            multiprocessing.Process(
+                target=run_load,
+                args=(args.proxy_port, args.origin_port, args.clients // args.load_processes, args.seconds, results)
+            )
+            for _ in range(args.load_processes)
+        ]
+        for loader in loaders:
+            loader.start()
+        counts = [results.get() for _ in loaders]
+        for loader in loaders:
+            loader.join()
+    finally:
+        proxy.stop()
+    return sum(c[0] for c in counts) / args.seconds, sum(c[1] for c in counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--load-processes", type=int, default=max(1, multiprocessing.cpu_count() // 4))
+    parser.add_argument("--proxy-port", type=int, default=18180)
+    parser.add_argument("--origin-port", type=int, default=18181)
+    args = parser.parse_args()
+
+    ready = multiprocessing.Event()
+    origin = multiprocessing.Process(target=run_origin, args=(args.origin_port, ready), daemon=True)
+    origin.start()
+    ready.wait(10)
+
+    store = get_flow_store()
+    first_id = peek_next_id(store._connection())
+    print(f"{'workers':>8} {'req/s':>10} {'speed-up':>9} {'errors':>7}")
+    baseline = None
+    try:
+        for workers in args.workers:
+            rate, errors = measure(workers, args)
+            baseline = baseline or rate
+            print(f"{workers:>8} {rate:>10.0f} {rate / baseline:>8.2f}x {errors:>7}")
+    finally:
+        origin.terminate()
+        deleted = store.tombstone(ranges=[(first_id, peek_next_id(store._connection()) - 1)])
+        print(f"Deleted {len(deleted)} benchmark flows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Content-addressed storage for request and response bodies.
+
+Each distinct body is written once to ``<dir>/<hash[:2]>/<hash>``, where the
+hash is the SHA-256 of its uncompressed bytes. Reference counting lives in the
+flow store's ``blobs`` table so it is updated in the same transaction as the
+flows that point at a blob; this module only deals with the files.
+
+Blobs may be compressed with gzip or zstd. The codec is chosen per blob at
+write time and recorded by the caller, so changing the setting never breaks
+blobs written earlier. Bodies below ``min_size``, or that do not shrink, are
+stored as-is.
+
+Files can't roll back with the database, so ``BlobChanges`` records what one
+write transaction does to them: new blobs are deleted if it rolls back, and
+removed blobs are only moved aside until it commits.
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import BinaryIO, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard ships with mitmproxy
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODECS = ("none", "gzip", "zstd")
+
+# Bodies smaller than this are not worth compressing
+DEFAULT_MIN_SIZE = 512
+
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+
+
+def compress(codec: str, data: bytes, level: Optional[int] = None) -> bytes:
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=level or DEFAULT_LEVELS["gzip"], mtime=0)
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level or DEFAULT_LEVELS["zstd"]).compress(data)
+    return data
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == "gzip":
+        return gzip.decompress(data)
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+class BlobStore:
+    def __init__(self, directory, codec: str = "none", level: Optional[int] = None,
+                 min_size: int = DEFAULT_MIN_SIZE):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown body compression codec: {codec}")
+        if codec == "zstd" and zstandard is None:
+            logger.warning("zstandard is not installed, falling back to gzip body compression")
+            codec = "gzip"
+        self.directory = Path(directory)
+        self.codec = codec
+        self.level = level
+        self.min_size = min_size
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def path(self, digest: str) -> Path:
+        return self.directory / digest[:2] / digest
+
+    def write(self, digest: str, data: bytes) -> Tuple[str, int]:
+        """Write a blob atomically; readers never see a partial file.
+
+        Returns the codec actually used and the number of bytes on disk.
+        """
+        codec = "none"
+        stored = data
+        if self.codec != "none" and len(data) >= self.min_size:
+            compressed = compress(self.codec, data, self.level)
+            if len(compressed) < len(data):
+                codec, stored = self.codec, compressed
+
+        path = self.path(digest)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_name(f"{digest}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(stored)
+        os.replace(tmp, path)
+        return codec, len(stored)
+
+    def adopt(self, digest: str, source) -> Tuple[str, int]:
+        """Move an already written file (e.g. a capture spill file) into place as-is."""
+        path = self.path(digest)
+        path.parent.mkdir(exist_ok=True)
+        os.replace(source, path)
+        return "none", path.stat().st_size
+
+    def read(self, digest: str, codec: str = "none", limit: Optional[int] = None) -> Optional[bytes]:
+        """Read a blob, decompressing it if it was stored compressed.
+
+        With ``limit`` only that many leading bytes are read and decompressed.
+        """
+        try:
+            if limit is not None:
+                with self.open(digest, codec) as f:
+                    return f.read(limit)
+            with open(self.path(digest), "rb") as f:
+                return decompress(codec, f.read())
+        except FileNotFoundError:
+            logger.warning(f"Blob {digest} is referenced but missing")
+            return None
+
+    def open(self, digest: str, codec: str = "none") -> BinaryIO:
+        """Open a blob for streaming reads, decompressing on the fly."""
+        path = self.path(digest)
+        if codec == "gzip":
+            return gzip.open(path, "rb")
+        f = open(path, "rb")
+        if codec == "zstd":
+            return zstandard.ZstdDecompressor().stream_reader(f, closefd=True)
+        return f
+
+    def remove(self, digest: str):
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        """Remove every blob file."""
+        for child in self.directory.iterdir():
+            if child.is_dir():
+                shutil.rmtree(child, ignore_errors=True)
+            else:
+                child.unlink(missing_ok=True)
+
+    def disk_usage(self) -> int:
+        return sum(p.stat().st_size for p in self.directory.glob("*/*") if p.is_file())
+
+
+class BlobChanges:
+    """Blob files written and removed during one write transaction.
+
+    ``undo`` and ``remove`` run while the transaction still holds the write
+    lock, so no other writer can be storing the same blob meanwhile.
+    """
+
+    def __init__(self, blobs: BlobStore):
+        self.blobs = blobs
+        # ("wrote", digest) or ("moved", path, aside), in the order they happened
+        self.steps: List[tuple] = []
+
+    def wrote(self, digest: str):
+        self.steps.append(("wrote", digest))
+
+    def _move_aside(self, path: Path):
+        aside = path.with_name(f"{path.name}.{uuid.uuid4().hex}.removed")
+        try:
+            os.replace(path, aside)
+        except FileNotFoundError:
+            return
+        self.steps.append(("moved", path, aside))
+
+    def remove(self, digest: str):
+        """Remove a blob once the transaction commits."""
+        self._move_aside(self.blobs.path(digest))
+
+    def clear(self):
+        """Remove every blob file once the transaction commits."""
+        for child in list(self.blobs.directory.iterdir()):
+            self._move_aside(child)
+
+    def undo(self):
+        """Roll back: delete blobs written since and put removed ones back, newest first."""
+        for step in reversed(self.steps):
+            if step[0] == "wrote":
+                self.blobs.remove(step[1])
+                continue
+            _, path, aside = step
+            if path.is_dir():
+                # Recreated by a write after a clear; its blobs were just deleted
+                shutil.rmtree(path, ignore_errors=True)
+            os.replace(aside, path)
+
+    def commit(self):
+        """Delete what the committed transaction removed."""
+        for step in self.steps:
+            if step[0] != "moved":
+                continue
+            aside = step[2]
+            if aside.is_dir():
+                shutil.rmtree(aside, ignore_errors=True)
+            else:
+                aside.unlink(missing_ok=True)
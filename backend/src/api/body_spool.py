@@ -0,0 +1,162 @@
+"""
+Spill-to-disk capture of streamed message bodies.
+
+For bodies that are large or of unknown length, the addon sets a ``BodySpool``
+as mitmproxy's ``flow.request.stream`` / ``flow.response.stream`` callable.
+Every chunk is passed through to the peer unchanged while it is hashed and
+counted. Chunks are kept in memory only up to ``threshold`` bytes; past that
+they go to a spill file, which the flow store later adopts as the body's blob.
+Memory per flow therefore never exceeds ``threshold``, whatever the body size.
+
+Chunks are the bytes on the wire, so a spilled body may still be
+content-encoded. ``decoded`` undoes the encoding file to file, leaving a spool
+that holds (and hashes) the same bytes an in-memory capture would.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import zlib
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import brotli
+import zstandard
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def _decompressor(content_encoding: str, raw_deflate: bool = False) -> Tuple[Callable, Callable, Callable]:
+    """Streaming decompressor for one Content-Encoding, as (decompress, flush, finished)."""
+    name = content_encoding.strip().lower()
+    if name == "br":
+        decompressor = brotli.Decompressor()
+        return decompressor.process, lambda: b"", decompressor.is_finished
+    if name in ("gzip", "x-gzip"):
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif name == "deflate":
+        # Some servers send raw DEFLATE data without the zlib wrapper
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS if raw_deflate else zlib.MAX_WBITS)
+    elif name == "zstd":
+        decompressor = zstandard.ZstdDecompressor().decompressobj(read_across_frames=True)
+        return decompressor.decompress, decompressor.flush, lambda: True
+    else:
+        raise ValueError(f"Unsupported content encoding: {content_encoding}")
+    return decompressor.decompress, decompressor.flush, lambda: decompressor.eof
+
+
+def decode_stream(content_encoding: str, chunks: Iterable[bytes], raw_deflate: bool = False) -> Iterator[bytes]:
+    """Decode ``chunks`` incrementally; raises ValueError on corrupt or truncated data."""
+    decompress, flush, finished = _decompressor(content_encoding, raw_deflate)
+    try:
+        for chunk in chunks:
+            data = decompress(chunk)
+            if data:
+                yield data
+        data = flush()
+        if data:
+            yield data
+    except (zlib.error, brotli.error, zstandard.ZstdError) as e:
+        raise ValueError(f"Invalid {content_encoding} data: {e}")
+    if not finished():
+        raise ValueError(f"Truncated {content_encoding} data")
+
+
+class BodySpool:
+    def __init__(self, directory, threshold: int):
+        self.directory = Path(directory)
+        self.threshold = threshold
+        self.size = 0
+        self.complete = False
+        self.path: Optional[Path] = None
+        self._hash = hashlib.sha256()
+        self._chunks: List[bytes] = []
+        self._file = None
+
+    def __call__(self, chunk: bytes) -> bytes:
+        """mitmproxy stream callable; an empty chunk marks the end of the body."""
+        if chunk:
+            self.write(chunk)
+        else:
+            self.close()
+        return chunk
+
+    def write(self, chunk: bytes):
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        if self._file is not None:
+            self._file.write(chunk)
+            return
+        self._chunks.append(chunk)
+        if self.size > self.threshold:
+            self._spill()
+
+    def _spill(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, name = tempfile.mkstemp(dir=self.directory, suffix=".spool")
+        self._file = os.fdopen(fd, "wb")
+        self.path = Path(name)
+        for chunk in self._chunks:
+            self._file.write(chunk)
+        self._chunks = []
+        logger.debug(f"Body exceeded {self.threshold} bytes, spilling to {self.path}")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.complete = True
+
+    @property
+    def spilled(self) -> bool:
+        return self.path is not None
+
+    @property
+    def digest(self) -> str:
+        return self._hash.hexdigest()
+
+    def _read_chunks(self) -> Iterator[bytes]:
+        with open(self.path, "rb") as f:
+            while True:
+                chunk = f.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+    def decoded(self, content_encoding: str) -> "BodySpool":
+        """A spool holding this spilled body with ``content_encoding`` undone.
+
+        The data is streamed from the spill file, so it never has to fit in
+        memory. This spool is discarded; if the encoding is unsupported or
+        the data doesn't decode, it is returned unchanged instead.
+        """
+        attempts = [False, True] if content_encoding.strip().lower() == "deflate" else [False]
+        for raw_deflate in attempts:
+            decoded = BodySpool(self.directory, self.threshold)
+            try:
+                for chunk in decode_stream(content_encoding, self._read_chunks(), raw_deflate):
+                    decoded.write(chunk)
+            except ValueError as e:
+                decoded.discard()
+                error = e
+                continue
+            decoded.close()
+            self.discard()
+            return decoded
+        logger.debug(f"Could not decode spilled body: {error}, storing raw bytes")
+        return self
+
+    def getvalue(self) -> bytes:
+        """The body, if it never spilled to disk."""
+        return b"".join(self._chunks)
+
+    def discard(self):
+        """Drop the captured body, e.g. when the flow errors or is not stored."""
+        self.close()
+        self._chunks = []
+        if self.path is not None:
+            self.path.unlink(missing_ok=True)
+            self.path = None
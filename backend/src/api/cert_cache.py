@@ -0,0 +1,253 @@
+"""
+Leaf certificates that outlive the proxy process.
+
+mitmproxy signs a certificate for each intercepted host on its first TLS
+handshake and keeps it only in memory, so every restart (and every new worker)
+pays for signing again. ``LeafCertCache`` wraps the running ``CertStore`` so
+generated certificates are also written under ``api/mitmproxy/leaf-certs`` and
+loaded from there on the next first handshake.
+
+mitmproxy issues every leaf for the CA's own key pair, so only the certificate
+is stored; the private key is always the CA's. Entries live in a directory per
+CA fingerprint, so a regenerated CA never serves leaves signed by the old one.
+The cache keeps at most ``max_entries`` files, evicting the least recently
+used, and ``prewarm`` generates certificates for a list of hosts ahead of their
+first connection.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import socket
+import ssl
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from cryptography import x509
+from mitmproxy.addons.tlsconfig import _ip_or_dns_name
+from mitmproxy.certs import Cert, CertStore, CertStoreEntry, _fix_legacy_sans, dummy_cert
+
+from api.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CERT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mitmproxy", "leaf-certs")
+
+# Cached certificates this close to expiry are signed afresh
+RENEW_BEFORE = timedelta(days=1)
+# Eviction trims the cache to this fraction of its limit, so it doesn't run on every write
+EVICT_TO = 0.9
+# Connect timeout when looking up a host's real certificate to pre-warm
+PREWARM_TIMEOUT_SECONDS = 5.0
+
+
+def cache_key(commonname: Optional[str], sans: x509.GeneralNames, organization: Optional[str]) -> str:
+    names = "\n".join(f"{type(name).__name__}:{name.value}" for name in sans)
+    return hashlib.sha256(f"{commonname}\n{organization}\n{names}".encode()).hexdigest()
+
+
+def leaf_names(host: str, upstream: Optional[Cert] = None) -> Tuple[Optional[str], List[x509.GeneralName], Optional[str]]:
+    """Common name, SANs and organization mitmproxy asks for when a client connects to ``host``.
+
+    Mirrors ``TlsConfig.get_cert`` for a client sending ``host`` as SNI, so the
+    pre-warmed entry has the key the real handshake looks up.
+    """
+    altnames: List[x509.GeneralName] = []
+    organization = None
+    if upstream is not None:
+        if upstream.cn:
+            altnames.append(_ip_or_dns_name(upstream.cn))
+        altnames.extend(upstream.altnames)
+        organization = upstream.organization
+    # Once as the SNI, once as the server address
+    altnames.extend([_ip_or_dns_name(host), _ip_or_dns_name(host)])
+    altnames = list(dict.fromkeys(altnames))
+    return next((str(name.value) for name in altnames), None), altnames, organization
+
+
+def fetch_upstream_cert(host: str, port: int = 443) -> Cert:
+    """The certificate ``host`` presents, as mitmproxy sees it with ``upstream_cert`` on."""
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    with socket.create_connection((host, port), timeout=PREWARM_TIMEOUT_SECONDS) as sock:
+        with context.wrap_socket(sock, server_hostname=host) as tls:
+            der = tls.getpeercert(binary_form=True)
+    return Cert(x509.load_der_x509_certificate(der))
+
+
+class LeafCertCache:
+    def __init__(self, directory: str = CERT_CACHE_DIR, max_entries: int = 2000):
+        self.root = directory
+        self.max_entries = max_entries
+        self.store: Optional[CertStore] = None
+        self.directory: Optional[str] = None
+        self._entries = 0
+        self._lock = threading.Lock()
+
+    def install(self, store: CertStore):
+        """Route ``store``'s certificate lookups through the cache; a no-op if already done."""
+        if store is self.store:
+            return
+        self.store = store
+        self.directory = os.path.join(self.root, store.default_ca.fingerprint().hex()[:16])
+        os.makedirs(self.directory, exist_ok=True)
+        # Leaves signed by any other CA are useless now
+        for entry in os.scandir(self.root):
+            if entry.is_dir() and entry.path != self.directory:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        with self._lock:
+            self._entries = sum(1 for name in os.listdir(self.directory) if name.endswith(".pem"))
+        store.get_cert = self._wrap(store.get_cert)
+        logger.info(f"Leaf certificate cache at {self.directory} ({self._entries} cached)")
+
+    def _wrap(self, get_cert):
+        def get_cached_cert(commonname, sans, organization=None) -> CertStoreEntry:
+            sans = _fix_legacy_sans(sans)
+            if self._in_memory(commonname, sans):
+                return get_cert(commonname, sans, organization)
+            path = self._path(commonname, sans, organization)
+            cert = self._load(path)
+            if cert is None:
+                entry = get_cert(commonname, sans, organization)
+                metrics.inc("fart_leaf_certs_generated_total")
+                self._save(path, entry.cert)
+                return entry
+            store = self.store
+            entry = CertStoreEntry(
+                cert=cert,
+                privatekey=store.default_privatekey,
+                chain_file=store.default_chain_file,
+                chain_certs=store.default_chain_certs,
+            )
+            store.certs[(commonname, sans)] = entry
+            store.expire(entry)
+            metrics.inc("fart_leaf_certs_loaded_total")
+            return entry
+
+        return get_cached_cert
+
+    def _in_memory(self, commonname, sans) -> bool:
+        """Whether ``CertStore.get_cert`` would find a certificate without signing one."""
+        keys = list(CertStore.asterisk_forms(commonname)) if commonname else []
+        for name in sans:
+            keys.extend(CertStore.asterisk_forms(name))
+        keys.extend(["*", (commonname, sans)])
+        return any(key in self.store.certs for key in keys)
+
+    def _path(self, commonname, sans, organization) -> str:
+        return os.path.join(self.directory, f"{cache_key(commonname, sans, organization)}.pem")
+
+    def _load(self, path: str) -> Optional[Cert]:
+        try:
+            with open(path, "rb") as f:
+                cert = Cert.from_pem(f.read())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cached certificate {path}: {e}")
+            self._remove(path)
+            return None
+        if cert.notafter - datetime.now(timezone.utc) < RENEW_BEFORE:
+            self._remove(path)
+            return None
+        # Recently used entries are the last to be evicted
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return cert
+
+    def _save(self, path: str, cert: Cert):
+        try:
+            temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp, "wb") as f:
+                f.write(cert.to_pem())
+            # Atomic, so sibling workers never read a partial file
+            os.replace(temp, path)
+        except OSError as e:
+            logger.error(f"Error caching leaf certificate: {e}", exc_info=True)
+            return
+        with self._lock:
+            self._entries += 1
+            full = self._entries > self.max_entries
+        if full:
+            self.evict()
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        """Delete the least recently used certificates down to ``EVICT_TO`` of the limit."""
+        with self._lock:
+            try:
+                entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".pem")]
+                entries.sort(key=lambda entry: entry.stat().st_mtime)
+            except OSError as e:
+                logger.error(f"Error listing leaf certificate cache: {e}", exc_info=True)
+                return
+            excess = len(entries) - int(self.max_entries * EVICT_TO)
+            for entry in entries[:max(excess, 0)]:
+                self._remove(entry.path)
+            self._entries = len(entries) - max(excess, 0)
+        if excess > 0:
+            logger.debug(f"Evicted {excess} leaf certificates from the cache")
+
+    # ------------------------------------------------------------------
+    # Pre-warming
+    # ------------------------------------------------------------------
+
+    def prewarm(self, hosts: Iterable[str], upstream_cert: bool = True) -> int:
+        """Sign and cache certificates for ``hosts`` (``host`` or ``host:port``) not cached yet.
+
+        With ``upstream_cert`` on, mitmproxy copies names from the server's real
+        certificate, so each host is contacted once to learn them. Only the disk
+        cache is written; the running store picks entries up on first use.
+        """
+        store, warmed = self.store, 0
+        for spec in hosts:
+            host, port = spec.strip(), "443"
+            if host.count(":") == 1:
+                host, port = host.split(":")
+            if not host:
+                continue
+            upstream = None
+            if upstream_cert:
+                try:
+                    upstream = fetch_upstream_cert(host, int(port))
+                except (OSError, ValueError) as e:
+                    logger.debug(f"Could not fetch certificate of {host}, pre-warming by name only: {e}")
+            commonname, altnames, organization = leaf_names(host, upstream)
+            sans = _fix_legacy_sans(altnames)
+            path = self._path(commonname, sans, organization)
+            if os.path.exists(path):
+                continue
+            try:
+                cert = dummy_cert(store.default_privatekey, store.default_ca._cert, commonname, sans, organization)
+            except Exception as e:
+                logger.error(f"Error pre-warming certificate for {host}: {e}", exc_info=True)
+                continue
+            metrics.inc("fart_leaf_certs_generated_total")
+            self._save(path, cert)
+            warmed += 1
+        return warmed
+
+    def start_prewarm(self, hosts: List[str], upstream_cert: bool = True) -> Optional[threading.Thread]:
+        if not hosts or self.store is None:
+            return None
+
+        def run():
+            try:
+                warmed = self.prewarm(hosts, upstream_cert)
+                logger.info(f"Pre-warmed {warmed} of {len(hosts)} leaf certificates")
+            except Exception as e:
+                logger.error(f"Error pre-warming leaf certificates: {e}", exc_info=True)
+
+        thread = threading.Thread(target=run, name="cert-prewarm", daemon=True)
+        thread.start()
+        return thread
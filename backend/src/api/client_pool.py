@@ -0,0 +1,149 @@
+"""
+Long-lived HTTP clients for the repeater.
+
+Creating an ``httpx.AsyncClient`` per send made every repeat pay DNS, TCP and
+TLS setup again. ``ClientPool`` keeps one client per connection configuration
+(TLS verification and proxy) for the life of the app, so repeats to the same
+origin reuse kept-alive connections, or share one multiplexed HTTP/2
+connection when ``http2`` is on. Redirect following is a per-request option in
+httpx, so it doesn't split the pool.
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import httpx
+
+from api.config import settings
+from api.metrics import metrics
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:  # pragma: no cover - h2 ships with mitmproxy
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+REQUEST_TIMEOUT_SECONDS = 30.0
+
+# httpcore trace events marking a new connection and a request sent on one
+CONNECT_EVENT = "connection.connect_tcp.complete"
+REQUEST_EVENTS = ("http11.send_request_headers.complete", "http2.send_request_headers.complete")
+
+ClientKey = Tuple[bool, Optional[str]]
+
+
+def upstream_proxy_url() -> Optional[str]:
+    """The configured upstream proxy, with credentials, or None when it's off."""
+    if not (settings.upstream_proxy_enabled and settings.upstream_proxy_host and settings.upstream_proxy_port):
+        return None
+    credentials = ""
+    if settings.upstream_proxy_auth and settings.upstream_proxy_username and settings.upstream_proxy_password:
+        credentials = f"{quote(settings.upstream_proxy_username, safe='')}:{quote(settings.upstream_proxy_password, safe='')}@"
+    return f"http://{credentials}{settings.upstream_proxy_host}:{settings.upstream_proxy_port}"
+
+
+class ClientPool:
+    def __init__(self, max_connections: int = 100, max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 30.0, http2: bool = False,
+                 timeout: float = REQUEST_TIMEOUT_SECONDS):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        if http2 and not HTTP2_AVAILABLE:
+            logger.warning("HTTP/2 requested for the repeater but the h2 package is missing, using HTTP/1.1")
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.timeout = timeout
+        self._clients: Dict[ClientKey, httpx.AsyncClient] = {}
+        self._transports: Dict[ClientKey, httpx.AsyncHTTPTransport] = {}
+        self._stats: Dict[ClientKey, Dict[str, int]] = {}
+        self.closed = False
+
+    @classmethod
+    def from_settings(cls) -> "ClientPool":
+        return cls(
+            max_connections=settings.repeater_max_connections,
+            max_keepalive_connections=settings.repeater_max_keepalive_connections,
+            keepalive_expiry=settings.repeater_keepalive_expiry,
+            http2=settings.repeater_http2
+        )
+
+    def client(self, verify: bool = False, proxy: Optional[str] = None) -> httpx.AsyncClient:
+        """The shared client for this configuration, created on first use."""
+        if self.closed:
+            raise RuntimeError("Repeater client pool is closed")
+        key = (verify, proxy)
+        client = self._clients.get(key)
+        if client is None:
+            transport = httpx.AsyncHTTPTransport(
+                verify=verify, http2=self.http2, limits=self.limits, proxy=proxy, retries=0
+            )
+            client = httpx.AsyncClient(verify=verify, timeout=self.timeout, transport=transport)
+            self._clients[key], self._transports[key] = client, transport
+            self._stats[key] = {"requests": 0, "connections_opened": 0}
+            logger.debug(f"Created repeater client (verify={verify}, proxy={'yes' if proxy else 'no'})")
+        return client
+
+    async def request(self, method: str, url: str, *, verify: bool = False, proxy: Optional[str] = None,
+                      follow_redirects: bool = False, **kwargs) -> httpx.Response:
+        """Send a request on the pooled client for ``verify`` and ``proxy``, reading the whole response."""
+        client = self.client(verify, proxy)
+        stats = self._stats[(verify, proxy)]
+
+        async def trace(event: str, info: Dict[str, Any]):
+            # Counted per hop, so followed redirects are included
+            if event == CONNECT_EVENT:
+                stats["connections_opened"] += 1
+                metrics.inc("fart_repeater_connections_opened_total")
+            elif event in REQUEST_EVENTS:
+                stats["requests"] += 1
+
+        return await client.request(
+            method, url, follow_redirects=follow_redirects, extensions={"trace": trace}, **kwargs
+        )
+
+    def _connection_counts(self, key: ClientKey) -> Tuple[Optional[int], Optional[int]]:
+        """Open and idle connections in a client's pool, or None if httpx's internals have changed."""
+        try:
+            connections = list(self._transports[key]._pool.connections)
+            return len(connections), sum(1 for connection in connections if connection.is_idle())
+        except AttributeError:
+            return None, None
+
+    def stats(self) -> Dict[str, Any]:
+        clients: List[Dict[str, Any]] = []
+        for (verify, proxy), stats in self._stats.items():
+            open_connections, idle_connections = self._connection_counts((verify, proxy))
+            clients.append({
+                "verify": verify,
+                # Never echo upstream credentials
+                "proxy": str(httpx.URL(proxy).copy_with(username=None, password=None)) if proxy else None,
+                "requests": stats["requests"],
+                "connections_opened": stats["connections_opened"],
+                "reused": max(stats["requests"] - stats["connections_opened"], 0),
+                "open_connections": open_connections,
+                "idle_connections": idle_connections,
+            })
+        return {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+            "clients": clients,
+        }
+
+    async def close(self):
+        """Close every client and its connections; further requests fail."""
+        self.closed = True
+        clients, self._clients = list(self._clients.values()), {}
+        self._transports, self._stats = {}, {}
+        results = await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Error closing repeater client: {result}")
+        logger.info(f"Closed {len(clients)} repeater client(s)")
@@ -0,0 +1,131 @@
+"""
+Background reclamation of deleted flows.
+
+Deletes only move flow rows to the store's ``tombstones`` table. The compactor
+drains that table in batches of ``batch_size``: each batch is one short write
+transaction that drops the flows' search index rows and their blob references,
+removing blob files no remaining flow points at, so the capture writer is never
+held up for long. After a pass, free database pages are handed back to the
+filesystem. A pass starts when ``notify`` is called after a delete, and every
+``interval`` seconds in case a delete came from elsewhere.
+
+Clearing the history only raises the store's visibility floor; the compactor
+then tombstones the hidden flows batch by batch before compacting them.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from api.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+COMPACT_BATCH_SIZE = 500
+COMPACT_INTERVAL_SECONDS = 30.0
+
+
+class Compactor:
+    def __init__(self, store, batch_size: int = COMPACT_BATCH_SIZE,
+                 interval: float = COMPACT_INTERVAL_SECONDS):
+        self.store = store
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._status: Dict[str, Any] = {
+            "running": False,
+            "pass_total": 0,
+            "pass_done": 0,
+            "flows_compacted": 0,
+            "blobs_released": 0,
+            "bytes_reclaimed": 0,
+            "last_pass": None,
+        }
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="flow-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        if not self._thread:
+            return
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning("Compactor did not stop in time")
+        self._thread = None
+
+    def notify(self):
+        """Start a pass soon, e.g. after flows were deleted."""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Compaction failed: {e}", exc_info=True)
+
+    def run_once(self) -> Dict[str, Any]:
+        """Compact every pending tombstone and cleared flow, then reclaim free space.
+
+        Returns what this pass freed.
+        """
+        freed = {"flows": 0, "blobs": 0, "bytes": 0}
+        pending = self.store.pending_tombstones()
+        if not pending:
+            return freed
+        started = time.perf_counter()
+        self._update(running=True, pass_total=pending, pass_done=0)
+        try:
+            while not self._stopping.is_set():
+                with metrics.time("compact_batch"):
+                    purged = self.store.purge_cleared(self.batch_size)
+                    batch = self.store.compact(self.batch_size)
+                if not purged and not batch["flows"]:
+                    break
+                for key in freed:
+                    freed[key] += batch[key]
+                self._update(pass_done=freed["flows"])
+            with metrics.time("reclaim_space"):
+                freed["bytes"] += self.store.reclaim_space()
+        finally:
+            with self._lock:
+                self._status["running"] = False
+                self._status["flows_compacted"] += freed["flows"]
+                self._status["blobs_released"] += freed["blobs"]
+                self._status["bytes_reclaimed"] += freed["bytes"]
+                self._status["last_pass"] = {
+                    **freed,
+                    "seconds": round(time.perf_counter() - started, 3),
+                    "finished": time.time(),
+                }
+            metrics.inc("fart_flows_compacted_total", freed["flows"])
+            metrics.inc("fart_bytes_reclaimed_total", freed["bytes"])
+        logger.info(
+            f"Compacted {freed['flows']} deleted or cleared flows, released {freed['blobs']} blobs "
+            f"and reclaimed {freed['bytes']} bytes"
+        )
+        return freed
+
+    def _update(self, **values):
+        with self._lock:
+            self._status.update(values)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            status = dict(self._status)
+        status["pending"] = self.store.pending_tombstones()
+        return status
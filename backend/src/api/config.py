@@ -16,6 +16,10 @@ class Settings(BaseSettings):
     # Proxy Settings
     proxy_host: str = "0.0.0.0"  # Changed from 127.0.0.1 to allow external connections
     proxy_port: int = 8080
+    # Run mitmproxy inside the API process instead of as a mitmdump subprocess
+    proxy_embedded: bool = False
+    # mitmdump processes sharing the proxy port (SO_REUSEPORT); ignored when embedded
+    proxy_workers: int = 1
     
     # Upstream Proxy Settings
     upstream_proxy_enabled: bool = False
@@ -47,6 +51,46 @@ class Settings(BaseSettings):
     # Storage Settings
     session_dir: str = "sessions"
     
+    # Capture scope (see api/scope.py for the rule syntax)
+    enable_filtering: bool = False
+    filter_rules: List[str] = []
+    
+    # Capture Settings (write-behind queue in the proxy addon)
+    capture_batch_size: int = 100
+    capture_flush_interval_ms: int = 50
+    capture_queue_size: int = 10000
+    capture_backpressure: str = "block"  # block, drop_bodies or drop_flows
+    
+    # Body Storage Settings
+    body_compression: str = "zstd"  # none, gzip or zstd
+    body_compression_level: Optional[int] = None  # codec default when unset
+    body_compression_min_size: int = 512  # smaller bodies are stored uncompressed
+    body_preview_size: int = 1024 * 1024  # larger bodies are listed truncated (0 = never)
+    
+    # Bodies larger than this (or of unknown length) are streamed through a spill file
+    capture_stream_threshold: int = 4 * 1024 * 1024  # 0 disables streaming capture
+    
+    # Leading bytes of each text body added to the full-text search index (0 = URLs and headers only)
+    search_body_limit: int = 256 * 1024
+    
+    # Repeater HTTP clients, kept open for the app's lifetime
+    repeater_max_connections: int = 100
+    repeater_max_keepalive_connections: int = 20
+    repeater_keepalive_expiry: float = 30.0  # seconds an idle connection stays open
+    repeater_http2: bool = False  # negotiate HTTP/2 and multiplex repeats to an origin over one connection
+    
+    # Directory file payloads for the intruder are read from (defaults to sessions/wordlists)
+    intruder_wordlist_dir: str = ""
+    
+    # Leaf certificates kept on disk across proxy restarts (0 disables the cache)
+    cert_cache_size: int = 2000
+    # Hosts (host or host:port) whose leaf certificates are generated when the proxy starts
+    cert_prewarm_hosts: List[str] = []
+    
+    # Local channel between the proxy addon and the API (defaults to sessions/proxy.sock)
+    ipc_socket_path: str = ""
+    metrics_report_interval_ms: int = 1000
+    
     # Use ConfigDict instead of class Config
     model_config = ConfigDict(
         env_prefix="FART_",
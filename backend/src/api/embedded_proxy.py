@@ -0,0 +1,149 @@
+"""
+mitmproxy running inside the API process.
+
+Instead of spawning ``mitmdump``, ``EmbeddedProxy`` runs a ``DumpMaster`` on a
+dedicated thread with its own event loop, so proxy hooks never compete with API
+requests for the API's loop. The addon shares the API's flow store instance and
+talks to the API through a ``LocalIpcClient``: committed flows reach the live
+view, and scope, clear and option changes reach the addon, exactly as over the
+socket but without leaving the process. Starting and stopping take as long as
+binding and closing the listeners.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Optional
+
+from api import state
+from api.config import settings
+from api.ipc import LocalIpcClient
+from api.proxy_server import proxy_options
+
+logger = logging.getLogger(__name__)
+
+# How long start and stop wait for the proxy thread
+START_TIMEOUT_SECONDS = 10.0
+STOP_TIMEOUT_SECONDS = 10.0
+
+
+class _Ready:
+    """Signals once the master's servers are up (or it gave up starting them)."""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def running(self):
+        self.event.set()
+
+
+class EmbeddedProxy:
+    def __init__(self):
+        self.master = None
+        self.addon = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._started_at = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the proxy and wait until it is listening."""
+        if self.running:
+            return
+        if state.ipc_server is None:
+            raise RuntimeError("The embedded proxy needs the API's IPC server")
+        # The addon module is otherwise only loaded by mitmdump, as a script
+        from api.proxy_addon import ProxyAddon
+
+        self.addon = ProxyAddon(channel=LocalIpcClient(state.ipc_server))
+        self._ready.clear()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="embedded-proxy", daemon=True)
+        self._thread.start()
+        if not self._ready.wait(START_TIMEOUT_SECONDS) or not self.running:
+            error = self._error or TimeoutError("Embedded proxy did not start in time")
+            self.stop()
+            raise RuntimeError(f"Failed to start embedded proxy: {error}")
+        state.proxy_master, state.proxy_loop, state.proxy_thread = self.master, self.loop, self._thread
+        self._started_at = time.time()
+        logger.info(f"Embedded proxy listening on {settings.proxy_host}:{settings.proxy_port}")
+
+    def _run(self):
+        # mitmproxy's master and its default addons are only loaded in this mode
+        from mitmproxy.options import Options
+        from mitmproxy.tools.dump import DumpMaster
+
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        master = None
+        try:
+            master = DumpMaster(Options(), loop=self.loop, with_termlog=False, with_dumper=False)
+            master.options.update(listen_host=settings.proxy_host, ssl_insecure=True, **proxy_options())
+            master.addons.add(self.addon, _Ready(self._ready))
+            self.master = master
+            self.loop.run_until_complete(master.run())
+        except SystemExit:
+            # mitmproxy's error check exits when startup logged an error, e.g. a port in use
+            self._error = RuntimeError("mitmproxy reported an error during startup (see log)")
+        except Exception as e:
+            self._error = e
+            logger.error(f"Embedded proxy stopped with an error: {e}", exc_info=True)
+        finally:
+            if master is not None:
+                self._release(master)
+            self._ready.set()
+            self.loop.close()
+
+    def _release(self, master):
+        """Free what mitmdump leaves to process exit: the listening sockets and the log handler."""
+        proxyserver = master.addons.get("proxyserver")
+        if proxyserver is not None:
+            try:
+                self.loop.run_until_complete(proxyserver.servers.update([]))
+            except Exception as e:
+                logger.error(f"Error closing embedded proxy listeners: {e}", exc_info=True)
+        # Master installs a handler on the root logger that posts every record to its event loop,
+        # and never removes it; left in place, each log call after the loop closes would fail.
+        # There is no public handle for it, so tolerate releases that rename or drop the attribute.
+        legacy_log_events = getattr(master, "_legacy_log_events", None)
+        if legacy_log_events is not None:
+            try:
+                legacy_log_events.uninstall()
+            except Exception as e:
+                logger.error(f"Error removing embedded proxy log handler: {e}", exc_info=True)
+
+    def status(self):
+        return [{
+            "worker": "embedded",
+            "index": None,
+            "pid": None,
+            "alive": self.running,
+            "uptime": round(time.time() - self._started_at, 1) if self.running else None,
+            "restarts": 0,
+            "last_exit_code": None,
+            "log": None,
+        }]
+
+    def stop(self):
+        """Shut the proxy down; queued flows are committed by the addon's ``done`` hook."""
+        if self._thread is None:
+            return
+        if self.master is not None and self._thread.is_alive():
+            self.master.shutdown()
+        self._thread.join(STOP_TIMEOUT_SECONDS)
+        if self._thread.is_alive():
+            logger.warning("Embedded proxy did not stop in time")
+        elif self.addon is not None and self.master is None:
+            # Never got as far as running, so ``done`` will not clean up
+            self.addon.done()
+        self._thread = None
+        self.master = None
+        self.addon = None
+        state.proxy_master = state.proxy_loop = state.proxy_thread = None
+        logger.info("Embedded proxy stopped")
@@ -0,0 +1,291 @@
+"""
+Filter expressions for stored flows, in the style of mitmproxy's filters.
+
+    ~m GET                 request method
+    ~d example.com         host, exactly or as a glob (~d *.example.com)
+    ~p /api/*              path glob; without wildcards, a path prefix
+    ~u token\\d+            regular expression searched in the full URL
+    ~c 404, ~c 4xx         status: exact, NNxx, a range (200-299) or a comparison (>=500)
+    ~z >10k                content length, same forms, with k/m/g suffixes
+    ~after 2024-03-20      flows at or after an ISO time, or a span ago (15m, 2h, 7d)
+    ~before 2024-03-21T12  flows before an ISO time or span ago
+    ~h Cookie              a request or response header (``~hq`` request, ``~hs`` response);
+                           ``~h "Name: regex"`` also matches the value
+    ~t json                response Content-Type contains the text
+    ~b "some text"         a body contains the words (uses the full-text index)
+    !  &  |  ( )           not, and (also implied by a space), or, grouping
+    anything else          same as ~u
+
+``~d`` and ``~p`` also take ``regex:<pattern>``. Values with spaces are quoted.
+
+An expression is parsed once into a SQL condition. Method, host, path, status,
+size and time compile to comparisons, ranges or prefix globs on indexed
+columns and ``~b`` to a full-text index lookup, so SQLite can plan a filtered
+list, export or delete as index seeks; regular expressions and header tests run
+as SQL functions over whatever rows the indexed terms leave, which is a full
+scan only when the expression has nothing indexable.
+"""
+
+import json
+import re
+import sqlite3
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple
+
+from api.flow_search import match_phrase
+
+_TOKEN = re.compile(r'\s*(?:(\()|(\))|(!)|(&)|(\|)|"((?:[^"\\]|\\.)*)"|\'([^\']*)\'|([^\s()!&|"\']+))')
+_GLOB_CHARS = "*?["
+_SIZE_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+_SPAN_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+_REGEX_PREFIX = "regex:"
+
+
+class _Ago:
+    """A time relative to when the filter runs, not when it was parsed."""
+
+    def __init__(self, span: timedelta):
+        self.span = span
+
+    def value(self) -> str:
+        return (datetime.now() - self.span).isoformat()
+
+
+class FlowFilter:
+    """A compiled filter: a SQL condition over the ``flows`` table and its parameters."""
+
+    def __init__(self, expression: str, sql: str, params: List[Any]):
+        self.expression = expression
+        self.sql = sql
+        self._params = params
+
+    @property
+    def params(self) -> List[Any]:
+        return [param.value() if isinstance(param, _Ago) else param for param in self._params]
+
+    def __repr__(self) -> str:
+        return f"FlowFilter({self.expression!r})"
+
+
+# ----------------------------------------------------------------------
+# SQL functions for the terms no index can answer
+# ----------------------------------------------------------------------
+
+@lru_cache(maxsize=256)
+def _regex(pattern: str) -> re.Pattern:
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def _regexp(pattern: str, value: Optional[str]) -> bool:
+    return value is not None and _regex(pattern).search(value) is not None
+
+
+def _header_match(headers: Optional[str], name: str, pattern: Optional[str]) -> bool:
+    if not headers:
+        return False
+    pairs = json.loads(headers)
+    if isinstance(pairs, dict):
+        pairs = pairs.items()
+    for key, value in pairs:
+        if key.lower() == name and (pattern is None or _regex(pattern).search(value)):
+            return True
+    return False
+
+
+def register_functions(conn: sqlite3.Connection):
+    """Make the functions filter conditions use available on ``conn``."""
+    conn.create_function("regexp", 2, _regexp, deterministic=True)
+    conn.create_function("header_match", 3, _header_match, deterministic=True)
+
+
+# ----------------------------------------------------------------------
+# Values
+# ----------------------------------------------------------------------
+
+def _checked_regex(pattern: str) -> str:
+    try:
+        _regex(pattern)
+    except re.error as e:
+        raise ValueError(f"Invalid regex {pattern!r}: {e}")
+    return pattern
+
+
+def _number(text: str, units: bool) -> int:
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([a-z]?)", text.strip().lower())
+    if not match or (match.group(2) and not units) or match.group(2) not in _SIZE_UNITS:
+        raise ValueError(f"Invalid number: {text!r}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+
+def _range(column: str, spec: str, units: bool = False) -> Tuple[str, List[Any]]:
+    spec = spec.strip()
+    for op in (">=", "<=", ">", "<"):
+        if spec.startswith(op):
+            return f"{column} {op} ?", [_number(spec[len(op):], units)]
+    if not units and re.fullmatch(r"\dxx", spec.lower()):
+        low = int(spec[0]) * 100
+        return f"{column} BETWEEN ? AND ?", [low, low + 99]
+    low, dash, high = spec.partition("-")
+    if dash:
+        return f"{column} BETWEEN ? AND ?", [_number(low, units), _number(high, units)]
+    return f"{column} = ?", [_number(spec, units)]
+
+
+def _time(text: str) -> Any:
+    match = re.fullmatch(r"(\d+)([smhdw])", text.strip().lower())
+    if match:
+        return _Ago(timedelta(**{_SPAN_UNITS[match.group(2)]: int(match.group(1))}))
+    try:
+        return datetime.fromisoformat(text.strip()).isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid time: {text!r} (use an ISO time or a span like 15m, 2h, 7d)")
+
+
+def _glob_or_regex(column: str, value: str, lower: bool = False, prefix: bool = False) -> Tuple[str, List[Any]]:
+    if value.lower().startswith(_REGEX_PREFIX):
+        return f"{column} REGEXP ?", [_checked_regex(value[len(_REGEX_PREFIX):])]
+    if lower:
+        value = value.lower()
+    if any(c in value for c in _GLOB_CHARS):
+        return f"{column} GLOB ?", [value]
+    if prefix:
+        # A literal prefix as a glob, which SQLite answers with an index range
+        return f"{column} GLOB ?", [value + "*"]
+    return f"{column} = ?", [value]
+
+
+def _header(columns: Tuple[str, ...], value: str) -> Tuple[str, List[Any]]:
+    name, colon, pattern = value.partition(":")
+    name = name.strip().lower()
+    if not name:
+        raise ValueError("~h needs a header name")
+    pattern = _checked_regex(pattern.strip()) if colon and pattern.strip() else None
+    sql = " OR ".join(f"header_match({column}, ?, ?)" for column in columns)
+    return f"({sql})", [name, pattern] * len(columns)
+
+
+def _operator(name: str, value: str) -> Tuple[str, List[Any]]:
+    if name == "m":
+        return "method = ?", [value.upper()]
+    if name == "d":
+        return _glob_or_regex("host", value, lower=True)
+    if name == "p":
+        return _glob_or_regex("path", value, prefix=True)
+    if name == "u":
+        return "url REGEXP ?", [_checked_regex(value)]
+    if name == "c":
+        return _range("status", value)
+    if name == "z":
+        return _range("content_length", value, units=True)
+    if name == "after":
+        return "timestamp >= ?", [_time(value)]
+    if name == "before":
+        return "timestamp < ?", [_time(value)]
+    if name in ("h", "hq", "hs"):
+        columns = {"h": ("request_headers", "response_headers"),
+                   "hq": ("request_headers",), "hs": ("response_headers",)}[name]
+        return _header(columns, value)
+    if name == "t":
+        return "header_match(response_headers, 'content-type', ?)", [re.escape(value)]
+    if name == "b":
+        if not re.search(r"\w", value):
+            raise ValueError("~b needs words to search for")
+        return "id IN (SELECT rowid FROM flows_fts WHERE flows_fts MATCH ?)", [match_phrase(value, "body")]
+    raise ValueError(f"Unknown filter operator: ~{name}")
+
+
+# ----------------------------------------------------------------------
+# Parser
+# ----------------------------------------------------------------------
+
+class _Parser:
+    """Recursive descent over: or := and ('|' and)*; and := not ('&'? not)*; not := '!' not | atom."""
+
+    def __init__(self, expression: str):
+        self.tokens: List[Tuple[str, str]] = []
+        position = 0
+        expression = expression.strip()
+        while position < len(expression):
+            match = _TOKEN.match(expression, position)
+            if not match or match.end() == position:
+                raise ValueError(f"Cannot parse filter at: {expression[position:]!r}")
+            position = match.end()
+            lparen, rparen, bang, amp, pipe, dquoted, squoted, word = match.groups()
+            if lparen or rparen or bang or amp or pipe:
+                self.tokens.append(("op", lparen or rparen or bang or amp or pipe))
+            elif dquoted is not None:
+                self.tokens.append(("value", re.sub(r"\\(.)", r"\1", dquoted)))
+            elif squoted is not None:
+                self.tokens.append(("value", squoted))
+            elif word.strip():
+                self.tokens.append(("word", word))
+        self.index = 0
+        self.params: List[Any] = []
+
+    def _peek(self) -> Optional[Tuple[str, str]]:
+        return self.tokens[self.index] if self.index < len(self.tokens) else None
+
+    def _next(self) -> Tuple[str, str]:
+        token = self._peek()
+        if token is None:
+            raise ValueError("Filter ends unexpectedly")
+        self.index += 1
+        return token
+
+    def parse(self) -> str:
+        if not self.tokens:
+            raise ValueError("Empty filter")
+        sql = self._or()
+        if self._peek() is not None:
+            raise ValueError(f"Unexpected {self._peek()[1]!r} in filter")
+        return sql
+
+    def _or(self) -> str:
+        parts = [self._and()]
+        while self._peek() == ("op", "|"):
+            self.index += 1
+            parts.append(self._and())
+        return parts[0] if len(parts) == 1 else "(" + " OR ".join(parts) + ")"
+
+    def _and(self) -> str:
+        parts = [self._not()]
+        while self._peek() is not None and self._peek() not in (("op", "|"), ("op", ")")):
+            if self._peek() == ("op", "&"):
+                self.index += 1
+            parts.append(self._not())
+        return parts[0] if len(parts) == 1 else "(" + " AND ".join(parts) + ")"
+
+    def _not(self) -> str:
+        if self._peek() == ("op", "!"):
+            self.index += 1
+            # NULL columns (e.g. no status yet) count as not matching, so NOT matches them
+            return f"NOT COALESCE({self._not()}, 0)"
+        return self._atom()
+
+    def _atom(self) -> str:
+        kind, text = self._next()
+        if (kind, text) == ("op", "("):
+            sql = self._or()
+            if self._next() != ("op", ")"):
+                raise ValueError("Missing ')' in filter")
+            return sql
+        if kind == "op":
+            raise ValueError(f"Unexpected {text!r} in filter")
+        if kind == "word" and text.startswith("~"):
+            value_kind, value = self._next()
+            if value_kind == "op":
+                raise ValueError(f"~{text[1:]} needs a value")
+            sql, params = _operator(text[1:].lower(), value)
+        else:
+            sql, params = _operator("u", re.escape(text) if kind == "value" else text)
+        self.params.extend(params)
+        return sql
+
+
+@lru_cache(maxsize=128)
+def compile_filter(expression: str) -> FlowFilter:
+    """Parse a filter expression; raises ValueError if it is malformed."""
+    parser = _Parser(expression)
+    sql = parser.parse()
+    return FlowFilter(expression, sql, parser.params)
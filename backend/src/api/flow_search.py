@@ -0,0 +1,194 @@
+"""
+Full-text index over captured flows, kept in the flow store's database.
+
+An FTS5 table holds each flow's URL, its request and response header lines and
+the text of its bodies, under the flow's ID. Index rows are written in the same
+transaction that stores the flow (capture, repeater or import alike) and
+deleted with it, so the index is always current and never rebuilt for a query.
+Only bodies that look like text are indexed, and only their first
+``body_limit`` bytes; the indexed text is kept so matches can be quoted.
+
+Search strings use a small syntax that is translated to an FTS5 query, so user
+input can never be an FTS syntax error:
+
+    token                flows containing the token (every term must match)
+    "exact phrase"       the words next to each other, in order
+    tok*                 any token starting with ``tok``
+    url: headers: body:  restrict the term that follows to one column
+    -term                leave out flows containing ``term``
+
+Results come back newest first by walking the index in rowid order, so a page
+of matches costs the same however many flows match.
+"""
+
+import json
+import re
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from api.body_spool import BodySpool
+from api.raw_http import header_pairs
+
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS flows_fts USING fts5(
+    url, headers, body,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+"""
+
+SEARCH_COLUMNS = ("url", "headers", "body")
+
+# Leading bytes of each body that are indexed
+DEFAULT_BODY_LIMIT = 256 * 1024
+
+# Content types indexed as text; bodies without one are indexed if they decode as UTF-8
+_TEXT_TYPES = ("text/", "json", "xml", "javascript", "ecmascript", "x-www-form-urlencoded",
+               "graphql", "yaml", "csv")
+
+# Marks around matched tokens in snippets
+SNIPPET_START = "«"
+SNIPPET_END = "»"
+SNIPPET_TOKENS = 24
+
+_TERM = re.compile(r'(-?)(?:(url|headers|body):)?(?:"([^"]*)"?|(\S+))', re.IGNORECASE)
+_WORD = re.compile(r"\w")
+
+
+def _header_value(headers, name: str) -> Optional[str]:
+    for key, value in header_pairs(headers):
+        if key.lower() == name:
+            return value
+    return None
+
+
+def header_text(headers) -> str:
+    return "\n".join(f"{name}: {value}" for name, value in header_pairs(headers))
+
+
+def body_text(content, headers, limit: int = DEFAULT_BODY_LIMIT) -> str:
+    """The indexable text of a body, or "" for binary and encoded bodies.
+
+    Reads at most ``limit`` bytes; a spilled ``BodySpool`` is read from its file
+    before the store adopts it.
+    """
+    if content is None or limit <= 0:
+        return ""
+    content_type = (_header_value(headers, "content-type") or "").lower()
+    if content_type and not any(text_type in content_type for text_type in _TEXT_TYPES):
+        return ""
+    if isinstance(content, str):
+        return content[:limit]
+    if isinstance(content, BodySpool):
+        if not content.spilled:
+            data = content.getvalue()[:limit]
+        elif (_header_value(headers, "content-encoding") or "identity").lower() != "identity":
+            # Spilled bodies are kept as sent; a compressed prefix isn't text
+            return ""
+        else:
+            with open(content.path, "rb") as spilled:
+                data = spilled.read(limit)
+    else:
+        data = bytes(content[:limit])
+    if content_type:
+        return data.decode("utf-8", "replace")
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # Tolerate a character cut off at the limit, but nothing else
+        if len(data) >= limit and e.start >= len(data) - 3:
+            return data[:e.start].decode("utf-8", "replace")
+        return ""
+
+
+def index_flow(conn: sqlite3.Connection, flow_id: int, url: Optional[str],
+               request_headers, response_headers, request_text: str, response_text: str):
+    headers = header_text(request_headers)
+    if response_headers:
+        headers += "\n\n" + header_text(response_headers)
+    body = "\n\n".join(text for text in (request_text, response_text) if text)
+    conn.execute(
+        "INSERT OR REPLACE INTO flows_fts (rowid, url, headers, body) VALUES (?, ?, ?, ?)",
+        (flow_id, url or "", headers, body)
+    )
+
+
+def unindex_flows(conn: sqlite3.Connection, flow_ids: Iterable[int]):
+    conn.executemany("DELETE FROM flows_fts WHERE rowid = ?", ((flow_id,) for flow_id in flow_ids))
+
+
+def clear_index(conn: sqlite3.Connection):
+    conn.execute("DELETE FROM flows_fts")
+
+
+def match_phrase(text: str, column: Optional[str] = None, prefix: bool = False) -> str:
+    """An FTS5 phrase matching ``text`` literally, optionally within one column."""
+    term = '"' + text.replace('"', '""') + '"' + ("*" if prefix else "")
+    return f"{column} : {term}" if column else term
+
+
+def compile_query(query: str) -> str:
+    """Translate a search string into an FTS5 MATCH expression.
+
+    Raises ValueError when nothing in it can match (e.g. only exclusions).
+    """
+    include: List[str] = []
+    exclude: List[str] = []
+    for match in _TERM.finditer(query or ""):
+        negate, column, phrase, word = match.groups()
+        prefix = False
+        if phrase is None:
+            prefix = word.endswith("*")
+            phrase = word.rstrip("*")
+        if not _WORD.search(phrase):
+            # Nothing the tokenizer would index
+            continue
+        term = match_phrase(phrase, column.lower() if column else None, prefix)
+        (exclude if negate else include).append(term)
+    if not include:
+        raise ValueError("Search needs at least one term to match")
+    expression = "(" + " AND ".join(include) + ")"
+    for term in exclude:
+        expression += f" NOT {term}"
+    return expression
+
+
+def search(conn: sqlite3.Connection, query: str, limit: int = 50, before: Optional[int] = None,
+           visible: str = "1") -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """Flows matching ``query``, newest first, with a snippet of the best match.
+
+    ``before`` continues from a previous page and ``visible`` is a condition
+    on ``rowid`` for rows still indexed but no longer listed. Returns the
+    matches and the ``before`` for the next page, or None on the last one.
+    """
+    sql = (
+        "SELECT rowid, snippet(flows_fts, -1, ?, ?, '…', ?) FROM flows_fts "
+        f"WHERE flows_fts MATCH ? AND {visible}"
+    )
+    params: List[Any] = [SNIPPET_START, SNIPPET_END, SNIPPET_TOKENS, compile_query(query)]
+    if before is not None:
+        sql += " AND rowid < ?"
+        params.append(before)
+    sql += " ORDER BY rowid DESC LIMIT ?"
+    params.append(limit + 1)
+    rows = conn.execute(sql, params).fetchall()
+    results = [{"id": row[0], "snippet": row[1]} for row in rows[:limit]]
+    return results, (results[-1]["id"] if len(rows) > limit else None)
+
+
+def backfill(conn: sqlite3.Connection, blobs, body_limit: int = DEFAULT_BODY_LIMIT):
+    """Index every stored flow; used when upgrading a database that predates the index."""
+    rows = conn.execute(
+        "SELECT f.id, f.url, f.request_headers, f.response_headers, "
+        "f.request_body_hash, rq.codec, f.response_body_hash, rs.codec FROM flows f "
+        "LEFT JOIN blobs rq ON rq.hash = f.request_body_hash "
+        "LEFT JOIN blobs rs ON rs.hash = f.response_body_hash"
+    )
+    for flow_id, url, request_headers, response_headers, rq_hash, rq_codec, rs_hash, rs_codec in rows:
+        request_headers = json.loads(request_headers or "{}")
+        response_headers = json.loads(response_headers or "{}")
+        texts = []
+        for digest, codec, headers in ((rq_hash, rq_codec, request_headers), (rs_hash, rs_codec, response_headers)):
+            data = blobs.read(digest, codec or "none", body_limit) if digest and body_limit > 0 else None
+            texts.append(body_text(data, headers, body_limit))
+        index_flow(conn, flow_id, url, request_headers, response_headers, *texts)
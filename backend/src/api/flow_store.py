@@ -0,0 +1,854 @@
+"""
+SQLite-backed store for captured flows.
+
+The database runs in WAL mode so the mitmdump addon can write while the API
+process reads: every read sees a consistent snapshot and writers never leave a
+half-written file behind. Summary columns used by the log table are indexed.
+
+Bodies are kept out of the database in a content-addressed ``BlobStore``; a flow
+row holds only each body's hash and size, and the ``blobs`` table counts
+references so identical bodies are stored once and freed with their last flow.
+Blobs may be compressed; each one's codec is recorded next to its refcount and
+bodies are only decompressed when an entry is read with its bodies. Display
+reads (``preview=True``) truncate bodies larger than ``preview_size`` to a
+preview; every other read, such as an export, returns the whole body.
+
+Every flow is also written to a full-text index (see ``flow_search``) in the
+same transaction.
+
+Deleting flows is O(1) per flow: their rows move to ``tombstones``, keeping
+only the body hashes. Index entries and blob references are released later,
+in batches, by ``compact`` (driven by the background ``Compactor``). Clearing
+is O(1) in total: it raises a floor below which every read ignores flows, and
+``purge_cleared`` tombstones those rows in the background.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from api.blob_store import DEFAULT_MIN_SIZE, BlobChanges, BlobStore
+from api.body_spool import BodySpool
+from api.config import settings
+from api.flow_filter import FlowFilter, register_functions
+from api.flow_search import (
+    DEFAULT_BODY_LIMIT, SEARCH_SCHEMA, backfill, body_text, clear_index, index_flow, search, unindex_flows
+)
+from api.history_log import HistoryLog
+from api.id_allocator import advance_ids_past, initialize_ids, peek_next_id, reserve_ids
+from api.raw_http import header_pairs, headers_dict, render_raw_request
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS flows (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT,
+    method TEXT,
+    url TEXT,
+    host TEXT,
+    path TEXT,
+    status INTEGER,
+    content_length INTEGER,
+    request_headers TEXT,
+    response_headers TEXT,
+    raw_request TEXT,
+    http_version TEXT,
+    request_body_hash TEXT,
+    request_body_size INTEGER,
+    response_body_hash TEXT,
+    response_body_size INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    refcount INTEGER NOT NULL,
+    codec TEXT NOT NULL DEFAULT 'none',
+    stored_size INTEGER
+);
+
+-- Deleted flows whose index rows and blob references are not yet released
+CREATE TABLE IF NOT EXISTS tombstones (
+    flow_id INTEGER PRIMARY KEY,
+    request_body_hash TEXT,
+    response_body_hash TEXT
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+# Created after upgrades so they can refer to columns older databases lack
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_flows_timestamp ON flows(timestamp);
+CREATE INDEX IF NOT EXISTS idx_flows_method ON flows(method);
+CREATE INDEX IF NOT EXISTS idx_flows_host ON flows(host);
+CREATE INDEX IF NOT EXISTS idx_flows_path ON flows(path);
+CREATE INDEX IF NOT EXISTS idx_flows_status ON flows(status);
+CREATE INDEX IF NOT EXISTS idx_flows_content_length ON flows(content_length);
+"""
+
+# Columns added after version 1, per table, for upgrading older databases
+ADDED_COLUMNS = {
+    "flows": {
+        "request_body_hash": "TEXT",
+        "request_body_size": "INTEGER",
+        "response_body_hash": "TEXT",
+        "response_body_size": "INTEGER",
+        "http_version": "TEXT",
+    },
+    "blobs": {
+        "codec": "TEXT NOT NULL DEFAULT 'none'",
+        "stored_size": "INTEGER",
+    },
+}
+
+# Columns the log table shows, and what list views send by default
+SUMMARY_COLUMNS = ("id", "timestamp", "method", "url", "status", "content_length")
+# Everything a list page can project without opening a blob
+LIST_COLUMNS = SUMMARY_COLUMNS + ("host", "path", "http_version", "request_body_size", "response_body_size")
+# Keys a page can be sorted by; all indexed (id is the rowid)
+SORT_KEYS = ("id", "timestamp", "method", "host", "path", "status", "content_length")
+
+# Meta key holding the lowest visible flow ID, raised by clear()
+CLEAR_FLOOR_KEY = "clear_floor"
+
+
+_CLEAR_FLOOR = f"COALESCE((SELECT value FROM meta WHERE key = '{CLEAR_FLOOR_KEY}'), 0)"
+
+
+def _visible(column: str = "id") -> str:
+    """SQL condition hiding flows below the clear floor (one indexed lookup per query)."""
+    return f"{column} >= {_CLEAR_FLOOR}"
+
+
+# How long a writer waits for another process to release the database
+BUSY_TIMEOUT_SECONDS = 10.0
+
+
+class FlowStore:
+    def __init__(self, path, legacy_history_dir=None, legacy_file=None, blob_dir=None,
+                 compression: str = "none", compression_level: Optional[int] = None,
+                 compression_min_size: int = DEFAULT_MIN_SIZE, preview_size: Optional[int] = None,
+                 search_body_limit: int = DEFAULT_BODY_LIMIT):
+        self.path = Path(path)
+        self.legacy_history_dir = Path(legacy_history_dir) if legacy_history_dir else None
+        self.legacy_file = Path(legacy_file) if legacy_file else None
+        self.preview_size = preview_size
+        self.search_body_limit = search_body_limit
+        self.spool_dir = self.path.parent / "spool"
+        self._local = threading.local()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.blobs = BlobStore(
+            blob_dir or self.path.parent / "blobs",
+            codec=compression,
+            level=compression_level,
+            min_size=compression_min_size
+        )
+        conn = self._connection()
+        # Only takes effect for a new database; lets compaction hand free pages back
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.executescript(SCHEMA + SEARCH_SCHEMA)
+        with self._write() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('schema_version', ?)",
+                    (SCHEMA_VERSION,)
+                )
+            elif row[0] < SCHEMA_VERSION:
+                self._upgrade(conn, row[0])
+            initialize_ids(conn)
+        conn.executescript(INDEXES)
+        self._migrate_legacy()
+
+    # ------------------------------------------------------------------
+    # Connection handling
+    # ------------------------------------------------------------------
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            register_functions(conn)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self):
+        """Run a write transaction, taking the write lock up front.
+
+        Blob files written or removed inside it follow the outcome (see ``BlobChanges``).
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        changes = self._local.blob_changes = BlobChanges(self.blobs)
+        try:
+            yield conn
+        except BaseException:
+            try:
+                changes.undo()
+            finally:
+                conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+            changes.commit()
+        finally:
+            self._local.blob_changes = None
+
+    @contextmanager
+    def _read(self):
+        """Run several reads against one consistent snapshot."""
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ------------------------------------------------------------------
+    # Row conversion
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _flow_row(entry: Dict[str, Any]) -> Dict[str, Any]:
+        request = entry.get("request", {})
+        response = entry.get("response", {})
+        url = request.get("url") or entry.get("url") or ""
+        parts = urlsplit(url)
+        return {
+            "id": entry.get("id"),
+            "timestamp": entry.get("timestamp", request.get("timestamp")),
+            "method": request.get("method") or entry.get("method"),
+            "url": url,
+            "host": parts.hostname,
+            "path": parts.path or "/",
+            "status": response.get("status_code", entry.get("status")),
+            "content_length": entry.get("content_length"),
+            # Ordered pairs keep duplicates; older rows hold a JSON object instead
+            "request_headers": json.dumps(header_pairs(request.get("headers"))),
+            "response_headers": json.dumps(header_pairs(response.get("headers"))),
+            "raw_request": request.get("raw_request"),
+            "http_version": request.get("http_version"),
+        }
+
+    def _body(self, part: Dict[str, Any], row: sqlite3.Row, side: str, preview: bool = False):
+        """Fill in ``part["content"]``; with ``preview``, large bodies are truncated."""
+        digest = row[f"{side}_body_hash"]
+        if digest is None:
+            part["content"] = None
+            return
+        size = row[f"{side}_body_size"]
+        limit = None
+        if preview and self.preview_size is not None and size is not None and size > self.preview_size:
+            limit = self.preview_size
+            part["content_truncated"] = True
+            part["content_size"] = size
+        data = self.blobs.read(digest, row[f"{side}_body_codec"] or "none", limit)
+        part["content"] = data.decode("utf-8", "replace") if data is not None else None
+
+    def _entry(self, row: sqlite3.Row, include_bodies: bool = True, preview: bool = False) -> Dict[str, Any]:
+        """Rebuild the storage-format entry the routes expect.
+
+        With ``include_bodies=False`` no blob is opened or decompressed and the
+        contents are left as None. ``preview`` truncates large bodies for display.
+        """
+        request = {
+            "method": row["method"],
+            "url": row["url"],
+            "headers": headers_dict(json.loads(row["request_headers"] or "{}")),
+            "content": None,
+        }
+        if row["raw_request"] is not None:
+            request["raw_request"] = row["raw_request"]
+        if row["http_version"] is not None:
+            request["http_version"] = row["http_version"]
+        response = {
+            "status_code": row["status"],
+            "headers": headers_dict(json.loads(row["response_headers"] or "{}")),
+            "content": None,
+        }
+        if include_bodies:
+            self._body(request, row, "request", preview)
+            self._body(response, row, "response", preview)
+        return {
+            "id": row["id"],
+            "timestamp": row["timestamp"],
+            "method": row["method"],
+            "url": row["url"],
+            "status": row["status"],
+            "content_length": row["content_length"],
+            "request": request,
+            "response": response,
+        }
+
+    _SELECT = (
+        "SELECT f.*, rq.codec AS request_body_codec, rs.codec AS response_body_codec FROM flows f "
+        "LEFT JOIN blobs rq ON rq.hash = f.request_body_hash "
+        "LEFT JOIN blobs rs ON rs.hash = f.response_body_hash"
+    )
+
+    # ------------------------------------------------------------------
+    # Blob references
+    # ------------------------------------------------------------------
+
+    def _acquire_blob(self, conn: sqlite3.Connection, content) -> tuple:
+        """Store a body (once) and take a reference to it. Returns (hash, size).
+
+        ``content`` may be a spilled ``BodySpool``, whose file is adopted as the
+        blob without being read back into memory.
+        """
+        if content is None:
+            return None, None
+        if isinstance(content, BodySpool):
+            data = None
+            digest, size = content.digest, content.size
+        else:
+            data = content.encode("utf-8") if isinstance(content, str) else bytes(content)
+            digest, size = self.blobs.digest(data), len(data)
+        updated = conn.execute(
+            "UPDATE blobs SET refcount = refcount + 1 WHERE hash = ?", (digest,)
+        ).rowcount
+        if not updated:
+            # Written while holding the write lock, so a concurrent release can't unlink it
+            if data is None:
+                codec, stored_size = self.blobs.adopt(digest, content.path)
+            else:
+                codec, stored_size = self.blobs.write(digest, data)
+            self._local.blob_changes.wrote(digest)
+            conn.execute(
+                "INSERT INTO blobs (hash, size, refcount, codec, stored_size) VALUES (?, ?, 1, ?, ?)",
+                (digest, size, codec, stored_size)
+            )
+        elif data is None:
+            content.discard()
+        return digest, size
+
+    def _release_blobs(self, conn: sqlite3.Connection, digests: Iterable[Optional[str]]) -> Tuple[int, int]:
+        """Drop one reference per digest and delete blobs nobody points at any more.
+
+        Returns how many blobs were deleted and their size on disk.
+        """
+        released = set()
+        for digest in digests:
+            if digest is None:
+                continue
+            conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE hash = ?", (digest,))
+            released.add(digest)
+        freed, freed_bytes = 0, 0
+        for digest in released:
+            row = conn.execute(
+                "SELECT stored_size FROM blobs WHERE hash = ? AND refcount <= 0", (digest,)
+            ).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM blobs WHERE hash = ?", (digest,))
+                self._local.blob_changes.remove(digest)
+                freed += 1
+                freed_bytes += row[0] or 0
+        return freed, freed_bytes
+
+    def _insert(self, conn: sqlite3.Connection, entry: Dict[str, Any]) -> int:
+        row = self._flow_row(entry)
+        request = entry.get("request", {})
+        response = entry.get("response", {})
+        # Read before the blobs are stored: a spilled body's file is adopted by the blob store
+        texts = [
+            body_text(part.get("content"), part.get("headers"), self.search_body_limit)
+            for part in (request, response)
+        ]
+        row["request_body_hash"], row["request_body_size"] = self._acquire_blob(
+            conn, entry.get("request", {}).get("content")
+        )
+        row["response_body_hash"], row["response_body_size"] = self._acquire_blob(
+            conn, entry.get("response", {}).get("content")
+        )
+        cursor = conn.execute(
+            """
+            INSERT INTO flows (id, timestamp, method, url, host, path, status,
+                               content_length, request_headers, response_headers, raw_request, http_version,
+                               request_body_hash, request_body_size,
+                               response_body_hash, response_body_size)
+            VALUES (:id, :timestamp, :method, :url, :host, :path, :status,
+                    :content_length, :request_headers, :response_headers, :raw_request, :http_version,
+                    :request_body_hash, :request_body_size,
+                    :response_body_hash, :response_body_size)
+            """,
+            row
+        )
+        index_flow(conn, cursor.lastrowid, row["url"], request.get("headers"), response.get("headers"), *texts)
+        return cursor.lastrowid
+
+    def _delete_all(self, conn: sqlite3.Connection):
+        conn.execute("DELETE FROM flows")
+        conn.execute("DELETE FROM blobs")
+        conn.execute("DELETE FROM tombstones")
+        conn.execute("DELETE FROM meta WHERE key = ?", (CLEAR_FLOOR_KEY,))
+        clear_index(conn)
+        self._local.blob_changes.clear()
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def reserve_ids(self, count: int = 1) -> range:
+        """Reserve ``count`` consecutive flow IDs from the shared allocator."""
+        with self._write() as conn:
+            return reserve_ids(conn, count)
+
+    def append(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Insert ``entry`` under the next allocated ID."""
+        return self.append_many([entry])[0]
+
+    def append_many(self, entries: List[Dict[str, Any]], meta: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Insert a batch of entries (and optional meta values) in one transaction.
+
+        The batch reserves one contiguous ID range, so the allocation and the
+        rows commit (or roll back) together.
+        """
+        with self._write() as conn:
+            for entry, flow_id in zip(entries, reserve_ids(conn, len(entries))):
+                entry["id"] = flow_id
+                self._insert(conn, entry)
+            for key, value in (meta or {}).items():
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+        return entries
+
+    def get_meta(self, key: str, default=None):
+        row = self._connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value: Any):
+        with self._write() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def entries(self, include_bodies: bool = True, flow_filter: Optional[FlowFilter] = None,
+                preview: bool = False) -> List[Dict[str, Any]]:
+        """Return all entries (or those matching ``flow_filter``) in ID order from a single snapshot."""
+        where, params = f" WHERE {_visible()}", []
+        if flow_filter is not None:
+            where, params = f"{where} AND {flow_filter.sql}", flow_filter.params
+        with self._read() as conn:
+            rows = conn.execute(self._SELECT + where + " ORDER BY f.id", params).fetchall()
+        return [self._entry(row, include_bodies, preview) for row in rows]
+
+    def get(self, log_id: int, include_bodies: bool = True, preview: bool = False) -> Optional[Dict[str, Any]]:
+        with self._read() as conn:
+            row = conn.execute(self._SELECT + f" WHERE f.id = ? AND {_visible()}", (log_id,)).fetchone()
+        return self._entry(row, include_bodies, preview) if row else None
+
+    def get_many(self, log_ids: Iterable[int], include_bodies: bool = True) -> List[Dict[str, Any]]:
+        """Return the entries that exist among ``log_ids``, in ID order."""
+        log_ids = list(log_ids)
+        entries: List[Dict[str, Any]] = []
+        with self._read() as conn:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(log_ids), 500):
+                chunk = log_ids[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    self._SELECT + f" WHERE f.id IN ({placeholders}) AND {_visible()}", chunk
+                ).fetchall()
+                entries.extend(self._entry(row, include_bodies) for row in rows)
+        entries.sort(key=lambda entry: entry["id"])
+        return entries
+
+    def summaries(self, log_ids: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+        """Summary columns only (no headers, no blobs), in ID order."""
+        select = f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM flows"
+        with self._read() as conn:
+            if log_ids is None:
+                rows = conn.execute(select + f" WHERE {_visible()} ORDER BY id").fetchall()
+            else:
+                log_ids = list(log_ids)
+                rows = []
+                for start in range(0, len(log_ids), 500):
+                    chunk = log_ids[start:start + 500]
+                    rows.extend(conn.execute(
+                        select + f" WHERE id IN ({','.join('?' * len(chunk))}) AND {_visible()}", chunk
+                    ).fetchall())
+                rows.sort(key=lambda row: row["id"])
+        return [dict(row) for row in rows]
+
+    def page(self, sort: str = "id", descending: bool = False, limit: int = 100,
+             after: Optional[Sequence[Any]] = None,
+             with_entries: bool = False,
+             flow_filter: Optional[FlowFilter] = None) -> Tuple[List[Dict[str, Any]], Optional[List[Any]]]:
+        """One page of flows ordered by ``sort`` (then ID), using keyset pagination.
+
+        ``after`` is the ``[sort value, id]`` key of the previous page's last
+        row. Every query is a range seek on the sort key's index, so a page
+        costs the same wherever it is in the list. NULLs sort first ascending
+        and last descending, as SQLite orders them. Rows hold ``LIST_COLUMNS``,
+        plus the storage-format ``request``/``response`` (with bodies) when
+        ``with_entries`` is set. Only rows matching ``flow_filter`` are listed.
+        Returns the rows and the next page's key, or None on the last page.
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Cannot sort by: {sort}")
+        op, direction = ("<", "DESC") if descending else (">", "ASC")
+        if with_entries:
+            select = self._SELECT
+        else:
+            select = f"SELECT {', '.join('f.' + column for column in LIST_COLUMNS)} FROM flows f"
+
+        # (condition, bound condition, order) per segment, in page order
+        if sort == "id":
+            segments = [("1", f"f.id {op} ?", f"f.id {direction}")]
+        else:
+            nulls = (f"f.{sort} IS NULL", f"f.id {op} ?", f"f.id {direction}")
+            values = (f"f.{sort} IS NOT NULL", f"(f.{sort}, f.id) {op} (?, ?)", f"f.{sort} {direction}, f.id {direction}")
+            segments = [values, nulls] if descending else [nulls, values]
+
+        if after is not None:
+            value, last_id = after
+            # Resume in the segment the previous page ended in
+            start = 0 if sort == "id" or (value is None) != descending else 1
+            bound = [last_id] if sort == "id" or value is None else [value, last_id]
+        else:
+            start, bound = 0, None
+
+        rows: List[sqlite3.Row] = []
+        with self._read() as conn:
+            for index in range(start, len(segments)):
+                condition, bound_condition, order = segments[index]
+                params: List[Any] = []
+                where = f"{condition} AND {_visible()}"
+                if flow_filter is not None:
+                    where += f" AND {flow_filter.sql}"
+                    params.extend(flow_filter.params)
+                if index == start and bound is not None:
+                    where += f" AND {bound_condition}"
+                    params.extend(bound)
+                params.append(limit + 1 - len(rows))
+                rows.extend(conn.execute(f"{select} WHERE {where} ORDER BY {order} LIMIT ?", params).fetchall())
+                if len(rows) > limit:
+                    break
+
+        more = len(rows) > limit
+        rows = rows[:limit]
+        result = []
+        for row in rows:
+            item = {column: row[column] for column in LIST_COLUMNS}
+            if with_entries:
+                entry = self._entry(row, preview=True)
+                item["request"], item["response"] = entry["request"], entry["response"]
+            result.append(item)
+        next_key = [rows[-1][sort], rows[-1]["id"]] if more and rows else None
+        return result, next_key
+
+    def search(self, query: str, limit: int = 50,
+               before: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Full-text search over URLs, headers and text bodies; see ``flow_search.search``."""
+        with self._read() as conn:
+            # Deleted and cleared flows stay indexed until they are compacted
+            return search(conn, query, limit, before,
+                          visible=f"{_visible('rowid')} AND rowid NOT IN (SELECT flow_id FROM tombstones)")
+
+    def raw_request(self, log_id: int) -> Optional[str]:
+        """Render a flow's request as raw HTTP from its stored fields.
+
+        Rows imported with a ready-made ``raw_request`` return it unchanged.
+        """
+        with self._read() as conn:
+            row = conn.execute(self._SELECT + f" WHERE f.id = ? AND {_visible()}", (log_id,)).fetchone()
+        if row is None:
+            return None
+        if row["raw_request"] is not None:
+            return row["raw_request"]
+        request: Dict[str, Any] = {}
+        self._body(request, row, "request")
+        return render_raw_request(
+            row["method"],
+            row["url"],
+            row["http_version"],
+            json.loads(row["request_headers"] or "{}"),
+            request["content"]
+        )
+
+    def body_ref(self, log_id: int, side: str) -> Optional[Dict[str, Any]]:
+        """Locate one side's body blob without reading it.
+
+        Returns None if the flow doesn't exist; ``hash`` is None if it has no body.
+        """
+        if side not in ("request", "response"):
+            raise ValueError(f"Unknown body side: {side}")
+        row = self._connection().execute(
+            f"SELECT f.{side}_body_hash, f.{side}_body_size, f.{side}_headers, b.codec "
+            f"FROM flows f LEFT JOIN blobs b ON b.hash = f.{side}_body_hash WHERE f.id = ? AND {_visible()}",
+            (log_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "hash": row[0],
+            "size": row[1],
+            "headers": headers_dict(json.loads(row[2] or "{}")),
+            "codec": row[3] or "none",
+            "path": self.blobs.path(row[0]) if row[0] else None,
+        }
+
+    def delete(self, log_id: int) -> bool:
+        return bool(self.tombstone(ids=[log_id]))
+
+    def tombstone(self, ids: Iterable[int] = (), ranges: Iterable[Tuple[int, int]] = (),
+                  flow_filter: Optional[FlowFilter] = None) -> List[int]:
+        """Delete the flows with any of ``ids``, in any inclusive ID range or matching ``flow_filter``.
+
+        Rows move to ``tombstones`` in one transaction; nothing else is touched
+        until ``compact``. Returns the deleted IDs in order.
+        """
+        conditions: List[Tuple[str, List[Any]]] = []
+        ids = list(ids)
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            conditions.append((f"id IN ({','.join('?' * len(chunk))})", chunk))
+        for low, high in ranges:
+            conditions.append(("id BETWEEN ? AND ?", [low, high]))
+        if flow_filter is not None:
+            conditions.append((flow_filter.sql, flow_filter.params))
+        if not conditions:
+            return []
+
+        deleted: List[int] = []
+        with self._write() as conn:
+            for where, params in conditions:
+                deleted.extend(self._tombstone(conn, f"{where} AND {_visible()}", params))
+        return sorted(deleted)
+
+    @staticmethod
+    def _tombstone(conn: sqlite3.Connection, where: str, params: Sequence[Any]) -> List[int]:
+        flow_ids = [row[0] for row in conn.execute(f"SELECT id FROM flows WHERE {where}", params)]
+        conn.execute(
+            "INSERT OR REPLACE INTO tombstones (flow_id, request_body_hash, response_body_hash) "
+            f"SELECT id, request_body_hash, response_body_hash FROM flows WHERE {where}",
+            params
+        )
+        conn.execute(f"DELETE FROM flows WHERE {where}", params)
+        return flow_ids
+
+    def pending_tombstones(self) -> int:
+        """Deleted or cleared flows whose data the compactor hasn't released yet."""
+        conn = self._connection()
+        hidden = conn.execute(f"SELECT COUNT(*) FROM flows WHERE id < {_CLEAR_FLOOR}").fetchone()[0]
+        return hidden + conn.execute("SELECT COUNT(*) FROM tombstones").fetchone()[0]
+
+    def purge_cleared(self, limit: int = 500) -> int:
+        """Tombstone up to ``limit`` of the flows hidden by ``clear``; returns how many."""
+        with self._write() as conn:
+            last = conn.execute(
+                f"SELECT MAX(id) FROM (SELECT id FROM flows WHERE id < {_CLEAR_FLOOR} ORDER BY id LIMIT ?)",
+                (limit,)
+            ).fetchone()[0]
+            if last is None:
+                return 0
+            return len(self._tombstone(conn, f"id <= ? AND id < {_CLEAR_FLOOR}", [last]))
+
+    def compact(self, limit: int = 500) -> Dict[str, int]:
+        """Release the index rows and blob references of up to ``limit`` deleted flows.
+
+        Returns counts of flows compacted and blobs freed, and the blob bytes freed on disk.
+        """
+        with self._write() as conn:
+            rows = conn.execute(
+                "SELECT flow_id, request_body_hash, response_body_hash FROM tombstones ORDER BY flow_id LIMIT ?",
+                (limit,)
+            ).fetchall()
+            flow_ids = [row[0] for row in rows]
+            unindex_flows(conn, flow_ids)
+            blobs, freed_bytes = self._release_blobs(conn, (digest for row in rows for digest in (row[1], row[2])))
+            conn.executemany("DELETE FROM tombstones WHERE flow_id = ?", ((flow_id,) for flow_id in flow_ids))
+        return {"flows": len(flow_ids), "blobs": blobs, "bytes": freed_bytes}
+
+    def reclaim_space(self) -> int:
+        """Return free database pages to the filesystem where possible; returns bytes given back."""
+        conn = self._connection()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        before = conn.execute("PRAGMA page_count").fetchone()[0]
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            conn.execute("PRAGMA incremental_vacuum").fetchall()
+        # Passive, so it never waits on the capture writer or readers
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+        after = conn.execute("PRAGMA page_count").fetchone()[0]
+        return max(0, before - after) * page_size
+
+    def count(self, flow_filter: Optional[FlowFilter] = None) -> int:
+        if flow_filter is None:
+            return len(self)
+        return self._connection().execute(
+            f"SELECT COUNT(*) FROM flows WHERE {_visible()} AND {flow_filter.sql}", flow_filter.params
+        ).fetchone()[0]
+
+    def clear(self) -> int:
+        """Remove every flow at once, whatever the store holds; returns the new clear floor.
+
+        Flows below the floor (every ID handed out so far) disappear from all
+        reads immediately; their rows, bodies and index entries are freed in
+        the background by ``purge_cleared`` and ``compact``.
+        """
+        with self._write() as conn:
+            floor = peek_next_id(conn)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (CLEAR_FLOOR_KEY, floor))
+        return floor
+
+    def replace(self, entries: Iterable[Dict[str, Any]]):
+        """Replace all flows with ``entries``, preserving their IDs.
+
+        The allocator only moves forward, so later captures never collide with
+        imported IDs and never reuse IDs handed out before the import.
+        """
+        with self._write() as conn:
+            self._delete_all(conn)
+            last_id = 0
+            for entry in entries:
+                last_id = max(last_id, self._insert(conn, entry))
+            advance_ids_past(conn, last_id)
+
+    def __len__(self) -> int:
+        return self._connection().execute(f"SELECT COUNT(*) FROM flows WHERE {_visible()}").fetchone()[0]
+
+    def blob_stats(self) -> Dict[str, Any]:
+        """Stored versus referenced body bytes, i.e. how much deduplication and compression save."""
+        row = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(size * refcount), 0), "
+            "COALESCE(SUM(stored_size), 0) FROM blobs"
+        ).fetchone()
+        codecs = {
+            codec: count for codec, count in
+            self._connection().execute("SELECT codec, COUNT(*) FROM blobs GROUP BY codec")
+        }
+        return {
+            "blobs": row[0],
+            "stored_bytes": row[1],
+            "referenced_bytes": row[2],
+            "disk_bytes": row[3],
+            "compression": self.blobs.codec,
+            "codecs": codecs,
+        }
+
+    # ------------------------------------------------------------------
+    # Schema upgrades
+    # ------------------------------------------------------------------
+
+    def _upgrade(self, conn: sqlite3.Connection, version: int):
+        """Bring a database created by an older version up to ``SCHEMA_VERSION``."""
+        logger.info(f"Upgrading flow store schema from version {version} to {SCHEMA_VERSION}")
+        for table, added in ADDED_COLUMNS.items():
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for column, column_type in added.items():
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+        if version < 2:
+            # Version 1 kept bodies inline in per-side tables; move them into blobs
+            for side in ("request", "response"):
+                rows = conn.execute(f"SELECT flow_id, content FROM {side}_bodies").fetchall()
+                for flow_id, content in rows:
+                    digest, size = self._acquire_blob(conn, content)
+                    conn.execute(
+                        f"UPDATE flows SET {side}_body_hash = ?, {side}_body_size = ? WHERE id = ?",
+                        (digest, size, flow_id)
+                    )
+                conn.execute(f"DROP TABLE {side}_bodies")
+
+        if version < 3:
+            # Blobs written before compression existed are plain files
+            conn.execute("UPDATE blobs SET stored_size = size WHERE stored_size IS NULL")
+
+        if version < 5:
+            # The full-text index was added in version 5; index what is already stored
+            backfill(conn, self.blobs, self.search_body_limit)
+
+        conn.execute(
+            "UPDATE meta SET value = ? WHERE key = 'schema_version'", (SCHEMA_VERSION,)
+        )
+
+    # ------------------------------------------------------------------
+    # Migration
+    # ------------------------------------------------------------------
+
+    def _migrate_legacy(self):
+        """One-time import of the segmented history log (and any history.json before it)."""
+        if self.legacy_history_dir is None:
+            return
+
+        # The addon and the API may open the store at the same time; migrate once
+        with open(self.path.with_name(self.path.name + ".migrate.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            has_segments = self.legacy_history_dir.exists()
+            has_file = self.legacy_file is not None and self.legacy_file.exists()
+            if not has_segments and not has_file:
+                return
+
+            try:
+                # HistoryLog folds an old history.json into its segments on open
+                history = HistoryLog(self.legacy_history_dir, legacy_file=self.legacy_file).entries()
+                with self._write() as conn:
+                    if conn.execute("SELECT COUNT(*) FROM flows").fetchone()[0] == 0:
+                        logger.info(f"Migrating {len(history)} entries into {self.path}")
+                        last_id = 0
+                        for entry in history:
+                            last_id = max(last_id, self._insert(conn, entry))
+                        advance_ids_past(conn, last_id)
+                migrated = self.legacy_history_dir.with_name(self.legacy_history_dir.name + ".migrated")
+                suffix = 1
+                while migrated.exists():
+                    migrated = self.legacy_history_dir.with_name(f"{self.legacy_history_dir.name}.migrated.{suffix}")
+                    suffix += 1
+                self.legacy_history_dir.rename(migrated)
+                logger.info(f"Legacy history moved aside: {migrated}")
+            except Exception as e:
+                logger.error(f"Error migrating legacy history: {e}", exc_info=True)
+
+
+# Default location shared by the mitmdump addon and the API routes
+SESSIONS_DIR = Path(os.path.dirname(os.path.abspath(__file__))) / "sessions"
+FLOW_DB = SESSIONS_DIR / "flows.db"
+LEGACY_HISTORY_DIR = SESSIONS_DIR / "history"
+LEGACY_HISTORY_FILE = SESSIONS_DIR / "history.json"
+
+_flow_store: Optional[FlowStore] = None
+_flow_store_lock = threading.Lock()
+
+
+def get_flow_store() -> FlowStore:
+    """Return the process-wide flow store, opening it on first use."""
+    global _flow_store
+    with _flow_store_lock:
+        if _flow_store is None:
+            _flow_store = FlowStore(
+                FLOW_DB,
+                legacy_history_dir=LEGACY_HISTORY_DIR,
+                legacy_file=LEGACY_HISTORY_FILE,
+                compression=settings.body_compression,
+                compression_level=settings.body_compression_level,
+                compression_min_size=settings.body_compression_min_size,
+                preview_size=settings.body_preview_size or None,
+                search_body_limit=settings.search_body_limit
+            )
+            logger.debug(f"Opened flow store at: {FLOW_DB}")
+    return _flow_store
@@ -0,0 +1,250 @@
+"""
+Write-behind pipeline between the proxy addon and the flow store.
+
+mitmproxy hooks hand a lightweight record to ``FlowWriter.submit``, which only
+enqueues it. A dedicated thread turns records into entries and commits them to
+the store in batches (every ``batch_size`` records or ``flush_interval_ms``,
+whichever comes first), so disk latency never lands on a proxied response.
+``on_commit`` is called with each committed batch, with IDs assigned.
+
+``discard_queued`` drops everything submitted so far without touching the
+queue: records carry the generation they were submitted in, and the writer
+thread skips those from before the last discard.
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from api.metrics import ERRORS_METRIC, STAGE_METRIC, metrics
+
+logger = logging.getLogger(__name__)
+
+BACKPRESSURE_POLICIES = ("block", "drop_bodies", "drop_flows")
+
+# With drop_bodies, start stripping bodies once the queue is this full
+DROP_BODIES_HIGH_WATER = 0.75
+
+# Key under which writer counters are stored in the flow store's meta table
+STATS_META_KEY = "writer_stats"
+
+
+def worker_stats_key(worker) -> str:
+    """Meta key for the counters of one of several proxy workers sharing the store."""
+    return f"{STATS_META_KEY}.{worker}"
+
+
+_STOP = object()
+
+
+class _FlushMarker:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class FlowWriter:
+    def __init__(
+        self,
+        store,
+        prepare: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+        batch_size: int = 100,
+        flush_interval_ms: int = 200,
+        queue_size: int = 10000,
+        backpressure: str = "block",
+        on_commit: Optional[Callable[[List[Dict[str, Any]]], Any]] = None,
+        stats_key: str = STATS_META_KEY
+    ):
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {backpressure}")
+        self.store = store
+        self.prepare = prepare or (lambda record: record)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(1, flush_interval_ms) / 1000.0
+        self.backpressure = backpressure
+        self.on_commit = on_commit
+        self.stats_key = stats_key
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self._thread: Optional[threading.Thread] = None
+        self._generation = 0
+        self._counters_lock = threading.Lock()
+        self._counters = {
+            "submitted": 0,
+            "written": 0,
+            "dropped_flows": 0,
+            "dropped_bodies": 0,
+            "discarded": 0,
+            "batches": 0,
+            "errors": 0,
+            "last_batch_size": 0,
+            "last_commit_ms": 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # Producer side (called from mitmproxy hooks)
+    # ------------------------------------------------------------------
+
+    def _count(self, name: str, amount: int = 1):
+        with self._counters_lock:
+            self._counters[name] += amount
+
+    @staticmethod
+    def _strip_bodies(record: Dict[str, Any]) -> Dict[str, Any]:
+        for side in ("request", "response"):
+            part = record.get(side)
+            if isinstance(part, dict) and part.get("content") is not None:
+                discard = getattr(part["content"], "discard", None)
+                if discard is not None:
+                    discard()
+                part["content"] = None
+                part["body_dropped"] = True
+        return record
+
+    def submit(self, record: Dict[str, Any]) -> bool:
+        """Queue a record for writing. Returns False if it was dropped."""
+        self._count("submitted")
+
+        item = (self._generation, record)
+        if self.backpressure == "block":
+            self._queue.put(item)
+            return True
+
+        if self.backpressure == "drop_bodies":
+            if self._queue.qsize() >= self._queue.maxsize * DROP_BODIES_HIGH_WATER:
+                self._strip_bodies(record)
+                self._count("dropped_bodies")
+                metrics.inc("fart_capture_dropped_total", kind="body")
+
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self._count("dropped_flows")
+            metrics.inc("fart_capture_dropped_total", kind="flow")
+            return False
+
+    # ------------------------------------------------------------------
+    # Writer thread
+    # ------------------------------------------------------------------
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="flow-writer", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Flow writer started (batch_size={self.batch_size}, "
+            f"flush_interval={self.flush_interval * 1000:.0f}ms, backpressure={self.backpressure})"
+        )
+
+    def _next_batch(self):
+        """Block for the first record, then gather more until the batch is full or the interval passes."""
+        batch: List[Any] = []
+        item = self._queue.get()
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            batch.append(item)
+            if item is _STOP or isinstance(item, _FlushMarker) or len(batch) >= self.batch_size:
+                return batch
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return batch
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                return batch
+
+    def _commit(self, records: List[Dict[str, Any]]):
+        if not records:
+            return
+        started = time.perf_counter()
+        entries = []
+        for record in records:
+            try:
+                with metrics.time("build_entry"):
+                    entries.append(self.prepare(record))
+            except Exception as e:
+                self._count("errors")
+                logger.error(f"Error preparing flow record: {e}", exc_info=True)
+
+        with self._counters_lock:
+            self._counters["batches"] += 1
+            self._counters["written"] += len(entries)
+            self._counters["last_batch_size"] = len(entries)
+        write_started = time.perf_counter()
+        try:
+            self.store.append_many(entries, meta={self.stats_key: json.dumps(self.stats())})
+        except Exception as e:
+            with self._counters_lock:
+                self._counters["written"] -= len(entries)
+                self._counters["errors"] += 1
+            metrics.inc(ERRORS_METRIC, stage="store_write")
+            logger.error(f"Error committing {len(entries)} flows: {e}", exc_info=True)
+            return
+        finished = time.perf_counter()
+        metrics.observe(STAGE_METRIC, finished - write_started, stage="store_write")
+        metrics.inc("fart_flows_written_total", len(entries))
+        with self._counters_lock:
+            self._counters["last_commit_ms"] = round((finished - started) * 1000, 3)
+        logger.debug(f"Committed batch of {len(entries)} flows")
+        if self.on_commit is not None and entries:
+            try:
+                self.on_commit(entries)
+            except Exception as e:
+                logger.error(f"Error in commit callback: {e}", exc_info=True)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            generation = self._generation
+            records = []
+            for item in batch:
+                if not isinstance(item, tuple):
+                    continue
+                if item[0] == generation:
+                    records.append(item[1])
+                else:
+                    self._strip_bodies(item[1])
+                    self._count("discarded")
+            self._commit(records)
+            for item in batch:
+                if isinstance(item, _FlushMarker):
+                    item.done.set()
+            if batch[-1] is _STOP:
+                return
+
+    # ------------------------------------------------------------------
+    # Control and introspection
+    # ------------------------------------------------------------------
+
+    def discard_queued(self):
+        """Drop every record submitted so far that hasn't been committed yet, e.g. after a clear."""
+        self._generation += 1
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued so far has been committed."""
+        if not self._thread or not self._thread.is_alive():
+            return True
+        marker = _FlushMarker()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def stop(self, timeout: float = 10.0):
+        """Commit whatever is queued and stop the writer thread."""
+        if not self._thread:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning("Flow writer did not stop within timeout")
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counters_lock:
+            stats = dict(self._counters)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["queue_capacity"] = self._queue.maxsize
+        stats["backpressure"] = self.backpressure
+        return stats
@@ -0,0 +1,351 @@
+"""
+Append-only, segmented on-disk history of captured flows.
+
+This was the live history format before the SQLite flow store; it is kept so
+existing ``sessions/history`` directories can be migrated by ``api.flow_store``.
+
+Each flow is stored as one JSON line in a segment file (``segment-000001.jsonl``).
+When the active segment grows past ``segment_max_bytes`` it is sealed and a new
+one is started. A small ``index.json`` records the ID range of every segment so
+single-entry operations only touch the segment that holds the entry.
+
+Writers from different processes (the mitmdump addon and the API) coordinate
+through an advisory lock file, so appending a flow is a single O(1) write.
+"""
+
+import bisect
+import fcntl
+import json
+import logging
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seal the active segment once it grows past this size
+DEFAULT_SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+
+INDEX_VERSION = 1
+
+
+class HistoryLog:
+    def __init__(self, directory, legacy_file=None, segment_max_bytes: int = DEFAULT_SEGMENT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.legacy_file = Path(legacy_file) if legacy_file else None
+        self.segment_max_bytes = segment_max_bytes
+        self.index_file = self.directory / "index.json"
+        self.lock_file = self.directory / ".lock"
+
+        # Cached view of the index, refreshed whenever another process changes it
+        self._index: Dict[str, Any] = self._empty_index()
+        self._index_stamp = None
+        self._active_size = 0
+        self._active_last_id = 0
+        self._active_torn = False
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self._locked():
+            self._migrate_legacy()
+
+    # ------------------------------------------------------------------
+    # Index and locking helpers
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _empty_index() -> Dict[str, Any]:
+        return {"version": INDEX_VERSION, "next_id": 1, "segments": []}
+
+    @staticmethod
+    def _segment_name(number: int) -> str:
+        return f"segment-{number:06d}.jsonl"
+
+    @contextmanager
+    def _locked(self):
+        """Hold the cross-process writer lock and a fresh view of the index."""
+        with open(self.lock_file, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _stamp(self, path: Path):
+        try:
+            st = os.stat(path)
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _refresh(self):
+        """Reload the index and active segment tail if another writer changed them."""
+        stamp = self._stamp(self.index_file)
+        if stamp != self._index_stamp:
+            if stamp is None:
+                self._index = self._empty_index()
+            else:
+                with open(self.index_file, "r") as f:
+                    self._index = json.load(f)
+            self._index_stamp = stamp
+            self._active_size = -1
+
+        active = self._active_segment()
+        if active is None:
+            self._active_size = 0
+            self._active_last_id = 0
+            self._active_torn = False
+            return
+
+        path = self.directory / active["name"]
+        size = os.path.getsize(path) if path.exists() else 0
+        if size != self._active_size:
+            self._active_size = size
+            self._active_last_id = self._read_last_id(path)
+            self._active_torn = size > 0 and self._read_last_byte(path) != b"\n"
+
+    def _write_index(self):
+        tmp = self.index_file.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self._index, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.index_file)
+        self._index_stamp = self._stamp(self.index_file)
+
+    def _active_segment(self) -> Optional[Dict[str, Any]]:
+        segments = self._index["segments"]
+        return segments[-1] if segments else None
+
+    @staticmethod
+    def _read_last_byte(path: Path) -> bytes:
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1)
+
+    @staticmethod
+    def _read_last_id(path: Path) -> int:
+        """Return the ID of the last complete line in a segment, reading only its tail."""
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            block = 4096
+            data = b""
+            while end > 0:
+                start = max(0, end - block)
+                f.seek(start)
+                data = f.read(end - start) + data
+                end = start
+                lines = data.split(b"\n")
+                # A partial first line is only trustworthy once we reached the file start
+                candidates = lines if start == 0 else lines[1:]
+                for line in reversed(candidates):
+                    if not line.strip():
+                        continue
+                    try:
+                        return int(json.loads(line).get("id", 0))
+                    except (ValueError, AttributeError):
+                        # Torn write from a crash; keep looking further back
+                        continue
+                block *= 2
+        return 0
+
+    def _next_id(self) -> int:
+        sealed_last = max((s.get("last_id", 0) for s in self._index["segments"][:-1]), default=0)
+        return max(self._index.get("next_id", 1), sealed_last + 1, self._active_last_id + 1)
+
+    # ------------------------------------------------------------------
+    # Segment I/O
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _read_segment(path: Path) -> List[Dict[str, Any]]:
+        entries = []
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        logger.warning(f"Skipping corrupt line in {path.name}")
+        except FileNotFoundError:
+            logger.warning(f"Segment {path.name} listed in index but missing")
+        return entries
+
+    def _rewrite_segment(self, segment: Dict[str, Any], entries: List[Dict[str, Any]]):
+        path = self.directory / segment["name"]
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        segment["count"] = len(entries)
+
+    def _start_segment(self, first_id: int) -> Dict[str, Any]:
+        numbers = [int(s["name"][8:14]) for s in self._index["segments"]]
+        segment = {
+            "name": self._segment_name(max(numbers, default=0) + 1),
+            "first_id": first_id,
+            "last_id": first_id,
+            "count": 0,
+        }
+        self._index["segments"].append(segment)
+        (self.directory / segment["name"]).touch()
+        self._active_size = 0
+        self._active_last_id = 0
+        self._active_torn = False
+        return segment
+
+    def _seal_active(self):
+        active = self._active_segment()
+        if active is not None:
+            active["last_id"] = self._active_last_id or active["last_id"]
+            active["count"] = len(self._read_segment(self.directory / active["name"]))
+
+    def _segment_for(self, log_id: int) -> Optional[Dict[str, Any]]:
+        segments = self._index["segments"]
+        firsts = [s["first_id"] for s in segments]
+        pos = bisect.bisect_right(firsts, log_id) - 1
+        return segments[pos] if pos >= 0 else None
+
+    def _write_all(self, entries: List[Dict[str, Any]]):
+        """Replace the whole log with ``entries``. Caller must hold the lock."""
+        for segment in self._index["segments"]:
+            try:
+                os.remove(self.directory / segment["name"])
+            except FileNotFoundError:
+                pass
+        next_id = self._next_id()
+        self._index = self._empty_index()
+
+        segment = None
+        size = 0
+        handle = None
+        try:
+            for entry in sorted(entries, key=lambda e: int(e.get("id", 0))):
+                line = json.dumps(entry, separators=(",", ":")) + "\n"
+                if segment is None or size >= self.segment_max_bytes:
+                    if handle:
+                        handle.close()
+                        segment["count"] = count
+                    segment = self._start_segment(int(entry["id"]))
+                    handle = open(self.directory / segment["name"], "a")
+                    size = 0
+                    count = 0
+                handle.write(line)
+                size += len(line)
+                count += 1
+                segment["last_id"] = int(entry["id"])
+        finally:
+            if handle:
+                handle.close()
+                segment["count"] = count
+
+        last_id = max((int(e.get("id", 0)) for e in entries), default=0)
+        self._index["next_id"] = max(next_id, last_id + 1) if entries else next_id
+        self._write_index()
+        self._refresh()
+
+    def _migrate_legacy(self):
+        """One-time import of the old single-file ``history.json``."""
+        if not self.legacy_file or not self.legacy_file.exists():
+            return
+        try:
+            with open(self.legacy_file, "r") as f:
+                history = json.load(f)
+        except Exception as e:
+            logger.error(f"Could not read legacy history file {self.legacy_file}: {e}", exc_info=True)
+            return
+
+        if history and not self._index["segments"]:
+            logger.info(f"Migrating {len(history)} entries from {self.legacy_file}")
+            self._write_all(history)
+        self.legacy_file.rename(self.legacy_file.with_name(self.legacy_file.name + ".migrated"))
+        logger.info(f"Legacy history file moved aside: {self.legacy_file}.migrated")
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def append(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Assign the next ID to ``entry`` and append it to the active segment."""
+        with self._locked():
+            entry["id"] = self._next_id()
+            active = self._active_segment()
+            if active is None or self._active_size >= self.segment_max_bytes:
+                self._seal_active()
+                active = self._start_segment(entry["id"])
+                self._write_index()
+
+            line = json.dumps(entry, separators=(",", ":")) + "\n"
+            if self._active_torn:
+                # Terminate a line left half-written by a crashed writer
+                line = "\n" + line
+            with open(self.directory / active["name"], "a") as f:
+                f.write(line)
+            self._active_size += len(line.encode("utf-8"))
+            self._active_last_id = entry["id"]
+            self._active_torn = False
+            return entry
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        with self._locked():
+            names = [s["name"] for s in self._index["segments"]]
+        for name in names:
+            yield from self._read_segment(self.directory / name)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Return all entries in ID order."""
+        return list(self)
+
+    def get(self, log_id: int) -> Optional[Dict[str, Any]]:
+        """Return a single entry, reading only the segment that holds it."""
+        with self._locked():
+            segment = self._segment_for(log_id)
+            if segment is None:
+                return None
+            for entry in self._read_segment(self.directory / segment["name"]):
+                if entry.get("id") == log_id:
+                    return entry
+        return None
+
+    def delete(self, log_id: int) -> bool:
+        """Delete one entry by rewriting only the segment that holds it."""
+        with self._locked():
+            segment = self._segment_for(log_id)
+            if segment is None:
+                return False
+            entries = self._read_segment(self.directory / segment["name"])
+            remaining = [e for e in entries if e.get("id") != log_id]
+            if len(remaining) == len(entries):
+                return False
+            # Never hand a deleted ID out again
+            self._index["next_id"] = self._next_id()
+            self._rewrite_segment(segment, remaining)
+            self._write_index()
+            self._refresh()
+            return True
+
+    def clear(self):
+        """Remove every entry."""
+        with self._locked():
+            self._write_all([])
+
+    def replace(self, entries: List[Dict[str, Any]]):
+        """Replace the whole log with ``entries``, preserving their IDs."""
+        with self._locked():
+            self._write_all(entries)
+
+    def __len__(self) -> int:
+        with self._locked():
+            sealed = sum(s.get("count", 0) for s in self._index["segments"][:-1])
+            active = self._active_segment()
+        if active is None:
+            return sealed
+        return sealed + len(self._read_segment(self.directory / active["name"]))
@@ -0,0 +1,73 @@
+"""
+Monotonic flow ID allocator shared by capture, the repeater and session import.
+
+The next free ID is a single row in the flow store's ``meta`` table. Reserving
+IDs is one UPDATE inside the caller's write transaction, so it costs O(1), is
+serialised across processes by SQLite's write lock, and is crash-safe: an ID
+range is only ever handed out once, even if the process dies right after.
+"""
+
+import sqlite3
+import threading
+from typing import Optional
+
+NEXT_ID_KEY = "next_id"
+
+
+def initialize_ids(conn: sqlite3.Connection):
+    """Seed the allocator from existing flows the first time a database is opened."""
+    conn.execute(
+        "INSERT OR IGNORE INTO meta (key, value) "
+        "SELECT ?, COALESCE(MAX(id), 0) + 1 FROM flows",
+        (NEXT_ID_KEY,)
+    )
+
+
+def reserve_ids(conn: sqlite3.Connection, count: int = 1) -> range:
+    """Reserve ``count`` consecutive IDs. Must run inside a write transaction."""
+    if count < 1:
+        return range(0)
+    conn.execute(
+        "UPDATE meta SET value = value + ? WHERE key = ?",
+        (count, NEXT_ID_KEY)
+    )
+    end = conn.execute("SELECT value FROM meta WHERE key = ?", (NEXT_ID_KEY,)).fetchone()[0]
+    return range(end - count, end)
+
+
+def peek_next_id(conn: sqlite3.Connection) -> int:
+    """The first ID the next reservation will hand out, without reserving it."""
+    return conn.execute("SELECT value FROM meta WHERE key = ?", (NEXT_ID_KEY,)).fetchone()[0]
+
+
+def advance_ids_past(conn: sqlite3.Connection, last_id: int):
+    """Make sure IDs up to ``last_id`` are never handed out. Never moves backwards."""
+    conn.execute(
+        "UPDATE meta SET value = MAX(value, ?) WHERE key = ?",
+        (int(last_id) + 1, NEXT_ID_KEY)
+    )
+
+
+class IdAllocator:
+    """Hands out single IDs from blocks reserved in the flow store."""
+
+    def __init__(self, store, block_size: int = 1):
+        self.store = store
+        self.block_size = max(1, block_size)
+        self._block: Optional[range] = None
+        self._position = 0
+        self._lock = threading.Lock()
+
+    def allocate(self) -> int:
+        """Return the next ID, reserving a new block only when the current one is used up."""
+        with self._lock:
+            if self._block is None or self._position >= len(self._block):
+                self._block = self.store.reserve_ids(self.block_size)
+                self._position = 0
+            allocated = self._block[self._position]
+            self._position += 1
+            return allocated
+
+    def reserve(self, count: int) -> range:
+        """Reserve a contiguous range of IDs, e.g. for a batched writer."""
+        return self.store.reserve_ids(count)
@@ -0,0 +1,365 @@
+"""
+Batch sender that replays one request with payloads swapped into marked positions.
+
+Positions are marked in the URL, header text or body as ``§default§``. Payload
+sources are generators that are re-created as needed and never held in memory,
+so a wordlist file or a brute-force charset can be arbitrarily long. The attack
+type decides how payloads fill the positions, as in Burp Intruder:
+
+- ``sniper``: one source, each position in turn; the others keep their default
+- ``battering_ram``: one source, the same payload in every position
+- ``pitchfork``: one source per position, advanced together
+- ``cluster_bomb``: one source per position, every combination
+
+``Attack`` sends with at most ``concurrency`` requests in flight, no faster
+than a token bucket allows, retrying transport errors and chosen statuses.
+It yields one result per request, in completion order, and hands every
+response to a ``FlowWriter`` so they reach the flow store in batches.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import logging
+import math
+import os
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import httpx
+
+from api.config import settings
+from api.flow_store import SESSIONS_DIR
+from api.metrics import metrics
+from api.raw_http import parse_header_block
+
+logger = logging.getLogger(__name__)
+
+MARKER = "§"
+_POSITION = re.compile(f"{MARKER}([^{MARKER}]*){MARKER}")
+
+ATTACK_TYPES = ("sniper", "battering_ram", "pitchfork", "cluster_bomb")
+PAYLOAD_TYPES = ("list", "file", "numbers", "brute_force")
+
+# Results that may wait for the client before senders pause, per unit of concurrency
+RESULT_BUFFER_PER_WORKER = 4
+
+PayloadSource = Callable[[], Iterator[str]]
+
+
+# ----------------------------------------------------------------------
+# Payload sources
+# ----------------------------------------------------------------------
+
+def wordlist_dir() -> Path:
+    if settings.intruder_wordlist_dir:
+        return Path(settings.intruder_wordlist_dir)
+    return SESSIONS_DIR / "wordlists"
+
+
+def wordlist_path(name: str) -> str:
+    """Resolve a wordlist name inside ``wordlist_dir``; raises ValueError for anything outside it.
+
+    The API is reachable from the network, so a caller must never get to read
+    arbitrary server files through a payload set.
+    """
+    root = os.path.realpath(wordlist_dir())
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root or path == root:
+        raise ValueError(f"Wordlist {name!r} is outside the wordlist directory")
+    return path
+
+
+def _read_lines(path: str) -> Iterator[str]:
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if line:
+                yield line
+
+
+def payload_source(spec: Dict[str, Any]) -> Tuple[PayloadSource, Optional[int]]:
+    """A factory for a fresh iterator over the payloads ``spec`` describes, and their count if known.
+
+    ``spec`` has a ``type`` of ``list`` (``values``), ``file`` (``path`` within
+    the wordlist directory, one payload per line), ``numbers`` (``start``, ``stop`` inclusive, ``step``,
+    optional ``format`` such as ``{:04d}``) or ``brute_force`` (``charset``,
+    ``min_length``, ``max_length``). Raises ValueError if it is invalid.
+    """
+    kind = spec.get("type")
+    if kind == "list":
+        values = [str(value) for value in spec.get("values") or []]
+        return (lambda: iter(values)), len(values)
+    if kind == "file":
+        name = spec.get("path")
+        if not name:
+            raise ValueError("A file payload needs a path")
+        path = wordlist_path(name)
+        if not os.path.isfile(path):
+            # Fail now rather than mid-attack
+            raise ValueError(f"Wordlist {name!r} not found")
+        return (lambda: _read_lines(path)), None
+    if kind == "numbers":
+        start, stop, step = spec.get("start") or 0, spec.get("stop"), spec.get("step") or 1
+        if stop is None:
+            raise ValueError("A numbers payload needs a stop value")
+        numbers = range(start, stop + (1 if step > 0 else -1), step)
+        pattern = spec.get("format") or "{}"
+        try:
+            pattern.format(start)
+        except (ValueError, IndexError, KeyError) as e:
+            raise ValueError(f"Invalid number format {pattern!r}: {e}")
+        return (lambda: (pattern.format(number) for number in numbers)), len(numbers)
+    if kind == "brute_force":
+        charset = spec.get("charset") or ""
+        low, high = spec.get("min_length") or 1, spec.get("max_length") or 1
+        if not charset or low < 1 or high < low:
+            raise ValueError("A brute_force payload needs a charset and 1 <= min_length <= max_length")
+
+        def brute_force():
+            for length in range(low, high + 1):
+                for chars in itertools.product(charset, repeat=length):
+                    yield "".join(chars)
+
+        return brute_force, sum(len(charset) ** length for length in range(low, high + 1))
+    raise ValueError(f"Unknown payload type {kind!r}; expected one of {', '.join(PAYLOAD_TYPES)}")
+
+
+def _product(sources: Sequence[PayloadSource]) -> Iterator[Tuple[str, ...]]:
+    """Every combination, re-creating inner sources instead of holding them like itertools.product."""
+    if not sources:
+        yield ()
+        return
+    for value in sources[0]():
+        for rest in _product(sources[1:]):
+            yield (value,) + rest
+
+
+# ----------------------------------------------------------------------
+# Request template
+# ----------------------------------------------------------------------
+
+class RequestTemplate:
+    """A request whose URL, header text and body have ``§``-marked payload positions."""
+
+    FIELDS = ("url", "headers", "body")
+
+    def __init__(self, method: str, url: str, headers: str, body: str):
+        self.method = method
+        # Each field split into literal, default, literal, ..., literal
+        self._parts = {field: _POSITION.split(text or "") for field, text in zip(self.FIELDS, (url, headers, body))}
+        self.defaults: List[str] = [
+            default for field in self.FIELDS for default in self._parts[field][1::2]
+        ]
+
+    @property
+    def positions(self) -> int:
+        return len(self.defaults)
+
+    def render(self, values: Sequence[str]) -> Dict[str, str]:
+        rendered, position = {}, 0
+        for field in self.FIELDS:
+            parts = self._parts[field]
+            out = [parts[0]]
+            for literal in parts[2::2]:
+                out.append(values[position])
+                out.append(literal)
+                position += 1
+            rendered[field] = "".join(out)
+        return rendered
+
+
+def combinations(attack_type: str, template: RequestTemplate,
+                 sources: List[Tuple[PayloadSource, Optional[int]]]) -> Tuple[Callable[[], Iterator[Tuple[Optional[int], List[str], List[str]]]], Optional[int]]:
+    """A factory for ``(position, payloads, values for every position)`` per request, and the request count if known.
+
+    ``position`` is the position a sniper attack is filling (None otherwise).
+    Raises ValueError if the sources don't suit the attack type and template.
+    """
+    if attack_type not in ATTACK_TYPES:
+        raise ValueError(f"Unknown attack type {attack_type!r}; expected one of {', '.join(ATTACK_TYPES)}")
+    positions = template.positions
+    if not positions:
+        raise ValueError(f"No payload positions; mark them as {MARKER}value{MARKER}")
+    factories = [factory for factory, _ in sources]
+    counts = [count for _, count in sources]
+
+    if attack_type in ("sniper", "battering_ram"):
+        if len(sources) != 1:
+            raise ValueError(f"A {attack_type} attack takes exactly one payload set")
+        [factory], [count] = factories, counts
+        if attack_type == "sniper":
+            def sniper():
+                for position in range(positions):
+                    for payload in factory():
+                        values = list(template.defaults)
+                        values[position] = payload
+                        yield position, [payload], values
+            return sniper, None if count is None else count * positions
+        return (lambda: ((None, [payload], [payload] * positions) for payload in factory())), count
+
+    if len(sources) != positions:
+        raise ValueError(f"A {attack_type} attack takes one payload set per position ({positions})")
+    known = None if None in counts else counts
+    if attack_type == "pitchfork":
+        rows = lambda: zip(*(factory() for factory in factories))  # noqa: E731
+        total = None if known is None else min(known)
+    else:
+        rows = lambda: _product(factories)  # noqa: E731
+        total = None if known is None else math.prod(known)
+    return (lambda: ((None, list(row), list(row)) for row in rows())), total
+
+
+# ----------------------------------------------------------------------
+# Sending
+# ----------------------------------------------------------------------
+
+class TokenBucket:
+    """Allows ``rate`` acquisitions per second on average, and bursts of up to ``burst``."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = max(1, burst or math.ceil(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _flow_entry(method: str, url: str, headers: List[List[str]], body: str,
+                response: httpx.Response) -> Dict[str, Any]:
+    """The flow store entry for one response, shaped like a captured flow."""
+    return {
+        "id": None,
+        "timestamp": datetime.now().isoformat(),
+        "method": method,
+        "url": url,
+        "status": response.status_code,
+        "content_length": len(response.content),
+        "request": {
+            "method": method,
+            "url": url,
+            "http_version": response.http_version,
+            "headers": headers,
+            "content": body.encode() if body else None
+        },
+        "response": {
+            "status_code": response.status_code,
+            "headers": [[name, value] for name, value in response.headers.multi_items()],
+            "content": response.content or None
+        }
+    }
+
+
+class Attack:
+    def __init__(self, template: RequestTemplate, rows: Callable[[], Iterator[Tuple[Optional[int], List[str], List[str]]]],
+                 send: Callable[..., Any], writer=None, concurrency: int = 10,
+                 rate_limit: Optional[float] = None, burst: Optional[int] = None, retries: int = 0,
+                 retry_statuses: Sequence[int] = (), retry_backoff: float = 0.2):
+        """``send(method, url, headers=..., content=...)`` returns an ``httpx.Response``; ``writer`` stores them."""
+        self.template = template
+        self.rows = rows
+        self.send = send
+        self.writer = writer
+        self.concurrency = max(1, concurrency)
+        self.bucket = TokenBucket(rate_limit, burst) if rate_limit else None
+        self.retries = max(0, retries)
+        self.retry_statuses = set(retry_statuses)
+        self.retry_backoff = retry_backoff
+        self.sent = 0
+        self.errors = 0
+
+    async def _request(self, index: int, position: Optional[int], payloads: List[str],
+                       values: List[str]) -> Dict[str, Any]:
+        rendered = self.template.render(values)
+        url, body = rendered["url"], rendered["body"]
+        headers = parse_header_block(rendered["headers"])
+        result: Dict[str, Any] = {"index": index, "position": position, "payloads": payloads}
+        attempts = 0
+        while True:
+            attempts += 1
+            if self.bucket is not None:
+                await self.bucket.acquire()
+            started = time.perf_counter()
+            response, error = None, None
+            try:
+                with metrics.time("intruder_send"):
+                    response = await self.send(self.template.method, url, headers=headers, content=body)
+            except httpx.TransportError as e:
+                error = str(e) or type(e).__name__
+            except httpx.HTTPError as e:
+                # Not worth retrying, e.g. an invalid URL after substitution
+                error, attempts = str(e) or type(e).__name__, self.retries + 1
+            elapsed = time.perf_counter() - started
+            retry = response is None or response.status_code in self.retry_statuses
+            if not retry or attempts > self.retries:
+                break
+            await asyncio.sleep(self.retry_backoff * 2 ** (attempts - 1))
+
+        self.sent += 1
+        metrics.inc("fart_intruder_requests_total")
+        result.update(attempts=attempts, time_ms=round(elapsed * 1000, 3))
+        if response is None:
+            self.errors += 1
+            metrics.inc("fart_intruder_errors_total")
+            result.update(status=None, length=None, body_sha256=None, error=error)
+            return result
+        result.update(
+            status=response.status_code,
+            length=len(response.content),
+            body_sha256=hashlib.sha256(response.content).hexdigest(),
+            error=None
+        )
+        if self.writer is not None:
+            entry = _flow_entry(self.template.method, url, headers, body, response)
+            stats = self.writer.stats()
+            if stats["queue_depth"] < stats["queue_capacity"]:
+                self.writer.submit(entry)
+            else:
+                # The writer is behind; wait for room off the event loop
+                await asyncio.to_thread(self.writer.submit, entry)
+        return result
+
+    async def run(self) -> AsyncIterator[Dict[str, Any]]:
+        """Yield each result as it completes; stopping early (e.g. on disconnect) cancels the rest."""
+        rows = enumerate(self.rows())
+        results: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(
+            maxsize=self.concurrency * RESULT_BUFFER_PER_WORKER
+        )
+
+        async def worker():
+            # Workers share one iterator, so payloads are drawn only as requests go out
+            for index, (position, payloads, values) in rows:
+                await results.put(await self._request(index, position, payloads, values))
+
+        async def supervise(tasks):
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                await results.put(None)
+
+        tasks = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        supervisor = asyncio.create_task(supervise(tasks))
+        try:
+            while True:
+                result = await results.get()
+                if result is None:
+                    break
+                yield result
+            # Surface a failure in payload generation
+            await supervisor
+        finally:
+            for task in tasks + [supervisor]:
+                task.cancel()
+            await asyncio.gather(*tasks, supervisor, return_exceptions=True)
@@ -0,0 +1,361 @@
+"""
+Local message channel between the mitmdump addon and the API process.
+
+The API listens on a Unix domain socket (``IpcServer``, on its asyncio loop)
+and the addon connects to it (``IpcClient``, a background thread that keeps
+reconnecting). Messages are JSON objects with a ``type`` field, one per line,
+in both directions. The server dispatches incoming messages to handlers
+registered per type. A client that is not connected drops what it is asked to
+send, so the proxy never waits on the API.
+
+``IpcServer.request`` sends a message with an ``id`` and collects the replies:
+messages whose ``reply_to`` is that ID, one per client.
+
+An embedded proxy (running inside the API process) uses ``LocalIpcClient``
+instead: the same interface, with messages handed over in memory.
+"""
+
+import asyncio
+import json
+import logging
+import socket
+import itertools
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from api.config import settings
+from api.flow_store import SESSIONS_DIR
+
+logger = logging.getLogger(__name__)
+
+# Longest single message accepted by either side
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+# A stalled API must never hold up the proxy for longer than this
+SEND_TIMEOUT_SECONDS = 1.0
+
+# How long a request waits for replies by default
+REQUEST_TIMEOUT_SECONDS = 5.0
+
+
+def ipc_socket_path() -> Path:
+    if settings.ipc_socket_path:
+        return Path(settings.ipc_socket_path)
+    return SESSIONS_DIR / "proxy.sock"
+
+
+def encode_message(message: Dict[str, Any]) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+class IpcServer:
+    """API side of the channel."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        self._greeters: List[Callable[[], Optional[Dict[str, Any]]]] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers: Set[asyncio.StreamWriter] = set()
+        self._request_ids = itertools.count(1)
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._local: Set["LocalIpcClient"] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def on(self, message_type: str, handler: Callable[[Dict[str, Any]], Any]):
+        """Call ``handler(message)`` for every incoming message of ``message_type``."""
+        self._handlers[message_type] = handler
+
+    def on_connect(self, greeter: Callable[[], Optional[Dict[str, Any]]]):
+        """Send ``greeter()``'s message (if any) to every client as it connects."""
+        self._greeters.append(greeter)
+
+    @property
+    def clients(self) -> int:
+        return len(self._writers) + len(self._local)
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.unlink(missing_ok=True)
+        self._server = await asyncio.start_unix_server(
+            self._handle_client, path=str(self.path), limit=MAX_MESSAGE_BYTES
+        )
+        logger.info(f"IPC server listening on {self.path}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for writer in list(self._writers):
+            writer.close()
+        self._writers.clear()
+        for client in list(self._local):
+            client._connected.clear()
+        self._local.clear()
+        self.path.unlink(missing_ok=True)
+
+    def attach(self, client: "LocalIpcClient"):
+        """Connect an in-process client; safe to call from any thread."""
+        self._call_soon(self._attach, client)
+
+    def detach(self, client: "LocalIpcClient"):
+        client._connected.clear()
+        self._call_soon(self._local.discard, client)
+
+    def _call_soon(self, callback, *args):
+        if self._loop is None:
+            raise RuntimeError("IPC server is not running")
+        self._loop.call_soon_threadsafe(callback, *args)
+
+    def _attach(self, client: "LocalIpcClient"):
+        self._local.add(client)
+        client._connected.set()
+        logger.info(f"In-process IPC client attached ({self.clients} connected)")
+        for greeter in self._greeters:
+            message = greeter()
+            if message is not None:
+                client.deliver(message)
+
+    def dispatch(self, message: Dict[str, Any]):
+        pending = self._pending.get(message.get("reply_to"))
+        if pending is not None:
+            pending["replies"].append(message)
+            if len(pending["replies"]) >= pending["expected"]:
+                pending["done"].set()
+            return
+        handler = self._handlers.get(message.get("type"))
+        if handler is None:
+            logger.debug(f"No IPC handler for message type: {message.get('type')}")
+            return
+        try:
+            handler(message)
+        except Exception as e:
+            logger.error(f"Error handling IPC message {message.get('type')}: {e}", exc_info=True)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        logger.info(f"IPC client connected ({len(self._writers)} connected)")
+        try:
+            for greeter in self._greeters:
+                message = greeter()
+                if message is not None:
+                    writer.write(encode_message(message))
+            await writer.drain()
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    logger.warning("Discarding malformed IPC message")
+                    continue
+                self.dispatch(message)
+        except (ConnectionError, ValueError) as e:
+            logger.warning(f"IPC client connection error: {e}")
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+            logger.info(f"IPC client disconnected ({len(self._writers)} connected)")
+
+    async def broadcast(self, message: Dict[str, Any]) -> int:
+        """Send a message to every connected client. Returns how many got it."""
+        data = encode_message(message)
+        sent = 0
+        for client in list(self._local):
+            client.deliver(message)
+            sent += 1
+        for writer in list(self._writers):
+            try:
+                writer.write(data)
+                await writer.drain()
+                sent += 1
+            except ConnectionError as e:
+                logger.warning(f"Dropping IPC client: {e}")
+                self._writers.discard(writer)
+        return sent
+
+
+    async def request(self, message: Dict[str, Any],
+                      timeout: float = REQUEST_TIMEOUT_SECONDS) -> List[Dict[str, Any]]:
+        """Send a message to every client and wait for their replies.
+
+        Returns the replies that arrived within ``timeout``, which is fewer than
+        the number of clients if some did not answer in time.
+        """
+        request_id = next(self._request_ids)
+        pending = {"replies": [], "expected": float("inf"), "done": asyncio.Event()}
+        self._pending[request_id] = pending
+        try:
+            pending["expected"] = await self.broadcast({**message, "id": request_id})
+            if len(pending["replies"]) < pending["expected"]:
+                try:
+                    await asyncio.wait_for(pending["done"].wait(), timeout)
+                except asyncio.TimeoutError:
+                    logger.warning(
+                        f"IPC {message.get('type')} request got {len(pending['replies'])} "
+                        f"of {pending['expected']} replies in time"
+                    )
+            return list(pending["replies"])
+        finally:
+            del self._pending[request_id]
+
+class IpcClient:
+    """Proxy side of the channel; safe to use from any thread."""
+
+    def __init__(self, path, on_message: Optional[Callable[[Dict[str, Any]], Any]] = None,
+                 reconnect_interval: float = 1.0):
+        self.path = Path(path)
+        self.on_message = on_message
+        self.reconnect_interval = reconnect_interval
+        self._sock: Optional[socket.socket] = None
+        self._send_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._connected = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="ipc-client", daemon=True)
+        self._thread.start()
+
+    def wait_connected(self, timeout: Optional[float] = None) -> bool:
+        return self._connected.wait(timeout)
+
+    def stop(self, timeout: float = 2.0):
+        self._stopped.set()
+        self._close()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def send(self, message: Dict[str, Any]) -> bool:
+        """Send a message if connected. Returns False if it was dropped."""
+        data = encode_message(message)
+        with self._send_lock:
+            sock = self._sock
+            if sock is None:
+                return False
+            try:
+                sock.sendall(data)
+                return True
+            except OSError as e:
+                logger.warning(f"IPC send failed, reconnecting: {e}")
+                self._close()
+                return False
+
+    def _close(self):
+        self._connected.clear()
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(SEND_TIMEOUT_SECONDS)
+                sock.connect(str(self.path))
+            except OSError:
+                sock.close()
+                self._stopped.wait(self.reconnect_interval)
+                continue
+
+            self._sock = sock
+            self._connected.set()
+            logger.info(f"Connected to API over {self.path}")
+            try:
+                self._read(sock)
+            finally:
+                if self._sock is sock:
+                    self._close()
+            if not self._stopped.is_set():
+                logger.info("Lost IPC connection to API")
+                self._stopped.wait(self.reconnect_interval)
+
+    def _read(self, sock: socket.socket):
+        buffer = b""
+        while not self._stopped.is_set():
+            try:
+                chunk = sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            if not chunk:
+                return
+            buffer += chunk
+            if len(buffer) > MAX_MESSAGE_BYTES:
+                logger.warning("IPC message too large, dropping connection")
+                return
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    logger.warning("Discarding malformed IPC message")
+                    continue
+                if self.on_message is not None:
+                    try:
+                        self.on_message(message)
+                    except Exception as e:
+                        logger.error(f"Error handling IPC message: {e}", exc_info=True)
+
+
+class LocalIpcClient:
+    """In-process stand-in for ``IpcClient``, used by the embedded proxy.
+
+    ``send`` schedules the server's handlers on the API loop and broadcasts
+    call ``on_message`` directly, so nothing is encoded or copied.
+    """
+
+    def __init__(self, server: IpcServer, on_message: Optional[Callable[[Dict[str, Any]], Any]] = None):
+        self.server = server
+        self.on_message = on_message
+        self._connected = threading.Event()
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def start(self):
+        self.server.attach(self)
+
+    def wait_connected(self, timeout: Optional[float] = None) -> bool:
+        return self._connected.wait(timeout)
+
+    def stop(self, timeout: float = 2.0):
+        if self.connected:
+            self.server.detach(self)
+
+    def send(self, message: Dict[str, Any]) -> bool:
+        """Hand a message to the server if attached. Returns False if it was dropped."""
+        if not self.connected:
+            return False
+        try:
+            self.server._call_soon(self.server.dispatch, message)
+        except RuntimeError:
+            # The API loop has shut down
+            return False
+        return True
+
+    def deliver(self, message: Dict[str, Any]):
+        if self.on_message is None:
+            return
+        try:
+            self.on_message(message)
+        except Exception as e:
+            logger.error(f"Error handling IPC message: {e}", exc_info=True)
@@ -0,0 +1,280 @@
+"""
+In-memory view of the flow list, kept current by flow events from the proxy addon.
+
+The addon commits flows to the shared store and then publishes a compact
+summary of each (the log table's columns) over the IPC channel. The API applies
+those summaries here, so the live list never re-reads the store: each summary
+is serialized once when it arrives and the cached JSON is reused by every later
+request. Whenever the addon (re)connects the view reloads its summaries from
+the store, which covers anything committed while the channel was down. Full
+flow detail is read from the store per flow, on demand.
+
+Live subscribers (the ``/api/proxy/stream`` SSE endpoint) get a snapshot when
+they subscribe and then one event per change. Each event is framed once and
+the same string is queued to every subscriber.
+
+Every change bumps ``version`` and is recorded in a bounded change log, so a
+polling client holding a cursor (``<epoch>-<version>``) can be sent only what
+changed since. The epoch is random per view, so cursors from before an API
+restart or store switch are never mistaken for current ones.
+"""
+
+import asyncio
+import bisect
+import json
+import logging
+import threading
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from api.flow_store import CLEAR_FLOOR_KEY, SUMMARY_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Frames a subscriber may fall behind by before it is disconnected
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+# Changes remembered for cursor reads; older cursors get the full list again
+CHANGE_LOG_SIZE = 10000
+
+
+def flow_summary(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """The compact record published for each committed flow."""
+    return {column: entry.get(column) for column in SUMMARY_COLUMNS}
+
+
+def json_array(items: List[str]) -> str:
+    """Join already-serialized JSON values into an array."""
+    return "[" + ", ".join(items) + "]"
+
+
+def sse_frame(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+class Subscription:
+    """Queue of framed events for one live client."""
+
+    def __init__(self, limit: Optional[int] = None, max_pending: int = SUBSCRIBER_QUEUE_SIZE):
+        self._queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+        self.limit = limit
+        self.max_pending = max_pending
+        self.closed = False
+
+    def push(self, frame: str):
+        if self.closed:
+            return
+        if self._queue.qsize() >= self.max_pending:
+            # Too slow to keep up; end the stream so it reconnects with a fresh snapshot
+            self.close()
+            return
+        self._queue.put_nowait(frame)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._queue.put_nowait(None)
+
+    async def get(self) -> Optional[str]:
+        """The next frame, or None once the subscription is closed."""
+        return await self._queue.get()
+
+
+class LiveView:
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.RLock()
+        self._ids: List[int] = []
+        self._json: Dict[int, str] = {}
+        self._loaded = False
+        self._subscribers: Set[Subscription] = set()
+        # Bumped on every change to the list
+        self.version = 0
+        self.epoch = uuid.uuid4().hex[:8]
+        # (version, "upsert" or "delete", ids); cursors older than _reset_version can't be replayed
+        self._changes: Deque[Tuple[int, str, List[int]]] = deque(maxlen=CHANGE_LOG_SIZE)
+        self._reset_version = 0
+        # Flows below the store's clear floor are hidden, even if announced late
+        self.clear_floor = 0
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        summaries = self.store.summaries()
+        self.clear_floor = int(self.store.get_meta(CLEAR_FLOOR_KEY, 0) or 0)
+        self._ids = [summary["id"] for summary in summaries]
+        self._json = {summary["id"]: json.dumps(summary) for summary in summaries}
+        self._loaded = True
+        self._reset()
+        logger.debug(f"Live view loaded {len(self._ids)} flows from the store")
+
+    # ------------------------------------------------------------------
+    # Changes
+    # ------------------------------------------------------------------
+
+    def _reset(self):
+        self._changes.clear()
+        self._reset_version = self.version
+
+    def _record(self, kind: str, flow_ids: List[int]):
+        if len(self._changes) == self._changes.maxlen:
+            # The oldest change falls off; cursors from before it can no longer be replayed
+            self._reset_version = self._changes[0][0]
+        self._changes.append((self.version, kind, flow_ids))
+
+    def invalidate(self):
+        """Reload from the store on the next read (right away if anyone is subscribed)."""
+        with self._lock:
+            self._loaded = False
+            self.version += 1
+            if self._subscribers:
+                self._ensure_loaded()
+                self._publish_snapshot()
+
+    def add(self, summaries: Iterable[Dict[str, Any]]):
+        """Apply flows added or updated elsewhere."""
+        summaries = [flow_summary(summary) for summary in summaries]
+        with self._lock:
+            self.version += 1
+            if not self._loaded:
+                return
+            # A batch committed before a clear can arrive after it
+            summaries = [summary for summary in summaries if summary["id"] >= self.clear_floor]
+            if not summaries:
+                return
+            frames = []
+            for summary in summaries:
+                flow_id = summary["id"]
+                if flow_id not in self._json:
+                    if not self._ids or flow_id > self._ids[-1]:
+                        self._ids.append(flow_id)
+                    else:
+                        bisect.insort(self._ids, flow_id)
+                self._json[flow_id] = json.dumps(summary)
+                frames.append(self._json[flow_id])
+            self._record("upsert", [summary["id"] for summary in summaries])
+            self._publish("flows", json_array(frames))
+
+    def remove(self, flow_ids: Iterable[int]):
+        with self._lock:
+            self.version += 1
+            if not self._loaded:
+                return
+            removed = {flow_id for flow_id in flow_ids if flow_id in self._json}
+            if not removed:
+                return
+            self._ids = [flow_id for flow_id in self._ids if flow_id not in removed]
+            for flow_id in removed:
+                del self._json[flow_id]
+            self._record("delete", sorted(removed))
+            self._publish("delete", json.dumps({"ids": sorted(removed)}))
+
+    def clear(self, floor: Optional[int] = None):
+        """Empty the view; ``floor`` is the store's new clear floor, if known."""
+        with self._lock:
+            if floor is not None:
+                self.clear_floor = max(self.clear_floor, floor)
+            self._ids = []
+            self._json = {}
+            self._loaded = True
+            self.version += 1
+            self._reset()
+            self._publish_snapshot()
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._ensure_loaded()
+            return [json.loads(self._json[flow_id]) for flow_id in self._ids]
+
+    def serialized_entries(self, since_id: Optional[int] = None) -> List[str]:
+        """Each flow's summary as JSON, in ID order (only IDs above ``since_id`` if given)."""
+        with self._lock:
+            self._ensure_loaded()
+            ids = self._ids if since_id is None else self._ids[bisect.bisect_right(self._ids, since_id):]
+            return [self._json[flow_id] for flow_id in ids]
+
+    @property
+    def cursor(self) -> str:
+        return f"{self.epoch}-{self.version}"
+
+    def changes_since(self, cursor: Optional[str]) -> Optional[Tuple[List[str], List[int], str]]:
+        """Summaries added or updated, and IDs deleted, since ``cursor``.
+
+        Returns ``(summaries_json, deleted_ids, new_cursor)``, or None when the
+        cursor can't be replayed (unknown, too old, or from before a reload)
+        and the caller should send the full list instead.
+        """
+        epoch, _, version = (cursor or "").rpartition("-")
+        with self._lock:
+            self._ensure_loaded()
+            if epoch != self.epoch or not version.isdigit():
+                return None
+            since = int(version)
+            if since > self.version or since < self._reset_version:
+                return None
+            upserted: Set[int] = set()
+            deleted: Set[int] = set()
+            for change_version, kind, ids in self._changes:
+                if change_version <= since:
+                    continue
+                if kind == "upsert":
+                    upserted.update(ids)
+                    deleted.difference_update(ids)
+                else:
+                    upserted.difference_update(ids)
+                    deleted.update(ids)
+            return [self._json[flow_id] for flow_id in sorted(upserted)], sorted(deleted), self.cursor
+
+    # ------------------------------------------------------------------
+    # Live subscribers
+    # ------------------------------------------------------------------
+
+    def _snapshot_frame(self, limit: Optional[int] = None) -> str:
+        ids = self._ids[-limit:] if limit else self._ids
+        return sse_frame("snapshot", json_array([self._json[flow_id] for flow_id in ids]))
+
+    def _publish(self, event: str, data: str):
+        if not self._subscribers:
+            return
+        frame = sse_frame(event, data)
+        for subscription in list(self._subscribers):
+            subscription.push(frame)
+            if subscription.closed:
+                self._subscribers.discard(subscription)
+
+    def _publish_snapshot(self):
+        frames: Dict[Optional[int], str] = {}
+        for subscription in list(self._subscribers):
+            if subscription.limit not in frames:
+                frames[subscription.limit] = self._snapshot_frame(subscription.limit)
+            subscription.push(frames[subscription.limit])
+            if subscription.closed:
+                self._subscribers.discard(subscription)
+
+    def subscribe(self, limit: Optional[int] = None) -> Subscription:
+        """Start a live feed: a snapshot of the last ``limit`` flows (all by default), then changes."""
+        subscription = Subscription(limit)
+        with self._lock:
+            self._ensure_loaded()
+            subscription.push(self._snapshot_frame(limit))
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+        subscription.close()
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._ids)
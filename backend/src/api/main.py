@@ -1,23 +1,44 @@
-from fastapi import FastAPI, Path, Body, Request
+from fastapi import FastAPI, Path, Body, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import logging
 import os
 
+from api import state
+from api.client_pool import ClientPool
+from api.compactor import Compactor
 from api.config import settings as app_settings
+from api.flow_store import get_flow_store
+from api.ipc import IpcServer, ipc_socket_path
+from api.metrics import metrics
 from api.proxy_control import start_proxy, stop_proxy
 from api.routes import (
     get_proxy_logs,
+    get_proxy_log_page,
+    get_proxy_log,
+    search_proxy_logs,
+    stream_proxy_logs,
     clear_proxy_logs,
     delete_proxy_log,
+    delete_proxy_logs,
+    get_compaction_status,
+    get_proxy_stats,
+    get_proxy_workers,
+    get_proxy_log_body,
+    get_proxy_log_raw_request,
     get_settings,
     update_settings,
     export_session,
     import_session,
-    send_request
+    send_request,
+    get_repeater_pool,
+    run_attack,
+    get_metrics
 )
-from api.routes.settings_routes import SettingsUpdate
+from api.routes.proxy_routes import BulkDeleteRequest, DEFAULT_PAGE_SIZE, DEFAULT_SEARCH_LIMIT, get_live_view
+from api.routes.settings_routes import SettingsUpdate, restore_scope_settings, scope_message
 from api.routes.repeater_routes import RepeaterRequest
+from api.routes.intruder_routes import AttackRequest
 
 # Configure logging
 logging.basicConfig(
@@ -36,6 +57,10 @@ logging.getLogger("api.routes.session_routes").setLevel(logging.DEBUG)
 
 logger = logging.getLogger(__name__)
 
+def _resync_live_view():
+    """Flows committed while the addon was disconnected were never announced; reload them."""
+    get_live_view().invalidate()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
@@ -45,6 +70,27 @@ async def lifespan(app: FastAPI):
         os.makedirs("api/mitmproxy", exist_ok=True)
         os.makedirs("api/sessions", exist_ok=True)
         
+        restore_scope_settings()
+        
+        # Channel the proxy addon reports to; it gets the current scope on connect
+        state.ipc_server = IpcServer(ipc_socket_path())
+        state.ipc_server.on_connect(scope_message)
+        state.ipc_server.on_connect(_resync_live_view)
+        state.ipc_server.on("flows", lambda message: get_live_view().add(message["flows"]))
+        state.ipc_server.on(
+            "metrics",
+            lambda message: metrics.update_remote(message.get("process", "proxy"), message["data"])
+        )
+        await state.ipc_server.start()
+        
+        # Frees the bodies and index entries of deleted flows in the background
+        state.compactor = Compactor(get_flow_store())
+        state.compactor.start()
+        state.compactor.notify()
+        
+        # Repeater clients keep their connections open between sends
+        state.client_pool = ClientPool.from_settings()
+        
         logger.info("FastAPI application ready")
         logger.info("Starting proxy server...")
         start_proxy()
@@ -54,6 +100,9 @@ async def lifespan(app: FastAPI):
         # Shutdown
         logger.info("Stopping proxy server...")
         stop_proxy()
+        state.compactor.stop()
+        await state.client_pool.close()
+        await state.ipc_server.stop()
         
     except Exception as e:
         logger.error(f"Startup error: {str(e)}")
@@ -81,17 +130,85 @@ async def health_check():
 
 # Register routes
 @app.get("/api/proxy/logs")
-async def proxy_logs():
-    return await get_proxy_logs()
+async def proxy_logs(
+    request: Request,
+    since_id: int | None = Query(None, ge=0),
+    cursor: str | None = Query(None, max_length=64),
+    limit: int | None = Query(None, ge=1),
+    sort: str | None = Query(None),
+    order: str | None = Query(None),
+    after: str | None = Query(None, max_length=1024),
+    fields: str | None = Query(None, max_length=512),
+    filter_expression: str | None = Query(None, alias="filter", max_length=2048)
+):
+    if_none_match = request.headers.get("if-none-match")
+    if any(param is not None for param in (limit, sort, order, after, fields, filter_expression)):
+        return await get_proxy_log_page(
+            limit or DEFAULT_PAGE_SIZE, sort or "id", order or "asc", after, fields,
+            filter_expression, if_none_match
+        )
+    return await get_proxy_logs(since_id, cursor, if_none_match)
+
+@app.get("/api/proxy/logs/{log_id}")
+async def proxy_log(log_id: int = Path(..., title="Log ID", ge=1)):
+    return await get_proxy_log(log_id)
+
+@app.get("/api/proxy/search")
+async def proxy_search(
+    q: str = Query(..., min_length=1, max_length=1024),
+    limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1),
+    before: int | None = Query(None, ge=1)
+):
+    return await search_proxy_logs(q, limit, before)
+
+@app.get("/api/proxy/stream")
+async def proxy_stream(limit: int | None = Query(None, ge=1)):
+    return await stream_proxy_logs(limit)
 
 @app.post("/api/proxy/clear")
 async def proxy_clear():
     return await clear_proxy_logs()
 
+@app.delete("/api/proxy/logs")
+async def proxy_delete_matching(filter_expression: str = Query(..., alias="filter", min_length=1, max_length=2048)):
+    return await delete_proxy_logs(filter_expression)
+
+@app.post("/api/proxy/logs/delete")
+async def proxy_bulk_delete(request_data: BulkDeleteRequest):
+    return await delete_proxy_logs(request_data.filter, request_data.ids, request_data.ranges)
+
+@app.get("/api/proxy/compaction")
+async def proxy_compaction():
+    return await get_compaction_status()
+
 @app.delete("/api/proxy/logs/{log_id}")
 async def proxy_delete(log_id: int = Path(..., title="Log ID", ge=1)):
     return await delete_proxy_log(log_id)
 
+@app.get("/api/proxy/logs/{log_id}/raw")
+async def proxy_raw_request(log_id: int = Path(..., title="Log ID", ge=1)):
+    return await get_proxy_log_raw_request(log_id)
+
+@app.get("/api/proxy/logs/{log_id}/request/body")
+async def proxy_request_body(request: Request, log_id: int = Path(..., title="Log ID", ge=1)):
+    return await get_proxy_log_body(log_id, "request", request.headers.get("range"))
+
+@app.get("/api/proxy/logs/{log_id}/response/body")
+async def proxy_response_body(request: Request, log_id: int = Path(..., title="Log ID", ge=1)):
+    return await get_proxy_log_body(log_id, "response", request.headers.get("range"))
+
+@app.get("/api/proxy/stats")
+async def proxy_stats():
+    return await get_proxy_stats()
+
+@app.get("/api/proxy/workers")
+async def proxy_workers():
+    return await get_proxy_workers()
+
+@app.get("/api/metrics")
+async def prometheus_metrics():
+    return await get_metrics()
+
 @app.get("/api/settings")
 async def get_app_settings():
     return await get_settings()
@@ -101,8 +218,8 @@ async def update_app_settings(settings: SettingsUpdate):
     return await update_settings(settings)
 
 @app.post("/api/session/export")
-async def session_export():
-    return await export_session()
+async def session_export(filter_expression: str | None = Query(None, alias="filter", max_length=2048)):
+    return await export_session(filter_expression)
 
 @app.post("/api/session/import")
 async def session_import(request: Request):
@@ -122,6 +239,14 @@ async def session_import(request: Request):
 async def repeater_send(request_data: RepeaterRequest):
     return await send_request(request_data)
 
+@app.get("/api/repeater/pool")
+async def repeater_pool():
+    return await get_repeater_pool()
+
+@app.post("/api/intruder/attack")
+async def intruder_attack(attack: AttackRequest):
+    return await run_attack(attack)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -0,0 +1,281 @@
+"""
+In-process counters, gauges and latency histograms for the capture and API hot paths.
+
+Each process (the API and each mitmdump worker's addon) records into its own
+``metrics`` registry. The addon periodically sends a snapshot of its registry
+to the API over the IPC channel, and ``/api/metrics`` renders the API's own
+registry plus the latest snapshot from every reporting process in Prometheus
+text format, with a ``process`` label telling them apart.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds in seconds; spans sub-millisecond hook work to multi-second sends
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+STAGE_METRIC = "fart_stage_duration_seconds"
+ERRORS_METRIC = "fart_errors_total"
+
+HELP = {
+    STAGE_METRIC: "Time spent in each hot-path stage",
+    ERRORS_METRIC: "Errors raised per stage",
+    "fart_flows_captured_total": "Flows handed to the capture writer",
+    "fart_flows_written_total": "Flows committed to the flow store",
+    "fart_bytes_captured_total": "Request and response body bytes captured",
+    "fart_flows_per_second": "Flows committed per second over the last report interval",
+    "fart_bytes_per_second": "Body bytes captured per second over the last report interval",
+    "fart_capture_queue_depth": "Records waiting in the capture writer queue",
+    "fart_capture_dropped_total": "Flows or bodies dropped by the capture backpressure policy",
+    "fart_flows_out_of_scope_total": "Flows skipped because they matched no scope rule or an exclude rule",
+    "fart_store_flows": "Flows in the flow store",
+    "fart_store_body_bytes": "Uncompressed bytes of stored bodies",
+    "fart_store_disk_bytes": "Bytes of stored bodies on disk",
+    "fart_store_db_bytes": "Size of the flow database files",
+    "fart_store_tombstones": "Deleted flows waiting for the compactor",
+    "fart_flows_compacted_total": "Deleted flows whose bodies and index entries were released",
+    "fart_bytes_reclaimed_total": "Blob and database bytes freed by compaction",
+    "fart_stream_clients": "Clients connected to the live flow stream",
+    "fart_repeater_requests_total": "Requests sent through the repeater",
+    "fart_intruder_requests_total": "Requests sent by intruder attacks, counting retries once",
+    "fart_intruder_errors_total": "Intruder requests that got no response after all retries",
+    "fart_repeater_connections_opened_total": "Connections the repeater opened; the rest of its requests reused one",
+    "fart_repeater_open_connections": "Connections held open by the repeater's client pool",
+    "fart_metrics_report_age_seconds": "Seconds since a process last reported its metrics",
+    "fart_leaf_certs_generated_total": "Leaf certificates signed by the proxy",
+    "fart_leaf_certs_loaded_total": "Leaf certificates loaded from the on-disk cache instead of signed",
+    "fart_proxy_worker_up": "Whether each proxy worker process is running",
+    "fart_proxy_worker_restarts": "Times the supervisor restarted each proxy worker",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Histogram:
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"buckets": list(self.buckets), "counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        # Latest snapshot and arrival time per reporting process
+        self._remote: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def time(self, stage: str):
+        """Record how long the block takes, and count it as an error if it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc(ERRORS_METRIC, stage=stage)
+            raise
+        finally:
+            self.observe(STAGE_METRIC, time.perf_counter() - started, stage=stage)
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get((name, _labels(labels)), 0)
+
+    # ------------------------------------------------------------------
+    # Reporting between processes
+    # ------------------------------------------------------------------
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-serialisable copy of everything recorded so far."""
+        with self._lock:
+            return {
+                "counters": [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+                "gauges": [[name, dict(labels), value] for (name, labels), value in self._gauges.items()],
+                "histograms": [
+                    [name, dict(labels), histogram.to_dict()]
+                    for (name, labels), histogram in self._histograms.items()
+                ],
+            }
+
+    def update_remote(self, process: str, snapshot: Dict[str, Any]):
+        with self._lock:
+            self._remote[process] = (time.monotonic(), snapshot)
+
+    def values(self, process: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Unlabelled counters and gauges: this process's, or the last ``process`` reported (with its age)."""
+        if process is None:
+            snapshot, values = self.snapshot(), {}
+        else:
+            with self._lock:
+                received, snapshot = self._remote.get(process, (None, None))
+            if snapshot is None:
+                return None
+            values = {"report_age_seconds": round(time.monotonic() - received, 3)}
+        for name, labels, value in snapshot.get("counters", []) + snapshot.get("gauges", []):
+            if not labels:
+                values[name] = value
+        return values
+
+    # ------------------------------------------------------------------
+    # Prometheus exposition
+    # ------------------------------------------------------------------
+
+    def render(self, process: str = "api", extra_gauges: Optional[List[Tuple[str, Dict[str, Any], float]]] = None) -> str:
+        """Render this registry and every remote snapshot in Prometheus text format."""
+        snapshots = [(process, self.snapshot())]
+        with self._lock:
+            remote = list(self._remote.items())
+        now = time.monotonic()
+        gauges = list(extra_gauges or [])
+        for name, (received, snapshot) in remote:
+            snapshots.append((name, snapshot))
+            gauges.append(("fart_metrics_report_age_seconds", {"process": name}, round(now - received, 3)))
+
+        families: Dict[str, Tuple[str, List[str]]] = {}
+
+        def family(name: str, kind: str) -> List[str]:
+            if name not in families:
+                families[name] = (kind, [])
+            return families[name][1]
+
+        for source, snapshot in snapshots:
+            for name, labels, value in snapshot.get("counters", []):
+                family(name, "counter").append(_sample(name, {"process": source, **labels}, value))
+            for name, labels, value in snapshot.get("gauges", []):
+                family(name, "gauge").append(_sample(name, {"process": source, **labels}, value))
+            for name, labels, histogram in snapshot.get("histograms", []):
+                lines = family(name, "histogram")
+                labels = {"process": source, **labels}
+                cumulative = 0
+                for bound, count in zip(list(histogram["buckets"]) + ["+Inf"], histogram["counts"]):
+                    cumulative += count
+                    lines.append(_sample(f"{name}_bucket", {**labels, "le": bound}, cumulative))
+                lines.append(_sample(f"{name}_sum", labels, histogram["sum"]))
+                lines.append(_sample(f"{name}_count", labels, histogram["count"]))
+        for name, labels, value in gauges:
+            family(name, "gauge").append(_sample(name, labels, value))
+
+        out = []
+        for name, (kind, lines) in families.items():
+            if name in HELP:
+                out.append(f"# HELP {name} {HELP[name]}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+            self._remote.clear()
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _sample(name: str, labels: Dict[str, Any], value: float) -> str:
+    if not labels:
+        return f"{name} {value}"
+    rendered = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+    return f"{name}{{{rendered}}} {value}"
+
+
+# Process-wide registry
+metrics = MetricsRegistry()
+
+
+class MetricsReporter:
+    """Sends this process's snapshot to the API every ``interval`` seconds.
+
+    ``collect`` runs before each report to refresh gauges such as queue depth;
+    flow and byte rates are derived from the counters between reports.
+    """
+
+    def __init__(self, send: Callable[[Dict[str, Any]], Any], process: str, interval: float = 1.0,
+                 collect: Optional[Callable[[], None]] = None, registry: Optional[MetricsRegistry] = None):
+        self.send = send
+        self.process = process
+        self.interval = interval
+        self.collect = collect
+        self.registry = registry or metrics
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last: Optional[Tuple[float, float, float]] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-reporter", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def report(self):
+        if self.collect is not None:
+            self.collect()
+        now = time.monotonic()
+        flows = self.registry.counter("fart_flows_written_total")
+        body_bytes = self.registry.counter("fart_bytes_captured_total")
+        if self._last is not None:
+            elapsed = max(now - self._last[0], 1e-6)
+            self.registry.set("fart_flows_per_second", round((flows - self._last[1]) / elapsed, 3))
+            self.registry.set("fart_bytes_per_second", round((body_bytes - self._last[2]) / elapsed, 3))
+        self._last = (now, flows, body_bytes)
+        self.send({"type": "metrics", "process": self.process, "data": self.registry.snapshot()})
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.report()
+            except Exception:
+                # Reporting is best effort; never take the proxy down over it
+                pass
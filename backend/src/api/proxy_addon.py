@@ -1,10 +1,33 @@
+import asyncio
+import functools
 import json
 import logging
-from mitmproxy import ctx
-from pathlib import Path
 import os
+import sys
 from datetime import datetime
 
+# mitmdump loads this file as a script; make the ``api`` package importable
+_src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _src_dir not in sys.path:
+    sys.path.insert(0, _src_dir)
+
+from mitmproxy import ctx, exceptions
+from mitmproxy.http import Headers
+from mitmproxy.net import encoding
+from mitmproxy.net.http.http1 import expected_http_body_size
+
+from api.body_spool import BodySpool
+from api.cert_cache import LeafCertCache
+from api.config import settings
+from api.flow_store import get_flow_store
+from api.flow_writer import STATS_META_KEY, FlowWriter, worker_stats_key
+from api.ipc import IpcClient, ipc_socket_path
+from api.live_view import flow_summary
+from api.metrics import MetricsReporter, metrics
+from api.proxy_server import WORKER_ENV
+from api.raw_http import decode_fields
+from api.scope import SCOPE_META_KEY, compile_scope
+
 # Configure logging with more verbose output
 logging.basicConfig(
     level=logging.DEBUG,
@@ -12,189 +35,406 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Changing any of these makes mitmproxy build a new certificate store
+CERTSTORE_OPTIONS = {"certs", "confdir", "key_size", "cert_passphrase"}
+
+def _body_size(content):
+    if isinstance(content, BodySpool):
+        return content.size
+    return len(content) if content else 0
+
+def _decode_body(content, content_encoding):
+    """Undo any Content-Encoding; the body itself is kept as exact bytes."""
+    if isinstance(content, BodySpool):
+        if not content.spilled:
+            content = content.getvalue()
+        elif content_encoding:
+            # Decoded file to file; a small result comes back in memory
+            decoded = content.decoded(content_encoding)
+            return decoded if decoded.spilled else decoded.getvalue() or None
+        else:
+            return content
+    if not content:
+        return None
+    if content_encoding:
+        try:
+            content = encoding.decode(content, content_encoding)
+        except ValueError:
+            logger.debug(f"Could not decode {content_encoding} body, storing raw bytes")
+    return content
+
+def _share_listen_port():
+    """Bind listeners with SO_REUSEPORT so sibling workers can share the proxy port.
+
+    mitmproxy has no option for it, so its call to ``asyncio.start_server`` is
+    wrapped; this only ever runs inside a dedicated worker process.
+    """
+    start_server = asyncio.start_server
+
+    @functools.wraps(start_server)
+    async def start_shared_server(*args, **kwargs):
+        kwargs.setdefault("reuse_port", True)
+        return await start_server(*args, **kwargs)
+
+    asyncio.start_server = start_shared_server
+
 class ProxyAddon:
-    def __init__(self):
-        # Use absolute path for history file
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        self.history_file = Path(os.path.join(current_dir, "sessions", "history.json"))
-        logger.debug(f"History file path: {self.history_file}")
-        
-        # Ensure sessions directory exists
+    def __init__(self, channel=None):
+        """``channel`` replaces the IPC socket when the proxy runs inside the API process."""
+        # SQLite flow store shared with the API process (the same instance when embedded)
         try:
-            self.history_file.parent.mkdir(parents=True, exist_ok=True)
-            logger.debug(f"Sessions directory created/verified at: {self.history_file.parent}")
-            
-            # Create empty history file if it doesn't exist
-            if not self.history_file.exists():
-                with open(self.history_file, 'w') as f:
-                    json.dump([], f)
-                logger.debug("Created new history file")
-            
-            # Verify file permissions
-            logger.debug(f"History file permissions: {oct(os.stat(self.history_file).st_mode)[-3:]}")
+            self.store = get_flow_store()
+            logger.debug(f"Flow store path: {self.store.path}")
         except Exception as e:
             logger.error(f"Error during initialization: {e}", exc_info=True)
+            raise
+
+        # Compiled capture scope (None = capture everything); swapped live over IPC
+        self.scope = self._load_scope()
+
+        # mitmproxy's event loop, where option changes from the API are applied
+        self.loop = None
+
+        # Index of this process among several workers sharing the port, if any
+        self.worker = None if channel is not None else os.environ.get(WORKER_ENV)
+        if self.worker is not None:
+            _share_listen_port()
+            logger.info(f"Running as proxy worker {self.worker}")
+
+        # Local channel to the API: committed flows and metrics out, control messages in
+        self.embedded = channel is not None
+        self.ipc = channel or IpcClient(ipc_socket_path())
+        self.ipc.on_message = self._on_control
+        self.ipc.start()
 
-    def _load_history(self):
-        """Load history from file."""
+        # Hooks only enqueue; the writer thread builds entries and commits them in batches
+        self.writer = FlowWriter(
+            self.store,
+            prepare=self._build_entry,
+            batch_size=settings.capture_batch_size,
+            flush_interval_ms=settings.capture_flush_interval_ms,
+            queue_size=settings.capture_queue_size,
+            backpressure=settings.capture_backpressure,
+            on_commit=self._publish_flows,
+            stats_key=STATS_META_KEY if self.worker is None else worker_stats_key(self.worker)
+        )
+        self.writer.start()
+        self.stream_threshold = settings.capture_stream_threshold
+
+        # Signed leaf certificates outlive the process; attached to mitmproxy's store once it runs
+        self.cert_cache = LeafCertCache(max_entries=settings.cert_cache_size) if settings.cert_cache_size > 0 else None
+
+        # Embedded, the API already sees this process's registry; only refresh gauges and rates
+        self.reporter = MetricsReporter(
+            (lambda message: False) if self.embedded else self.ipc.send,
+            "proxy" if self.worker is None else f"proxy-{self.worker}",
+            interval=settings.metrics_report_interval_ms / 1000.0,
+            collect=self._collect_metrics
+        )
+        self.reporter.start()
+
+    def _load_scope(self):
+        """Start from the scope the API last saved, else from settings."""
+        enabled, rules = settings.enable_filtering, settings.filter_rules
         try:
-            if self.history_file.exists():
-                with open(self.history_file, 'r') as f:
-                    history = json.load(f)
-                logger.debug(f"Loaded {len(history)} entries from history")
-                return history
-            logger.warning("History file does not exist during load")
-            return []
+            saved = self.store.get_meta(SCOPE_META_KEY)
+            if saved:
+                scope = json.loads(saved)
+                enabled, rules = scope.get("enabled", False), scope.get("rules") or []
+            return compile_scope(enabled, rules)
         except Exception as e:
-            logger.error(f"Error loading history: {e}", exc_info=True)
+            logger.error(f"Error loading capture scope, capturing everything: {e}", exc_info=True)
+            return None
+
+    def _on_control(self, message):
+        """Handle messages from the API. Runs on the IPC thread."""
+        if message.get("type") == "scope":
+            try:
+                self.scope = compile_scope(message.get("enabled", False), message.get("rules") or [])
+                logger.info(f"Capture scope updated: {len(self.scope.rules) if self.scope else 0} rules")
+            except ValueError as e:
+                logger.error(f"Ignoring invalid capture scope: {e}")
+        elif message.get("type") == "options":
+            if self.loop is None:
+                # No reply: the API falls back to restarting the proxy
+                logger.warning("Proxy not running yet, ignoring option changes")
+                return
+            asyncio.run_coroutine_threadsafe(self._apply_options(message), self.loop)
+        elif message.get("type") == "clear":
+            # The store already hides everything below the floor; don't spend writes on it
+            self.writer.discard_queued()
+            logger.info(f"History cleared below flow {message.get('floor')}, queued flows discarded")
+
+    async def _apply_options(self, message):
+        """Update mitmproxy's options in place and report back to the API.
+
+        A mode or port change makes mitmproxy start the new listeners and stop
+        the old ones; connections already accepted keep running. If a listener
+        fails to start, the previous options are restored.
+        """
+        reply = {"type": "reply", "reply_to": message.get("id"), "ok": True}
+        options = message.get("options") or {}
+        try:
+            previous = {name: getattr(ctx.options, name) for name in options}
+            ctx.options.update(**options)
+            errors = await self._listener_errors()
+            if errors:
+                ctx.options.update(**previous)
+                await self._listener_errors()
+                raise exceptions.OptionsError("; ".join(errors))
+            logger.info(f"Applied options from API: {', '.join(sorted(options))}")
+        except (exceptions.OptionsError, KeyError, AttributeError) as e:
+            logger.error(f"Could not apply options from API: {e}")
+            reply.update(ok=False, error=str(e))
+        self.ipc.send(reply)
+
+    @staticmethod
+    async def _listener_errors():
+        """Wait for mitmproxy to finish swapping listeners; returns why any failed to start."""
+        proxyserver = ctx.master.addons.get("proxyserver")
+        if proxyserver is None:
             return []
+        update = getattr(proxyserver, "_update_task", None)
+        if update is not None:
+            await asyncio.wait([update])
+        return [f"{server.mode.description}: {server.last_exception}"
+                for server in proxyserver.servers if server.last_exception is not None]
+
+    def _out_of_scope(self, flow):
+        logger.debug(f"Out of scope, not capturing: {flow.request.method} {flow.request.url}")
+        flow.capture_scope = False
+        metrics.inc("fart_flows_out_of_scope_total")
+
+    def _check_request_scope(self, flow):
+        """Decide scope from the request line and Host. Stores True, False or None (pending)."""
+        scope = self.scope
+        if scope is None:
+            flow.capture_scope = True
+            return
+        request = flow.request
+        decision = scope.check_request(
+            request.pretty_host, request.path, request.method,
+            request.pretty_url if scope.needs_url else None
+        )
+        if decision is False:
+            self._out_of_scope(flow)
+        else:
+            flow.capture_scope = decision
+
+    def _check_response_scope(self, flow):
+        """Settle scope rules that need the response Content-Type. Returns whether to capture."""
+        decision = getattr(flow, "capture_scope", True)
+        scope = self.scope
+        if decision is False:
+            return False
+        if scope is not None and (decision is None or scope.needs_response):
+            if not scope.check_response(flow.response.headers.get("content-type"), decision):
+                self._out_of_scope(flow)
+                return False
+        flow.capture_scope = True
+        return True
 
-    def _save_history(self, history):
-        """Save history to file."""
+    def _publish_flows(self, entries):
+        """Tell the API about committed flows. If the channel is down, it reloads on reconnect."""
+        self.ipc.send({"type": "flows", "flows": [flow_summary(entry) for entry in entries]})
+
+    def delete_log(self, log_id: int) -> bool:
+        """Delete a captured flow from the store; returns False if there was none."""
+        return self.store.delete(log_id)
+
+    def _collect_metrics(self):
+        stats = self.writer.stats()
+        metrics.set("fart_capture_queue_depth", stats["queue_depth"])
+
+    def _stream_body(self, message, request, response=None):
+        """Tee large or unknown-length bodies through a spill file instead of buffering them."""
+        if not self.stream_threshold or message.stream:
+            return
         try:
-            logger.debug(f"Attempting to save {len(history)} entries to history")
-            with open(self.history_file, 'w') as f:
-                json.dump(history, f, indent=2)
-            logger.debug(f"Successfully saved {len(history)} entries to history")
-            # Verify file was written
-            if self.history_file.exists():
-                size = os.path.getsize(self.history_file)
-                logger.debug(f"History file size after save: {size} bytes")
-        except Exception as e:
-            logger.error(f"Error saving history: {e}", exc_info=True)
-
-    def _get_next_id(self, history):
-        """Get next available ID based on highest existing ID."""
-        if not history:
-            return 1
-        return max(log.get('id', 0) for log in history) + 1
-
-    def _get_raw_request(self, flow):
-        """Get raw request details preserving exact format."""
-        # Extract path and host
-        path = flow.request.path
-        if flow.request.query:
-            path = path + "?" + flow.request.query
-        host = flow.request.pretty_host
-            
-        # Start with request line
-        raw_request = f"GET {path} HTTP/2\n"
+            expected_size = expected_http_body_size(request, response)
+        except ValueError:
+            return
+        if expected_size == 0 or (expected_size is not None and 0 < expected_size <= self.stream_threshold):
+            return
+        message.stream = BodySpool(self.store.spool_dir, self.stream_threshold)
+
+    @staticmethod
+    def _captured_content(message):
+        """The body as captured: a spool for streamed messages, else the raw bytes."""
+        if isinstance(message.stream, BodySpool):
+            return message.stream
+        return message.raw_content
+
+    def _snapshot_request(self, flow):
+        """Capture request fields by reference; nothing is decoded or copied here."""
+        return {
+            "method": flow.request.method,
+            "url": flow.request.url,
+            "http_version": flow.request.http_version,
+            "header_fields": flow.request.headers.fields,
+            "content": self._captured_content(flow.request),
+            "content_encoding": flow.request.headers.get("content-encoding"),
+            "timestamp": flow.request.timestamp_start
+        }
+
+    def _build_entry(self, record):
+        """Turn a queued record into a storage entry. Runs on the writer thread."""
+        request = record["request"]
+        response = record["response"]
+        
+        response_content = _decode_body(response["content"], response["content_encoding"])
+        
+        # Get content length from actual response content first
+        content_length = None
+        if isinstance(response_content, BodySpool):
+            content_length = response_content.size
+        elif response_content:
+            content_length = len(response_content)
+        else:
+            response_headers = Headers(response["header_fields"])
+            if 'content-length' in response_headers:
+                try:
+                    content_length = int(response_headers['content-length'])
+                except (ValueError, TypeError) as e:
+                    logger.warning(f"Invalid content-length header value: {e}")
         
-        # Add Host header first
-        raw_request += f"Host: {host}\n"
+        metrics.inc("fart_bytes_captured_total", _body_size(request["content"]) + _body_size(response["content"]))
         
-        # Add remaining headers in original order, excluding Host
-        for header_name, header_value in flow.request.headers.fields:
-            name = header_name.decode('utf-8')
-            if name.lower() != 'host':  # Skip Host header as we already added it
-                raw_request += f"{name}: {header_value.decode('utf-8')}\n"
+        timestamp = datetime.fromtimestamp(request["timestamp"]).isoformat() if request["timestamp"] else datetime.now().isoformat()
         
-        # Add blank line at the end
-        raw_request += "\n"
-            
-        return raw_request
+        return {
+            "id": None,
+            "timestamp": timestamp,
+            "method": request["method"],
+            "url": request["url"],
+            "status": response["status_code"],
+            "content_length": content_length,
+            "request": {
+                "method": request["method"],
+                "url": request["url"],
+                "http_version": request["http_version"],
+                # Raw request text is rendered on demand from these ordered pairs
+                "headers": decode_fields(request["header_fields"]),
+                "content": _decode_body(request["content"], request["content_encoding"])
+            },
+            "response": {
+                "status_code": response["status_code"],
+                "headers": decode_fields(response["header_fields"]),
+                "content": response_content
+            }
+        }
+
+    def running(self):
+        self.loop = asyncio.get_running_loop()
+        # Scripts run their hooks before mitmproxy's TLS addon builds its certificate store
+        self.loop.call_soon(self._install_cert_cache, True)
+
+    def configure(self, updated):
+        if self.loop is not None and CERTSTORE_OPTIONS & set(updated):
+            self.loop.call_soon(self._install_cert_cache)
+
+    def _install_cert_cache(self, prewarm=False):
+        tlsconfig = ctx.master.addons.get("tlsconfig")
+        if self.cert_cache is None or tlsconfig is None or tlsconfig.certstore is None:
+            return
+        try:
+            self.cert_cache.install(tlsconfig.certstore)
+            # Workers share the cache directory, so one of them pre-warms for all
+            if prewarm and self.worker in (None, "0"):
+                self.cert_cache.start_prewarm(settings.cert_prewarm_hosts, ctx.options.upstream_cert)
+        except Exception as e:
+            logger.error(f"Error setting up the leaf certificate cache: {e}", exc_info=True)
+
+    def requestheaders(self, flow):
+        """Drop out-of-scope flows, and decide whether to stream the request body, before it is read."""
+        try:
+            self._check_request_scope(flow)
+            if flow.capture_scope is False:
+                return
+            self._stream_body(flow.request, flow.request)
+        except Exception as e:
+            logger.error(f"Error setting up request streaming: {e}", exc_info=True)
+
+    def responseheaders(self, flow):
+        """Decide whether to stream the response body before mitmproxy buffers it."""
+        try:
+            if not self._check_response_scope(flow):
+                return
+            self._stream_body(flow.response, flow.request, flow.response)
+        except Exception as e:
+            logger.error(f"Error setting up response streaming: {e}", exc_info=True)
 
     def request(self, flow):
         """Handle request."""
         try:
-            logger.debug(f"Processing request: {flow.request.method} {flow.request.url}")
-            # Store complete raw request details in flow
-            flow.request_details = {
-                "method": flow.request.method,
-                "url": flow.request.url,
-                "raw_request": self._get_raw_request(flow),
-                "headers": dict(flow.request.headers),
-                "content": flow.request.content.decode('utf-8', 'replace') if flow.request.content else None,
-                "timestamp": datetime.now().isoformat()
-            }
-            logger.debug("Successfully stored request details in flow")
+            if not hasattr(flow, "capture_scope"):
+                # requestheaders doesn't run for flows injected by other addons or replays
+                self._check_request_scope(flow)
+            if flow.capture_scope is False:
+                return
+            with metrics.time("addon_request"):
+                logger.debug(f"Processing request: {flow.request.method} {flow.request.url}")
+                # Keep a snapshot of the request as it left the client
+                flow.request_details = self._snapshot_request(flow)
         except Exception as e:
             logger.error(f"Error processing request: {e}", exc_info=True)
 
     def response(self, flow):
         """Handle response."""
         try:
-            logger.debug(f"Processing response for: {flow.request.method} {flow.request.url}")
-            
-            # Get request details stored earlier
-            request_details = getattr(flow, 'request_details', {})
-            if not request_details:
-                logger.warning("No request details found, capturing them now")
-                request_details = {
-                    "method": flow.request.method,
-                    "url": flow.request.url,
-                    "raw_request": self._get_raw_request(flow),
-                    "headers": dict(flow.request.headers),
-                    "content": flow.request.content.decode('utf-8', 'replace') if flow.request.content else None,
-                    "timestamp": datetime.now().isoformat()
-                }
-            
-            # Load current history
-            history = self._load_history()
-            logger.debug(f"Loaded existing history with {len(history)} entries")
-            
-            # Debug response content
-            logger.debug(f"Response has content: {flow.response.content is not None}")
-            if flow.response.content:
-                logger.debug(f"Response content length: {len(flow.response.content)} bytes")
-                logger.debug(f"Response content type: {type(flow.response.content)}")
-            
-            # Debug content-length header
-            if 'content-length' in flow.response.headers:
-                logger.debug(f"Content-Length header value: {flow.response.headers['content-length']}")
-            else:
-                logger.debug("No Content-Length header present")
-            
-            # Get content length from actual response content first
-            content_length = None
-            if flow.response.content:
-                content_length = len(flow.response.content)
-                logger.debug(f"Using actual response content length: {content_length}")
-            elif 'content-length' in flow.response.headers:
-                try:
-                    content_length = int(flow.response.headers['content-length'])
-                    logger.debug(f"Using Content-Length header value: {content_length}")
-                except (ValueError, TypeError) as e:
-                    logger.warning(f"Invalid content-length header value: {e}")
-                    content_length = None
-            
-            logger.debug(f"Final content_length value: {content_length}")
-            
-            # Create entry for the request/response pair
-            entry = {
-                "id": self._get_next_id(history),
-                "timestamp": request_details["timestamp"],
-                "method": request_details["method"],
-                "url": request_details["url"],
-                "status": flow.response.status_code,
-                "content_length": content_length,
-                "request": {
-                    "method": request_details["method"],
-                    "url": request_details["url"],
-                    "raw_request": request_details["raw_request"],
-                    "headers": request_details["headers"],
-                    "content": request_details["content"]
-                },
-                "response": {
-                    "status_code": flow.response.status_code,
-                    "headers": dict(flow.response.headers),
-                    "content": flow.response.content.decode('utf-8', 'replace') if flow.response.content else None
-                }
-            }
-            
-            logger.debug(f"Created new entry with ID {entry['id']} and content_length {entry['content_length']}")
-            
-            # Add to history and save
-            history.append(entry)
-            self._save_history(history)
-            
-            logger.debug(f"Successfully processed response and saved entry {entry['id']}")
-            
+            if not self._check_response_scope(flow):
+                return
+            with metrics.time("addon_response"):
+                self._submit_flow(flow)
         except Exception as e:
             logger.error(f"Error processing response: {e}", exc_info=True)
 
-# Register the addon with mitmproxy
-addons = [ProxyAddon()]
+    def _submit_flow(self, flow):
+        logger.debug(f"Processing response for: {flow.request.method} {flow.request.url}")
+        
+        # Get request details stored earlier
+        request_details = getattr(flow, 'request_details', None)
+        if not request_details:
+            logger.warning("No request details found, capturing them now")
+            request_details = self._snapshot_request(flow)
+        
+        # Hand a lightweight record to the writer thread
+        record = {
+            "request": request_details,
+            "response": {
+                "status_code": flow.response.status_code,
+                "header_fields": flow.response.headers.fields,
+                "content": self._captured_content(flow.response),
+                "content_encoding": flow.response.headers.get("content-encoding")
+            }
+        }
+        flow.capture_submitted = True
+        if self.writer.submit(record):
+            metrics.inc("fart_flows_captured_total")
+        else:
+            self._discard_spools(flow)
+            logger.warning(f"Capture queue full, dropped flow: {flow.request.method} {flow.request.url}")
+
+    @staticmethod
+    def _discard_spools(flow):
+        for message in (flow.request, flow.response):
+            if message is not None and isinstance(message.stream, BodySpool):
+                message.stream.discard()
+
+    def error(self, flow):
+        """Remove spill files of flows that never made it to the writer."""
+        if not getattr(flow, "capture_submitted", False):
+            self._discard_spools(flow)
+
+    def done(self):
+        """Flush queued flows when mitmproxy shuts down."""
+        self.writer.stop()
+        self.reporter.report()
+        self.reporter.stop()
+        self.ipc.stop()
 
-# Log when addon is loaded
-logger.info("ProxyAddon loaded and registered with mitmproxy")
+# Register the addon when mitmdump loads this file as a script; the embedded
+# proxy imports the module and creates its own instance
+if __name__ != "api.proxy_addon":
+    addons = [ProxyAddon()]
+    logger.info("ProxyAddon loaded and registered with mitmproxy")
@@ -4,10 +4,15 @@ This module provides a simple interface to control the proxy server.
 """
 
 import logging
+from api import state
 from api.proxy_manager import ProxyManager
+from api.proxy_server import proxy_options
 
 logger = logging.getLogger(__name__)
 
+# How long to wait for the running proxy to confirm an option change
+RECONFIGURE_TIMEOUT_SECONDS = 5.0
+
 # Global proxy manager instance
 _proxy_manager = ProxyManager()
 
@@ -23,6 +28,32 @@ def restart_proxy():
     """Restart the proxy server."""
     _proxy_manager.restart()
 
+def proxy_workers():
+    """Status of each proxy process (one unless several workers share the port)."""
+    return _proxy_manager.workers()
+
+async def reconfigure_proxy() -> bool:
+    """Apply the listener and upstream settings to the running proxy in place.
+
+    Listeners are swapped without touching open connections. Returns False
+    unless every connected proxy process confirmed the change, so the caller
+    can restart instead; raises RuntimeError if a proxy rejected it (and kept
+    its old options).
+    """
+    if state.ipc_server is None or not state.ipc_server.clients:
+        return False
+    expected = state.ipc_server.clients
+    replies = await state.ipc_server.request(
+        {"type": "options", "options": proxy_options()}, RECONFIGURE_TIMEOUT_SECONDS
+    )
+    errors = [reply.get("error") or "unknown error" for reply in replies if not reply.get("ok")]
+    if errors:
+        raise RuntimeError(f"Proxy rejected the new settings: {'; '.join(errors)}")
+    if len(replies) < expected:
+        logger.warning(f"Only {len(replies)} of {expected} proxy processes confirmed the new settings")
+        return False
+    return True
+
 def delete_log(log_id: int):
     """Delete a specific log entry from the proxy addon."""
     try:
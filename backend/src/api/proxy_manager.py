@@ -1,20 +1,20 @@
 import logging
+from api.config import settings
+from api.embedded_proxy import EmbeddedProxy
 from api.proxy_server import ProxyServer
-from mitmproxy import ctx
 
 logger = logging.getLogger(__name__)
 
 class ProxyManager:
     def __init__(self):
-        self.proxy_server = ProxyServer()
-        self._proxy_addon = None
+        if settings.proxy_embedded and settings.proxy_workers > 1:
+            logger.warning("proxy_workers is ignored when the proxy is embedded")
+        self.proxy_server = EmbeddedProxy() if settings.proxy_embedded else ProxyServer()
 
     @property
     def proxy_addon(self):
-        """Get the current ProxyAddon instance."""
-        if not self._proxy_addon and ctx.master:
-            self._proxy_addon = ctx.master.addons.get('ProxyAddon')
-        return self._proxy_addon
+        """Get the current ProxyAddon instance; only reachable when the proxy is embedded."""
+        return getattr(self.proxy_server, "addon", None)
 
     def start(self):
         """Start mitmproxy."""
@@ -31,7 +31,6 @@ class ProxyManager:
             if self.proxy_server:
                 logger.info("Stopping mitmproxy")
                 self.proxy_server.stop()
-                self._proxy_addon = None
         except Exception as e:
             logger.error(f"Error stopping mitmproxy: {str(e)}")
 
@@ -40,6 +39,10 @@ class ProxyManager:
         self.stop()
         self.start()
 
+    def workers(self):
+        """Health of the proxy's worker processes (or the embedded master)."""
+        return self.proxy_server.status()
+
     def delete_log(self, log_id: int):
         """Delete a specific log entry from the proxy addon."""
         if not self.proxy_addon:
@@ -1,16 +1,159 @@
 import logging
 import subprocess
 import os
+import threading
+import time
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
 from api.config import settings
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Set in each worker's environment when more than one shares the proxy port
+WORKER_ENV = "FART_PROXY_WORKER"
+
+# How often the supervisor checks on workers, and how long it waits before
+# restarting one that keeps crashing (doubling up to the maximum)
+SUPERVISE_INTERVAL_SECONDS = 1.0
+RESTART_BACKOFF_SECONDS = 1.0
+RESTART_BACKOFF_MAX_SECONDS = 30.0
+# A worker that ran at least this long before exiting is restarted right away
+STABLE_UPTIME_SECONDS = 30.0
+
+def proxy_options() -> Dict[str, Any]:
+    """mitmproxy options for the listener and upstream settings.
+
+    The listen port is part of the mode spec: mitmproxy only swaps listeners
+    when ``mode`` changes, so a port change alone must change it too.
+    """
+    mode = "regular"
+    upstream_auth = None
+    if settings.upstream_proxy_enabled and settings.upstream_proxy_host and settings.upstream_proxy_port:
+        mode = f"upstream:http://{settings.upstream_proxy_host}:{settings.upstream_proxy_port}"
+        if settings.upstream_proxy_auth and settings.upstream_proxy_username and settings.upstream_proxy_password:
+            upstream_auth = f"{settings.upstream_proxy_username}:{settings.upstream_proxy_password}"
+    return {
+        "mode": [f"{mode}@{settings.proxy_port}"],
+        "listen_port": settings.proxy_port,
+        "upstream_auth": upstream_auth,
+    }
+
+class ProxyWorker:
+    """One mitmdump process running the capture addon."""
+
+    def __init__(self, index: Optional[int], command: Callable[[], List[str]], log_path: str):
+        self.index = index
+        # Built on every (re)start, so a restarted worker picks up settings changed live
+        self.command = command
+        self.log_path = log_path
+        self.process: Optional[subprocess.Popen] = None
+        self.started_at: Optional[float] = None
+        self.restarts = 0
+        self.last_exit_code: Optional[int] = None
+        self.restart_at: Optional[float] = None
+        self.backoff = RESTART_BACKOFF_SECONDS
+
+    @property
+    def name(self) -> str:
+        return "proxy" if self.index is None else f"proxy-{self.index}"
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        env = dict(os.environ)
+        if self.index is not None:
+            env[WORKER_ENV] = str(self.index)
+        # Open log file with line buffering
+        log_file = open(self.log_path, 'a' if self.restarts else 'w', buffering=1)
+        self.process = subprocess.Popen(
+            self.command(),
+            stdout=log_file,
+            stderr=log_file,
+            universal_newlines=True,
+            env=env
+        )
+        log_file.close()
+        self.started_at = time.time()
+        self.restart_at = None
+        logger.info(f"Mitmproxy {self.name} started with PID: {self.process.pid}")
+        logger.info(f"Mitmproxy logs available at: {self.log_path}")
+
+    def stop(self):
+        if not self.process:
+            return
+        try:
+            logger.info(f"Stopping mitmproxy {self.name} (PID: {self.process.pid})")
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=3)
+                logger.info(f"Mitmproxy {self.name} terminated gracefully")
+            except subprocess.TimeoutExpired:
+                logger.warning(f"Mitmproxy {self.name} did not terminate gracefully, forcing kill")
+                self.process.kill()
+                self.process.wait()
+                logger.info(f"Mitmproxy {self.name} killed")
+        except Exception as e:
+            logger.error(f"Error stopping process: {str(e)}", exc_info=True)
+        finally:
+            self.process = None
+
+    def supervise(self, now: float):
+        """Restart the worker if it exited, backing off while it keeps crashing."""
+        if self.process is None or self.process.poll() is None:
+            return
+        if self.restart_at is None:
+            self.last_exit_code = self.process.poll()
+            uptime = now - (self.started_at or now)
+            if uptime >= STABLE_UPTIME_SECONDS:
+                self.backoff = RESTART_BACKOFF_SECONDS
+                delay = 0.0
+            else:
+                delay = self.backoff
+                self.backoff = min(self.backoff * 2, RESTART_BACKOFF_MAX_SECONDS)
+            self.restart_at = now + delay
+            logger.warning(
+                f"Mitmproxy {self.name} exited with code {self.last_exit_code} after {uptime:.1f}s, "
+                f"restarting in {delay:.1f}s"
+            )
+        if now >= self.restart_at:
+            self.restarts += 1
+            try:
+                self.start()
+            except Exception as e:
+                self.restart_at = now + self.backoff
+                logger.error(f"Failed to restart mitmproxy {self.name}: {e}", exc_info=True)
+
+    def status(self) -> Dict[str, Any]:
+        alive = self.alive
+        return {
+            "worker": self.name,
+            "index": self.index,
+            "pid": self.process.pid if self.process else None,
+            "alive": alive,
+            "uptime": round(time.time() - self.started_at, 1) if alive and self.started_at else None,
+            "restarts": self.restarts,
+            "last_exit_code": self.last_exit_code,
+            "log": self.log_path,
+        }
+
 class ProxyServer:
+    """Runs ``settings.proxy_workers`` mitmdump processes and restarts any that exit.
+
+    With more than one worker, each binds the proxy port with SO_REUSEPORT (see
+    the addon) and the kernel spreads incoming connections across them. They
+    all write to the same flow store, whose shared ID counter orders flows
+    from every worker by commit.
+    """
+
     def __init__(self):
-        self.process = None
+        self.workers: List[ProxyWorker] = []
+        self._supervisor: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
         # Get the absolute path to the current directory
         self.current_dir = os.path.dirname(os.path.abspath(__file__))
         # Define sessions directory
@@ -18,7 +161,7 @@ class ProxyServer:
         # Define paths
         self.addon_path = os.path.join(self.current_dir, "proxy_addon.py")
         self.log_path = os.path.join(self.sessions_dir, "mitmproxy.log")
-        self.history_path = os.path.join(self.sessions_dir, "history.json")
+        self.flow_db_path = os.path.join(self.sessions_dir, "flows.db")
 
     def _initialize_directories(self):
         """Initialize required directories and files."""
@@ -27,28 +170,37 @@ class ProxyServer:
             os.makedirs(self.sessions_dir, mode=0o755, exist_ok=True)
             logger.debug(f"Sessions directory initialized at: {self.sessions_dir}")
             
-            # Create empty history.json if it doesn't exist
-            if not os.path.exists(self.history_path):
-                with open(self.history_path, 'w') as f:
-                    f.write('[]')
-                logger.debug(f"Created empty history file at: {self.history_path}")
+            # The flow store database is created by the addon and API on first open
+            logger.debug(f"Flow store database: {self.flow_db_path}")
             
-            # Set proper permissions on history file
-            os.chmod(self.history_path, 0o644)
-            logger.debug(f"Set permissions on history file: {oct(os.stat(self.history_path).st_mode)[-3:]}")
-            
-            # Verify files and permissions
+            # Verify directories and permissions
             logger.debug(f"Sessions dir exists: {os.path.exists(self.sessions_dir)}")
             logger.debug(f"Sessions dir permissions: {oct(os.stat(self.sessions_dir).st_mode)[-3:]}")
-            logger.debug(f"History file exists: {os.path.exists(self.history_path)}")
-            logger.debug(f"History file permissions: {oct(os.stat(self.history_path).st_mode)[-3:]}")
             
         except Exception as e:
             logger.error(f"Error initializing directories: {str(e)}", exc_info=True)
             raise
 
+    def _command(self) -> List[str]:
+        options = proxy_options()
+        cmd = [
+            "mitmdump",
+            "--listen-host", settings.proxy_host,
+            "--listen-port", str(options["listen_port"]),
+            "--mode", options["mode"][0],
+            "--ssl-insecure",
+            "--set", "console_eventlog_verbosity=debug",
+            "--set", "termlog_verbosity=debug",
+            "--set", "flow_detail=3",  # Increase flow detail for better debugging
+            "-s", self.addon_path
+        ]
+        # Upstream credentials go in their own option; the mode spec can't carry them
+        if options["upstream_auth"]:
+            cmd.extend(["--set", f"upstream_auth={options['upstream_auth']}"])
+        return cmd
+
     def start(self):
-        """Start mitmproxy binary."""
+        """Start the mitmdump workers."""
         try:
             # Initialize directories and files
             self._initialize_directories()
@@ -57,69 +209,57 @@ class ProxyServer:
             if not os.path.exists(self.addon_path):
                 raise FileNotFoundError(f"Addon script not found at: {self.addon_path}")
             
-            cmd = [
-                "mitmdump",
-                "--listen-host", settings.proxy_host,
-                "--listen-port", str(settings.proxy_port),
-                "--ssl-insecure",
-                "--set", "console_eventlog_verbosity=debug",
-                "--set", "termlog_verbosity=debug",
-                "--set", "flow_detail=3",  # Increase flow detail for better debugging
-                "-s", self.addon_path
-            ]
-
-            # Add upstream proxy configuration if enabled
-            if settings.upstream_proxy_enabled and settings.upstream_proxy_host and settings.upstream_proxy_port:
-                upstream_url = f"http://{settings.upstream_proxy_host}:{settings.upstream_proxy_port}"
-                
-                # Add authentication if enabled
-                if settings.upstream_proxy_auth and settings.upstream_proxy_username and settings.upstream_proxy_password:
-                    upstream_url = f"http://{settings.upstream_proxy_username}:{settings.upstream_proxy_password}@{settings.upstream_proxy_host}:{settings.upstream_proxy_port}"
-                
-                cmd.extend(["--mode", f"upstream:{upstream_url}"])
+            count = max(1, settings.proxy_workers)
+            if settings.upstream_proxy_enabled:
                 logger.info(f"Configuring upstream proxy: {settings.upstream_proxy_host}:{settings.upstream_proxy_port}")
-            
-            logger.info(f"Starting mitmproxy: {' '.join(cmd)}")
-            
-            # Open log file with line buffering
-            log_file = open(self.log_path, 'w', buffering=1)
-            
-            self.process = subprocess.Popen(
-                cmd,
-                stdout=log_file,
-                stderr=log_file,
-                universal_newlines=True
-            )
-            
-            logger.info(f"Mitmproxy started with PID: {self.process.pid}")
-            logger.info(f"Mitmproxy logs available at: {self.log_path}")
-            
-            # Verify process is running
-            if self.process.poll() is None:
-                logger.info("Mitmproxy process is running")
-            else:
-                logger.error(f"Mitmproxy process failed to start. Exit code: {self.process.poll()}")
+            logger.info(f"Starting {count} mitmproxy worker(s): {' '.join(self._command())}")
+
+            with self._lock:
+                self.workers = [
+                    ProxyWorker(None, self._command, self.log_path) if count == 1 else
+                    ProxyWorker(index, self._command, os.path.join(self.sessions_dir, f"mitmproxy.{index}.log"))
+                    for index in range(count)
+                ]
+                for worker in self.workers:
+                    worker.start()
+
+            # Verify processes are running
+            failed = [worker for worker in self.workers if not worker.alive]
+            if failed:
+                for worker in failed:
+                    logger.error(f"Mitmproxy {worker.name} failed to start. Exit code: {worker.process.poll()}")
+                self.stop()
                 raise Exception("Failed to start mitmproxy process")
+            logger.info("Mitmproxy process is running" if count == 1 else f"{count} mitmproxy workers are running")
+
+            self._stopping.clear()
+            self._supervisor = threading.Thread(target=self._supervise, name="proxy-supervisor", daemon=True)
+            self._supervisor.start()
             
         except Exception as e:
             logger.error(f"Failed to start mitmproxy: {str(e)}", exc_info=True)
             raise
 
+    def _supervise(self):
+        while not self._stopping.wait(SUPERVISE_INTERVAL_SECONDS):
+            with self._lock:
+                if self._stopping.is_set():
+                    return
+                now = time.time()
+                for worker in self.workers:
+                    worker.supervise(now)
+
     def stop(self):
-        """Stop mitmproxy process."""
-        if self.process:
-            try:
-                logger.info(f"Stopping mitmproxy process (PID: {self.process.pid})")
-                self.process.terminate()
-                try:
-                    self.process.wait(timeout=3)
-                    logger.info("Mitmproxy process terminated gracefully")
-                except subprocess.TimeoutExpired:
-                    logger.warning("Mitmproxy process did not terminate gracefully, forcing kill")
-                    self.process.kill()
-                    self.process.wait()
-                    logger.info("Mitmproxy process killed")
-            except Exception as e:
-                logger.error(f"Error stopping process: {str(e)}", exc_info=True)
-            finally:
-                self.process = None
+        """Stop the mitmdump workers."""
+        self._stopping.set()
+        if self._supervisor is not None:
+            self._supervisor.join(SUPERVISE_INTERVAL_SECONDS * 2)
+            self._supervisor = None
+        with self._lock:
+            for worker in self.workers:
+                worker.stop()
+            self.workers = []
+
+    def status(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [worker.status() for worker in self.workers]
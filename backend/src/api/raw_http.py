@@ -0,0 +1,73 @@
+"""
+Helpers for stored header fields and on-demand raw HTTP rendering.
+
+Captured headers are stored as an ordered list of ``[name, value]`` pairs so
+duplicates and the original order survive. The dict form the UI shows, and the
+raw request text, are both derived from those pairs when a flow is read.
+"""
+
+from typing import Any, Dict, List, Optional, Union
+from urllib.parse import urlsplit
+
+HeaderPairs = List[List[str]]
+
+DEFAULT_HTTP_VERSION = "HTTP/1.1"
+
+
+def header_pairs(headers: Union[Dict[str, str], HeaderPairs, None]) -> HeaderPairs:
+    """Normalise a header dict (imports, repeater) or pair list to pairs."""
+    if not headers:
+        return []
+    if isinstance(headers, dict):
+        return [[name, value] for name, value in headers.items()]
+    return [[name, value] for name, value in headers]
+
+
+def headers_dict(headers: Union[Dict[str, str], HeaderPairs, None]) -> Dict[str, str]:
+    """Collapse pairs to a dict, joining repeated names like mitmproxy's Headers does."""
+    if not headers:
+        return {}
+    if isinstance(headers, dict):
+        return headers
+    result: Dict[str, str] = {}
+    names: Dict[str, str] = {}
+    for name, value in headers:
+        key = names.setdefault(name.lower(), name)
+        result[key] = f"{result[key]}, {value}" if key in result else value
+    return result
+
+
+def render_raw_request(method: str, url: str, http_version: Optional[str],
+                       headers: Union[Dict[str, str], HeaderPairs, None],
+                       body: Optional[str] = None) -> str:
+    """Render a request as it appeared on the wire: request line, headers, blank line, body."""
+    parts = urlsplit(url)
+    target = parts.path or "/"
+    if parts.query:
+        target += "?" + parts.query
+    pairs = header_pairs(headers)
+
+    lines = [f"{method} {target} {http_version or DEFAULT_HTTP_VERSION}"]
+    # HTTP/2 carries the authority as a pseudo-header; show it as Host
+    if parts.netloc and not any(name.lower() == "host" for name, _ in pairs):
+        lines.append(f"Host: {parts.netloc}")
+    lines.extend(f"{name}: {value}" for name, value in pairs)
+    return "\n".join(lines) + "\n\n" + (body or "")
+
+
+def parse_header_block(raw: Optional[str]) -> HeaderPairs:
+    """Header pairs from the repeater's raw header text, whose first line is the request line.
+
+    Lines without a colon are skipped.
+    """
+    pairs: HeaderPairs = []
+    for line in (raw or "").split("\n")[1:]:
+        name, colon, value = line.strip().partition(":")
+        if colon and name.strip():
+            pairs.append([name.strip(), value.strip()])
+    return pairs
+
+
+def decode_fields(fields: Any) -> HeaderPairs:
+    """Decode mitmproxy's raw ``headers.fields`` into string pairs."""
+    return [[name.decode("utf-8", "replace"), value.decode("utf-8", "replace")] for name, value in fields]
@@ -1,15 +1,30 @@
-from .proxy_routes import get_proxy_logs, clear_proxy_logs, delete_proxy_log
+from .proxy_routes import get_proxy_logs, get_proxy_log_page, get_proxy_log, search_proxy_logs, stream_proxy_logs, clear_proxy_logs, delete_proxy_log, delete_proxy_logs, get_compaction_status, get_proxy_stats, get_proxy_workers, get_proxy_log_body, get_proxy_log_raw_request
 from .settings_routes import get_settings, update_settings
 from .session_routes import export_session, import_session
-from .repeater_routes import send_request
+from .repeater_routes import send_request, get_repeater_pool
+from .intruder_routes import run_attack
+from .metrics_routes import get_metrics
 
 __all__ = [
     'get_proxy_logs',
+    'get_proxy_log_page',
+    'get_proxy_log',
+    'search_proxy_logs',
+    'stream_proxy_logs',
     'clear_proxy_logs',
     'delete_proxy_log',
+    'delete_proxy_logs',
+    'get_compaction_status',
+    'get_proxy_stats',
+    'get_proxy_workers',
+    'get_proxy_log_body',
+    'get_proxy_log_raw_request',
     'get_settings',
     'update_settings',
     'export_session',
     'import_session',
-    'send_request'
+    'send_request',
+    'get_repeater_pool',
+    'run_attack',
+    'get_metrics'
 ]
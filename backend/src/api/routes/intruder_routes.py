@@ -0,0 +1,152 @@
+import asyncio
+import json
+import logging
+import time
+from typing import List, Optional
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from api.client_pool import upstream_proxy_url
+from api.config import settings
+from api.flow_writer import STATS_META_KEY, FlowWriter
+from api.intruder import Attack, RequestTemplate, combinations, payload_source
+from api.live_view import flow_summary, sse_frame
+from api.routes.proxy_routes import get_live_view
+from api.routes.repeater_routes import RepeaterRequest, get_client_pool
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENCY = 200
+MAX_RETRIES = 10
+
+# Writer counters for attack results, apart from the proxy's
+INTRUDER_STATS_KEY = f"{STATS_META_KEY}.intruder"
+
+class PayloadSet(BaseModel):
+    type: str  # list, file, numbers or brute_force (see api/intruder.py)
+    values: List[str] = []
+    path: Optional[str] = None  # a file in the intruder wordlist directory
+    start: int = 0
+    stop: Optional[int] = None
+    step: int = 1
+    format: Optional[str] = None
+    charset: Optional[str] = None
+    min_length: int = 1
+    max_length: int = 1
+
+class AttackRequest(BaseModel):
+    request: RepeaterRequest  # with payload positions marked as §default§
+    payloads: List[PayloadSet]
+    attack_type: str = "sniper"
+    concurrency: int = 10
+    rate_limit: Optional[float] = None  # requests per second
+    burst: Optional[int] = None
+    retries: int = 0
+    retry_statuses: List[int] = [429, 502, 503, 504]
+    retry_backoff_ms: int = 200
+    store_results: bool = True
+
+def _validate(attack: AttackRequest):
+    if not attack.request.url:
+        raise HTTPException(status_code=400, detail="URL is required")
+    if not 1 <= attack.concurrency <= MAX_CONCURRENCY:
+        raise HTTPException(status_code=400, detail=f"concurrency must be between 1 and {MAX_CONCURRENCY}")
+    if attack.rate_limit is not None and attack.rate_limit <= 0:
+        raise HTTPException(status_code=400, detail="rate_limit must be positive")
+    if attack.burst is not None and attack.burst < 1:
+        raise HTTPException(status_code=400, detail="burst must be at least 1")
+    if not 0 <= attack.retries <= MAX_RETRIES:
+        raise HTTPException(status_code=400, detail=f"retries must be between 0 and {MAX_RETRIES}")
+    if attack.retry_backoff_ms < 0:
+        raise HTTPException(status_code=400, detail="retry_backoff_ms can't be negative")
+
+async def run_attack(attack: AttackRequest) -> StreamingResponse:
+    """Send every payload combination and stream results as server-sent events.
+
+    Sends ``start`` (request count, if known, and positions), one ``result``
+    per request as it completes (payloads, status, length, time, body hash),
+    then ``done`` with totals, or ``error`` if the attack failed part way.
+    Responses are written to the flow store in batches and appear in the live
+    flow list. Disconnecting stops the attack.
+    """
+    _validate(attack)
+    request = attack.request
+    try:
+        template = RequestTemplate(request.method, request.url, request.headers, request.body)
+        rows, total = combinations(
+            attack.attack_type, template, [payload_source(payloads.model_dump()) for payloads in attack.payloads]
+        )
+    except (ValueError, OSError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    view = get_live_view()
+    writer = None
+    if attack.store_results:
+        loop = asyncio.get_running_loop()
+        writer = FlowWriter(
+            view.store,
+            batch_size=settings.capture_batch_size,
+            flush_interval_ms=settings.capture_flush_interval_ms,
+            queue_size=settings.capture_queue_size,
+            on_commit=lambda entries: loop.call_soon_threadsafe(view.add, [flow_summary(entry) for entry in entries]),
+            stats_key=INTRUDER_STATS_KEY
+        )
+
+    pool, proxy = get_client_pool(), upstream_proxy_url()
+
+    async def send(method, url, **kwargs):
+        return await pool.request(
+            method, url, verify=request.verify, proxy=proxy, follow_redirects=request.follow_redirects, **kwargs
+        )
+
+    runner = Attack(
+        template, rows, send,
+        writer=writer,
+        concurrency=attack.concurrency,
+        rate_limit=attack.rate_limit,
+        burst=attack.burst,
+        retries=attack.retries,
+        retry_statuses=attack.retry_statuses,
+        retry_backoff=attack.retry_backoff_ms / 1000.0
+    )
+    logger.info(
+        f"Starting {attack.attack_type} attack on {request.url}: {total if total is not None else 'unknown number of'} "
+        f"requests, {template.positions} positions, concurrency {attack.concurrency}"
+    )
+
+    async def events():
+        started = time.perf_counter()
+        if writer is not None:
+            writer.start()
+        try:
+            yield sse_frame("start", json.dumps({
+                "attack_type": attack.attack_type, "positions": template.positions, "total": total
+            }))
+            async for result in runner.run():
+                yield sse_frame("result", json.dumps(result))
+            stored = 0
+            if writer is not None:
+                await asyncio.to_thread(writer.stop)
+                stored = writer.stats()["written"]
+            elapsed = time.perf_counter() - started
+            logger.info(f"Attack on {request.url} finished: {runner.sent} requests, {runner.errors} errors")
+            yield sse_frame("done", json.dumps({
+                "sent": runner.sent,
+                "errors": runner.errors,
+                "stored": stored,
+                "elapsed_ms": round(elapsed * 1000, 1),
+                "requests_per_second": round(runner.sent / elapsed, 1) if elapsed > 0 else None
+            }))
+        except Exception as e:
+            logger.error(f"Attack on {request.url} failed: {e}", exc_info=True)
+            yield sse_frame("error", json.dumps({"detail": str(e), "sent": runner.sent}))
+        finally:
+            if writer is not None:
+                # Commit whatever was queued, also when the client went away
+                await asyncio.to_thread(writer.stop)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,61 @@
+import logging
+from fastapi import Response
+from api import state
+from api.flow_store import get_flow_store
+from api.metrics import ERRORS_METRIC, metrics
+from api.proxy_control import proxy_workers
+from api.routes.proxy_routes import get_live_view
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _store_gauges():
+    """Flow store size, measured at scrape time."""
+    store = get_flow_store()
+    bodies = store.blob_stats()
+    db_bytes = sum(
+        path.stat().st_size
+        for path in (store.path, store.path.with_name(store.path.name + "-wal"))
+        if path.exists()
+    )
+    return [
+        ("fart_store_flows", {}, len(store)),
+        ("fart_store_body_bytes", {}, bodies["stored_bytes"]),
+        ("fart_store_disk_bytes", {}, bodies["disk_bytes"]),
+        ("fart_store_db_bytes", {}, db_bytes),
+        ("fart_store_tombstones", {}, store.pending_tombstones()),
+        ("fart_stream_clients", {}, get_live_view().subscribers),
+    ]
+
+def _worker_gauges():
+    """Liveness and restart count of each proxy process."""
+    gauges = []
+    for worker in proxy_workers():
+        labels = {"worker": worker["worker"]}
+        gauges.append(("fart_proxy_worker_up", labels, 1 if worker["alive"] else 0))
+        gauges.append(("fart_proxy_worker_restarts", labels, worker["restarts"]))
+    return gauges
+
+def _repeater_gauges():
+    """Connections held open by the repeater's pooled clients."""
+    if state.client_pool is None:
+        return []
+    return [
+        ("fart_repeater_open_connections", {"verify": str(client["verify"]).lower(), "proxy": client["proxy"] or ""},
+         client["open_connections"])
+        for client in state.client_pool.stats()["clients"]
+        if client["open_connections"] is not None
+    ]
+
+async def get_metrics() -> Response:
+    """Expose API and proxy metrics in Prometheus text format."""
+    gauges = []
+    try:
+        gauges = _store_gauges()
+    except Exception as e:
+        metrics.inc(ERRORS_METRIC, stage="store_stats")
+        logger.error(f"Error reading flow store size: {e}", exc_info=True)
+    gauges.extend(_worker_gauges())
+    gauges.extend(_repeater_gauges())
+    return Response(content=metrics.render(extra_gauges=gauges), media_type=PROMETHEUS_CONTENT_TYPE)
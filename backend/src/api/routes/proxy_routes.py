@@ -1,22 +1,64 @@
+import asyncio
+import base64
 import json
 import logging
-import os
-from pathlib import Path
-from typing import List, Dict, Any
-from fastapi import Response
-from datetime import datetime
-from api.proxy_control import restart_proxy
+from typing import List, Dict, Any, Optional, Tuple
+from fastapi import HTTPException, Response
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from api import state
+from api.flow_filter import FlowFilter, compile_filter
+from api.flow_store import LIST_COLUMNS, SORT_KEYS, SUMMARY_COLUMNS, get_flow_store
+from api.flow_writer import STATS_META_KEY, worker_stats_key
+from api.live_view import LiveView
+from api.metrics import metrics
+from api.proxy_control import proxy_workers
 
 logger = logging.getLogger(__name__)
 
-# Use absolute path for history file
-current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-HISTORY_FILE = Path(os.path.join(current_dir, "sessions", "history.json"))
-logger.debug(f"History file path: {HISTORY_FILE}")
+# Read size when streaming a compressed body back out
+BODY_CHUNK_SIZE = 64 * 1024
+
+# An idle live stream sends a comment this often so intermediaries keep it open
+STREAM_KEEPALIVE_SECONDS = 15
+# How long EventSource waits before reconnecting a dropped stream
+STREAM_RETRY_MS = 2000
+
+# Page sizes for the paginated log list
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+DEFAULT_SEARCH_LIMIT = 50
+# Fields a page can be projected to; request/response carry headers and bodies
+PAGE_FIELDS = LIST_COLUMNS + ("request", "response")
+
+def _display_request(entry: Dict[str, Any]) -> Dict[str, Any]:
+    request = entry.get("request", {})
+    return {
+        "method": request.get("method"),
+        "url": request.get("url"),
+        "headers": request.get("headers", {}),
+        "content": request.get("content"),
+        "content_truncated": request.get("content_truncated", False)
+    }
+
+def _display_response(entry: Dict[str, Any]) -> Dict[str, Any]:
+    response = entry.get("response", {})
+    return {
+        "status_code": response.get("status_code"),
+        "headers": response.get("headers", {}),
+        "content": response.get("content"),
+        "content_truncated": response.get("content_truncated", False)
+    }
+
+# Builds each side of the display entry, for pages that project only some of them
+DISPLAY_SIDES = {"request": _display_request, "response": _display_response}
 
 def transform_log_for_display(entry: Dict[str, Any]) -> Dict[str, Any]:
     """Transform a log entry from storage format to display format"""
-    logger.debug(f"Transforming storage entry for display: {json.dumps(entry, indent=2)}")
+    # Pretty-printing whole entries is costly; only do it when it will be logged
+    debug = logger.isEnabledFor(logging.DEBUG)
+    if debug:
+        logger.debug(f"Transforming storage entry for display: {json.dumps(entry, indent=2)}")
     transformed = {
         "id": entry["id"],
         "timestamp": entry.get("timestamp", entry.get("request", {}).get("timestamp")),
@@ -24,47 +66,91 @@ def transform_log_for_display(entry: Dict[str, Any]) -> Dict[str, Any]:
         "url": entry.get("request", {}).get("url"),
         "status": entry.get("response", {}).get("status_code"),
         "content_length": entry.get("content_length"),
-        "request": {
-            "method": entry.get("request", {}).get("method"),
-            "url": entry.get("request", {}).get("url"),
-            "headers": entry.get("request", {}).get("headers", {}),
-            "content": entry.get("request", {}).get("content")
-        },
-        "response": {
-            "status_code": entry.get("response", {}).get("status_code"),
-            "headers": entry.get("response", {}).get("headers", {}),
-            "content": entry.get("response", {}).get("content")
-        }
+        "request": _display_request(entry),
+        "response": _display_response(entry)
     }
-    logger.debug(f"Transformed entry for display: {json.dumps(transformed, indent=2)}")
+    if debug:
+        logger.debug(f"Transformed entry for display: {json.dumps(transformed, indent=2)}")
     return transformed
 
-async def get_proxy_logs() -> Response:
-    """Get all proxy logs."""
+_live_view: Optional[LiveView] = None
+
+def get_live_view() -> LiveView:
+    """Return the in-memory flow list for the current flow store."""
+    global _live_view
+    store = get_flow_store()
+    if _live_view is None or _live_view.store is not store:
+        _live_view = LiveView(store)
+    return _live_view
+
+class BulkDeleteRequest(BaseModel):
+    ids: List[int] = []
+    ranges: List[Tuple[int, int]] = []
+    filter: str | None = None
+
+def _notify_compactor():
+    if state.compactor is not None:
+        state.compactor.notify()
+
+def parse_flow_filter(expression: Optional[str]) -> Optional[FlowFilter]:
+    """Compile a ``filter`` query parameter, answering 400 if it is malformed."""
+    if not expression:
+        return None
     try:
-        logger.debug(f"Checking for history file at: {HISTORY_FILE}")
-        if HISTORY_FILE.exists():
-            logger.debug("History file exists, reading contents")
-            with open(HISTORY_FILE, 'r') as f:
-                history = json.load(f)
-                logger.debug(f"Loaded {len(history)} entries from history file")
-                logger.debug(f"Raw history data: {json.dumps(history, indent=2)}")
-                
-                logs = [transform_log_for_display(entry) for entry in history]
-                logger.debug(f"Transformed {len(logs)} entries for display")
-                
-                response_data = {"data": logs}
-                logger.debug(f"Sending response with {len(logs)} logs")
-                return Response(
-                    content=json.dumps(response_data),
-                    media_type="application/json"
+        return compile_filter(expression)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid filter: {e}")
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # Weak comparison, as If-None-Match requires
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+async def get_proxy_logs(since_id: Optional[int] = None, cursor: Optional[str] = None,
+                         if_none_match: Optional[str] = None) -> Response:
+    """Get proxy logs.
+
+    Without arguments this returns every flow's summary as ``{"data": [...]}``;
+    headers and bodies come from ``/logs/{id}``. With ``cursor`` (from a
+    previous response; pass an empty one to start) it returns the summary of
+    each flow added or changed since, plus the IDs deleted since, as
+    ``{"data", "deleted", "cursor", "delta"}``; ``delta`` is false when the
+    cursor couldn't be replayed and ``data`` is the full list. ``since_id``
+    returns summaries of flows with higher IDs in the same shape. The ETag
+    comes from the flow list's version, so an unchanged list is answered with
+    304 from memory.
+    """
+    try:
+        view = get_live_view()
+        headers = {"ETag": f'W/"{view.cursor}"', "Cache-Control": "no-cache"}
+        if _etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+        with metrics.time("logs_read"):
+            # Summaries are serialized once, as they arrive; no blob is read here
+            delta = view.changes_since(cursor) if cursor is not None else None
+            if delta is not None:
+                logs, deleted, next_cursor = delta
+            else:
+                logs, deleted, next_cursor = view.serialized_entries(since_id), [], view.cursor
+        
+        logger.debug(f"Sending response with {len(logs)} logs")
+        with metrics.time("logs_serialize"):
+            content = '{"data": [' + ", ".join(logs) + ']'
+            if cursor is not None or since_id is not None:
+                partial = delta is not None or since_id is not None
+                content += (
+                    f', "deleted": {json.dumps(deleted)}, "cursor": {json.dumps(next_cursor)}, '
+                    f'"delta": {json.dumps(partial)}'
                 )
-        else:
-            logger.debug("History file does not exist, returning empty list")
-            return Response(
-                content=json.dumps({"data": []}),
-                media_type="application/json"
-            )
+            content += '}'
+        return Response(
+            content=content,
+            media_type="application/json",
+            headers=headers
+        )
     except Exception as e:
         logger.error(f"Error reading proxy logs: {e}", exc_info=True)
         return Response(
@@ -72,18 +158,157 @@ async def get_proxy_logs() -> Response:
             media_type="application/json"
         )
 
+def _encode_page_key(sort: str, order: str, key: List[Any]) -> str:
+    raw = json.dumps([sort, order, *key], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_page_key(after: str, sort: str, order: str) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(after + "=" * (-len(after) % 4))
+        key_sort, key_order, value, last_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid page cursor")
+    if not isinstance(last_id, int) or isinstance(value, (list, dict)):
+        raise HTTPException(status_code=400, detail="Invalid page cursor")
+    if (key_sort, key_order) != (sort, order):
+        raise HTTPException(status_code=400, detail="Page cursor belongs to a different sort order")
+    return [value, last_id]
+
+def _page_fields(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return list(SUMMARY_COLUMNS)
+    selected = []
+    for field in fields.split(","):
+        field = field.strip()
+        if not field or field in selected:
+            continue
+        if field not in PAGE_FIELDS:
+            raise HTTPException(status_code=400, detail=f"Unknown field: {field}")
+        selected.append(field)
+    # Rows are always addressable by ID
+    if "id" not in selected:
+        selected.insert(0, "id")
+    return selected
+
+async def get_proxy_log_page(limit: int = DEFAULT_PAGE_SIZE, sort: str = "id", order: str = "asc",
+                             after: Optional[str] = None, fields: Optional[str] = None,
+                             filter_expression: Optional[str] = None,
+                             if_none_match: Optional[str] = None) -> Response:
+    """One page of the flow list, sorted and projected on the server.
+
+    Pages are read with keyset pagination, so any page costs the same. The
+    response is ``{"data", "next", "total"}``; pass ``next`` back as ``after``
+    for the following page (it is null on the last one). ``fields`` is a
+    comma-separated subset of ``PAGE_FIELDS`` and defaults to the summary
+    columns; ``request`` and ``response`` add headers and bodies.
+    ``filter_expression`` limits the list to matching flows (see ``flow_filter``).
+    """
+    if sort not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Cannot sort by: {sort}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail=f"Invalid sort order: {order}")
+    selected = _page_fields(fields)
+    after_key = _decode_page_key(after, sort, order) if after else None
+    flow_filter = parse_flow_filter(filter_expression)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    view = get_live_view()
+    headers = {"ETag": f'W/"{view.cursor}"', "Cache-Control": "no-cache"}
+    if _etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    store = get_flow_store()
+    sides = [side for side in ("request", "response") if side in selected]
+    columns = [field for field in selected if field not in sides]
+    with metrics.time("logs_read"):
+        rows, next_key = store.page(sort, order == "desc", limit, after_key, with_entries=bool(sides),
+                                    flow_filter=flow_filter)
+    data = []
+    for row in rows:
+        item = {column: row[column] for column in columns}
+        for side in sides:
+            item[side] = DISPLAY_SIDES[side](row)
+        data.append(item)
+
+    body = {
+        "data": data,
+        "next": _encode_page_key(sort, order, next_key) if next_key else None,
+        "total": store.count(flow_filter)
+    }
+    return Response(content=json.dumps(body), media_type="application/json", headers=headers)
+
+async def search_proxy_logs(query: str, limit: int = DEFAULT_SEARCH_LIMIT,
+                            before: Optional[int] = None) -> Dict[str, Any]:
+    """Full-text search over captured URLs, headers and text bodies.
+
+    Returns ``{"data": [{"id", "snippet"}], "next"}``, newest first; pass
+    ``next`` back as ``before`` for older matches (null when there are none).
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    try:
+        with metrics.time("search"):
+            results, next_before = get_flow_store().search(query, limit, before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"data": results, "next": next_before}
+
+async def get_proxy_log(log_id: int) -> Dict[str, Any]:
+    """One flow in full, for the details pane and the repeater."""
+    entry = get_flow_store().get(log_id, preview=True)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Log {log_id} not found")
+    log = transform_log_for_display(entry)
+    if entry.get("request", {}).get("http_version"):
+        log["request"]["http_version"] = entry["request"]["http_version"]
+    return log
+
+async def stream_proxy_logs(limit: Optional[int] = None) -> StreamingResponse:
+    """Live flow list as server-sent events.
+
+    Starts with a ``snapshot`` of the last ``limit`` flows (all by default),
+    then sends ``flows`` (added or updated entries), ``delete`` and, after a
+    clear or resync, another ``snapshot``.
+    """
+    view = get_live_view()
+    subscription = view.subscribe(limit)
+    logger.info(f"Live stream client connected ({view.subscribers} connected)")
+
+    async def events():
+        try:
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+            while True:
+                try:
+                    frame = await asyncio.wait_for(subscription.get(), STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            view.unsubscribe(subscription)
+            logger.info(f"Live stream client disconnected ({view.subscribers} connected)")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 async def clear_proxy_logs() -> Dict[str, str]:
-    """Clear all proxy logs."""
+    """Clear all proxy logs without restarting the proxy.
+
+    The store hides every existing flow at once and the compactor frees them in
+    the background; the addon is told to drop flows it has queued but not written.
+    """
     try:
-        # Clear the history file
-        HISTORY_FILE.parent.mkdir(parents=True, exist_ok=True)
-        with open(HISTORY_FILE, 'w') as f:
-            json.dump([], f)
-        
-        # Restart the proxy to ensure clean state
-        restart_proxy()
-        
-        logger.info("Cleared proxy logs and restarted proxy")
+        floor = get_flow_store().clear()
+        get_live_view().clear(floor)
+        if state.ipc_server is not None:
+            await state.ipc_server.broadcast({"type": "clear", "floor": floor})
+        _notify_compactor()
+
+        logger.info(f"Cleared proxy logs below flow {floor}")
         return {"status": "ok", "message": "Proxy logs cleared"}
     except Exception as e:
         logger.error(f"Error clearing proxy logs: {e}", exc_info=True)
@@ -92,21 +317,178 @@ async def clear_proxy_logs() -> Dict[str, str]:
 async def delete_proxy_log(log_id: int) -> Dict[str, str]:
     """Delete a specific proxy log entry."""
     try:
-        if HISTORY_FILE.exists():
-            # Read current history
-            with open(HISTORY_FILE, 'r') as f:
-                history = json.load(f)
-            
-            # Filter out the specified log while preserving IDs
-            filtered_history = [log for log in history if log.get('id') != log_id]
-            
-            # Save updated history
-            with open(HISTORY_FILE, 'w') as f:
-                json.dump(filtered_history, f, indent=2)
-            
+        # Other IDs are preserved; bodies no other flow references are freed
+        if get_flow_store().delete(log_id):
+            get_live_view().remove([log_id])
+            _notify_compactor()
             logger.info(f"Deleted log {log_id}")
-            return {"status": "ok", "message": f"Log {log_id} deleted"}
-        return {"status": "error", "message": "No logs found"}
+        else:
+            logger.debug(f"Log {log_id} not found in history")
+        return {"status": "ok", "message": f"Log {log_id} deleted"}
     except Exception as e:
         logger.error(f"Error deleting proxy log: {e}", exc_info=True)
         return {"status": "error", "message": str(e)}
+
+async def delete_proxy_logs(filter_expression: Optional[str] = None, ids: Optional[List[int]] = None,
+                            ranges: Optional[List[Tuple[int, int]]] = None) -> Dict[str, Any]:
+    """Delete every flow with one of ``ids``, in one of the inclusive ``ranges`` or matching a filter.
+
+    Deleted flows are tombstoned right away; the compactor frees their bodies
+    and index entries in the background.
+    """
+    flow_filter = parse_flow_filter(filter_expression)
+    if flow_filter is None and not ids and not ranges:
+        raise HTTPException(status_code=400, detail="Give IDs, ranges or a filter; use clear to delete everything")
+    try:
+        with metrics.time("bulk_delete"):
+            deleted = get_flow_store().tombstone(ids or [], ranges or [], flow_filter)
+        get_live_view().remove(deleted)
+        _notify_compactor()
+        logger.info(f"Deleted {len(deleted)} logs")
+        return {"status": "ok", "message": f"Deleted {len(deleted)} logs", "deleted": len(deleted)}
+    except Exception as e:
+        logger.error(f"Error deleting proxy logs: {e}", exc_info=True)
+        return {"status": "error", "message": str(e)}
+
+async def get_compaction_status() -> Dict[str, Any]:
+    """Progress of the background compactor and what it has reclaimed so far."""
+    if state.compactor is not None:
+        return state.compactor.status()
+    return {"running": False, "pending": get_flow_store().pending_tombstones()}
+
+async def get_proxy_stats() -> Dict[str, Any]:
+    """Get capture pipeline counters reported by the proxy addon's writer."""
+    try:
+        store = get_flow_store()
+        writer_stats = store.get_meta(STATS_META_KEY)
+        return {
+            "flows": len(store),
+            "bodies": store.blob_stats(),
+            "writer": json.loads(writer_stats) if writer_stats else None,
+            "compaction": await get_compaction_status()
+        }
+    except Exception as e:
+        logger.error(f"Error reading proxy stats: {e}", exc_info=True)
+        return {"flows": 0, "bodies": None, "writer": None}
+
+# Per-worker throughput and queue metrics, as reported by each proxy process
+WORKER_METRICS = {
+    "flows_per_second": "fart_flows_per_second",
+    "bytes_per_second": "fart_bytes_per_second",
+    "queue_depth": "fart_capture_queue_depth",
+    "flows_written": "fart_flows_written_total",
+    "report_age_seconds": "report_age_seconds",
+}
+
+async def get_proxy_workers() -> Dict[str, Any]:
+    """Health, restarts and throughput of each proxy process."""
+    try:
+        store = get_flow_store()
+        workers = []
+        for worker in proxy_workers():
+            # The embedded proxy records into this process's registry
+            reported = metrics.values(None if worker["worker"] == "embedded" else worker["worker"]) or {}
+            for field, name in WORKER_METRICS.items():
+                worker[field] = reported.get(name)
+            writer_stats = store.get_meta(
+                STATS_META_KEY if worker["index"] is None else worker_stats_key(worker["index"])
+            )
+            worker["writer"] = json.loads(writer_stats) if writer_stats else None
+            workers.append(worker)
+        return {
+            "workers": workers,
+            "alive": sum(1 for worker in workers if worker["alive"]),
+            "flows_per_second": round(sum(worker["flows_per_second"] or 0 for worker in workers), 3),
+            "bytes_per_second": round(sum(worker["bytes_per_second"] or 0 for worker in workers), 3),
+        }
+    except Exception as e:
+        logger.error(f"Error reading proxy worker status: {e}", exc_info=True)
+        return {"workers": [], "alive": 0, "flows_per_second": 0, "bytes_per_second": 0}
+
+def _header_value(headers: Dict[str, str], name: str) -> Optional[str]:
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+def _parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``bytes=`` range into inclusive offsets; None means the whole body."""
+    if not range_header or size == 0:
+        return None
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        # Multiple ranges are optional to support; send the whole body instead
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            start = max(0, size - int(last))
+            end = size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+def _stream_blob(reader, start: int, length: int):
+    with reader:
+        if start:
+            reader.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = reader.read(min(BODY_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+async def get_proxy_log_body(log_id: int, side: str, range_header: Optional[str] = None) -> Response:
+    """Serve a captured request or response body as its exact bytes.
+
+    Uncompressed blobs are streamed straight from the file (Range handled by
+    FileResponse); compressed blobs are decompressed chunk by chunk. Neither
+    path loads the whole body into memory.
+    """
+    store = get_flow_store()
+    ref = store.body_ref(log_id, side)
+    if ref is None:
+        raise HTTPException(status_code=404, detail=f"Log {log_id} not found")
+    if ref["hash"] is None or not ref["path"].exists():
+        raise HTTPException(status_code=404, detail=f"Log {log_id} has no {side} body")
+
+    media_type = _header_value(ref["headers"], "content-type") or "application/octet-stream"
+    if ref["codec"] == "none":
+        return FileResponse(ref["path"], media_type=media_type)
+
+    size = ref["size"]
+    byte_range = _parse_range(range_header, size)
+    headers = {"Accept-Ranges": "bytes"}
+    status_code = 200
+    start, end = 0, size - 1
+    if byte_range is not None:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    logger.debug(f"Streaming {side} body of log {log_id} ({ref['codec']}, bytes {start}-{end}/{size})")
+    return StreamingResponse(
+        _stream_blob(store.blobs.open(ref["hash"], ref["codec"]), start, end - start + 1),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers
+    )
+
+async def get_proxy_log_raw_request(log_id: int) -> PlainTextResponse:
+    """Render a flow's request as raw HTTP, on demand from its stored fields."""
+    with metrics.time("render_raw_request"):
+        raw = get_flow_store().raw_request(log_id)
+    if raw is None:
+        raise HTTPException(status_code=404, detail=f"Log {log_id} not found")
+    return PlainTextResponse(raw)
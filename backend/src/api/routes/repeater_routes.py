@@ -4,6 +4,10 @@ import json
 import logging
 import httpx
 from pydantic import BaseModel
+from api import state
+from api.client_pool import ClientPool, upstream_proxy_url
+from api.metrics import metrics
+from api.raw_http import parse_header_block
 from api.state import proxy_logs, add_to_proxy_history
 
 # Configure logging
@@ -15,24 +19,28 @@ class RepeaterRequest(BaseModel):
     headers: str
     body: str
     follow_redirects: bool = False
+    verify: bool = False
+
+def get_client_pool() -> ClientPool:
+    """The app's pooled clients; created on demand when called outside the app lifespan."""
+    if state.client_pool is None or state.client_pool.closed:
+        state.client_pool = ClientPool.from_settings()
+    return state.client_pool
+
+async def get_repeater_pool():
+    """Connection reuse per pooled client."""
+    try:
+        return get_client_pool().stats()
+    except Exception as e:
+        logger.error(f"Error reading repeater pool stats: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
 
 async def send_request(request_data: RepeaterRequest):
     try:
         logger.info(f"Received request data: {request_data}")
         
-        # Parse headers from raw string
-        headers = {}
-        if request_data.headers:
-            # Skip the first line (request line) and parse remaining headers
-            header_lines = request_data.headers.split('\n')[1:]
-            for line in header_lines:
-                line = line.strip()
-                if line:  # Skip empty lines
-                    try:
-                        key, value = line.split(':', 1)
-                        headers[key.strip()] = value.strip()
-                    except ValueError:
-                        logger.warning(f"Skipping invalid header line: {line}")
+        # Parse headers from raw string, skipping the request line; the last of repeated names wins
+        headers = dict(parse_header_block(request_data.headers))
 
         # Validate URL
         if not request_data.url:
@@ -51,42 +59,38 @@ async def send_request(request_data: RepeaterRequest):
         # Add to proxy history and get assigned ID
         log_entry = add_to_proxy_history(log_entry)
 
-        # Create the request
         try:
-            transport = httpx.AsyncHTTPTransport(retries=0)
-            
-            logger.debug(f"Creating httpx client with follow_redirects={request_data.follow_redirects}")
-            async with httpx.AsyncClient(
-                verify=False,
-                timeout=30.0,
-                transport=transport,
-                follow_redirects=request_data.follow_redirects
-            ) as client:
-                logger.debug(f"Sending request to {request_data.url}")
-                response = await client.request(
-                    method=request_data.method,
-                    url=request_data.url,
+            # Pooled client: repeats to the same origin reuse its open connections
+            logger.debug(f"Sending request to {request_data.url} (follow_redirects={request_data.follow_redirects})")
+            metrics.inc("fart_repeater_requests_total")
+            with metrics.time("repeater_send"):
+                response = await get_client_pool().request(
+                    request_data.method,
+                    request_data.url,
+                    verify=request_data.verify,
+                    proxy=upstream_proxy_url(),
+                    follow_redirects=request_data.follow_redirects,
                     headers=headers,
                     content=request_data.body
                 )
-                
-                logger.debug(f"Response status: {response.status_code}")
-                logger.debug(f"Response headers: {dict(response.headers)}")
 
-                # Update log entry with response data
-                for log in proxy_logs:
-                    if log["id"] == log_entry["id"]:
-                        log["status"] = response.status_code
-                        log["response_headers"] = dict(response.headers)
-                        log["response_content"] = response.text
-                        break
+            logger.debug(f"Response status: {response.status_code}")
+            logger.debug(f"Response headers: {dict(response.headers)}")
+
+            # Update log entry with response data
+            for log in proxy_logs:
+                if log["id"] == log_entry["id"]:
+                    log["status"] = response.status_code
+                    log["response_headers"] = dict(response.headers)
+                    log["response_content"] = response.text
+                    break
 
-                return {
-                    "status": response.status_code,
-                    "statusText": response.reason_phrase or str(response.status_code),
-                    "headers": dict(response.headers),
-                    "body": response.text
-                }
+            return {
+                "status": response.status_code,
+                "statusText": response.reason_phrase or str(response.status_code),
+                "headers": dict(response.headers),
+                "body": response.text
+            }
         except httpx.RequestError as e:
             logger.error(f"Request error: {e}")
             # Update log with error information
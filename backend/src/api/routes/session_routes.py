@@ -3,10 +3,12 @@ import json
 import logging
 import os
 from pathlib import Path
+from typing import Optional
 from fastapi import Body
-from api.state import proxy_logs, next_id
+from api.flow_store import get_flow_store
+from api.state import proxy_logs
 from .settings_routes import get_settings, update_settings, SettingsUpdate
-from .proxy_routes import HISTORY_FILE, transform_log_for_display
+from .proxy_routes import get_live_view, parse_flow_filter, transform_log_for_display
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -58,23 +60,20 @@ def transform_log_for_storage(log):
     logger.debug(f"Transformed log entry: {json.dumps(transformed, indent=2)}")
     return transformed
 
-async def export_session():
+async def export_session(filter_expression: Optional[str] = None):
     logger.debug("Starting session export")
+    flow_filter = parse_flow_filter(filter_expression)
     
-    # Read logs from history file
-    logs = []
-    if HISTORY_FILE.exists():
-        try:
-            logger.debug(f"Reading history from {HISTORY_FILE}")
-            with open(HISTORY_FILE, 'r') as f:
-                history = json.load(f)
-                logger.debug(f"Loaded {len(history)} entries from history file")
-                # Transform logs to frontend format
-                logs = [transform_log_for_display(entry) for entry in history]
-                logger.debug(f"Transformed {len(logs)} entries for export")
-        except Exception as e:
-            logger.error(f"Error reading history file: {str(e)}")
-            raise ValueError(f"Failed to read history file: {str(e)}")
+    # Read logs from the flow store, only those matching the filter if one is given
+    try:
+        history = get_flow_store().entries(flow_filter=flow_filter)
+        logger.debug(f"Loaded {len(history)} entries from flow store")
+        # Transform logs to frontend format
+        logs = [transform_log_for_display(entry) for entry in history]
+        logger.debug(f"Transformed {len(logs)} entries for export")
+    except Exception as e:
+        logger.error(f"Error reading flow store: {str(e)}")
+        raise ValueError(f"Failed to read history file: {str(e)}")
     
     session_data = {
         "logs": logs,
@@ -85,7 +84,7 @@ async def export_session():
     return session_data
 
 async def import_session(data: dict):
-    global proxy_logs, next_id
+    global proxy_logs
     
     try:
         logger.debug(f"Starting session import with data type: {type(data)}")
@@ -120,42 +119,17 @@ async def import_session(data: dict):
             proxy_logs.extend(storage_logs)
             logger.debug(f"Updated in-memory proxy_logs with {len(proxy_logs)} entries")
             
-            # Ensure the sessions directory exists
-            HISTORY_FILE.parent.mkdir(parents=True, exist_ok=True)
-            
-            # Write logs to history file
+            # Replace the flow store contents with the imported logs; the store also
+            # moves the shared ID allocator past the highest imported ID
+            flow_store = get_flow_store()
             try:
-                # First verify we can write by creating a JSON string
-                json_data = json.dumps(storage_logs, indent=2)
-                
-                # Then write to file
-                with open(HISTORY_FILE, 'w') as f:
-                    f.write(json_data)
-                logger.debug(f"Wrote {len(storage_logs)} logs to history file: {HISTORY_FILE}")
-                
-                # Verify the write by reading back
-                with open(HISTORY_FILE, 'r') as f:
-                    saved_data = f.read()
-                    saved_logs = json.loads(saved_data)
-                    logger.debug(f"Verified {len(saved_logs)} logs in history file")
+                flow_store.replace(storage_logs)
+                get_live_view().invalidate()
+                logger.debug(f"Wrote {len(storage_logs)} logs to flow store: {flow_store.path}")
             except Exception as e:
-                logger.error(f"Error writing to history file: {str(e)}")
-                logger.error(f"History file path: {HISTORY_FILE}")
+                logger.error(f"Error writing to flow store: {str(e)}")
+                logger.error(f"Flow store path: {flow_store.path}")
                 raise ValueError(f"Failed to write logs to history file: {str(e)}")
-            
-            # Update next_id to be one more than the highest ID in imported logs
-            if storage_logs:
-                logger.debug("Processing logs to update next_id")
-                try:
-                    max_id = max(int(log["id"]) for log in storage_logs)
-                    next_id = max_id + 1
-                    logger.debug(f"Updated next_id to {next_id}")
-                except (KeyError, ValueError) as e:
-                    logger.error(f"Error processing log IDs: {str(e)}")
-                    raise ValueError(f"Invalid log format: {str(e)}")
-            else:
-                logger.debug("No logs found, setting next_id to 1")
-                next_id = 1
         else:
             logger.debug("No logs key found in session data")
         
@@ -1,9 +1,14 @@
 import asyncio
+import json
 import logging
+import time
 from fastapi import Body, HTTPException
 from pydantic import BaseModel
+from api import state
 from api.config import settings
-from api.proxy_control import restart_proxy
+from api.flow_store import get_flow_store
+from api.proxy_control import reconfigure_proxy, restart_proxy
+from api.scope import SCOPE_META_KEY, compile_scope
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -26,8 +31,8 @@ async def get_settings():
         "proxy_port": settings.proxy_port,
         "ui_port": settings.ui_port,
         "debug_level": settings.debug_level,
-        "enable_filtering": False,
-        "filter_rules": [],
+        "enable_filtering": settings.enable_filtering,
+        "filter_rules": list(settings.filter_rules),
         "upstream_proxy_enabled": settings.upstream_proxy_enabled,
         "upstream_proxy_host": settings.upstream_proxy_host,
         "upstream_proxy_port": settings.upstream_proxy_port,
@@ -36,17 +41,68 @@ async def get_settings():
         "upstream_proxy_password": settings.upstream_proxy_password
     }
 
+def scope_message():
+    """Control message carrying the current capture scope to the proxy addon."""
+    return {"type": "scope", "enabled": settings.enable_filtering, "rules": list(settings.filter_rules)}
+
+def restore_scope_settings():
+    """Load the scope saved by a previous run into ``settings``."""
+    try:
+        saved = get_flow_store().get_meta(SCOPE_META_KEY)
+        if saved:
+            scope = json.loads(saved)
+            settings.enable_filtering = bool(scope.get("enabled", False))
+            settings.filter_rules = list(scope.get("rules") or [])
+    except Exception as e:
+        logger.error(f"Error restoring scope settings: {e}", exc_info=True)
+
+async def publish_scope():
+    """Persist the scope and push it to the running addon; no proxy restart needed."""
+    message = scope_message()
+    get_flow_store().set_meta(SCOPE_META_KEY, json.dumps({"enabled": message["enabled"], "rules": message["rules"]}))
+    if state.ipc_server is not None:
+        sent = await state.ipc_server.broadcast(message)
+        logger.info(f"Pushed scope ({len(message['rules'])} rules, enabled={message['enabled']}) to {sent} proxy process(es)")
+
+async def apply_proxy_settings():
+    """Push listener and upstream settings to the running proxy; restart it only if it can't take them live."""
+    started = time.perf_counter()
+    if await reconfigure_proxy():
+        logger.info(f"Applied proxy settings in place in {(time.perf_counter() - started) * 1000:.1f}ms")
+    else:
+        logger.info("Proxy did not confirm the settings over IPC, restarting it")
+        restart_proxy()
+
 async def update_settings(new_settings: SettingsUpdate = Body(...)):
     # Store current values before update
     old_settings = await get_settings()
+    updates = new_settings.model_dump(exclude_unset=True)
+
+    if "enable_filtering" in updates:
+        updates["enable_filtering"] = bool(updates["enable_filtering"])
+    # Reject rules that don't compile before anything is applied
+    if "filter_rules" in updates:
+        rules = [str(rule).strip() for rule in updates["filter_rules"] or []]
+        updates["filter_rules"] = [rule for rule in rules if rule]
+        try:
+            compile_scope(True, updates["filter_rules"])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     
     try:
         # Update settings using model_dump instead of dict
-        for key, value in new_settings.model_dump(exclude_unset=True).items():
+        for key, value in updates.items():
             if hasattr(settings, key):
                 setattr(settings, key, value)
+
+        scope_changed = (
+            settings.enable_filtering != old_settings["enable_filtering"] or
+            settings.filter_rules != old_settings["filter_rules"]
+        )
+        if scope_changed:
+            await publish_scope()
         
-        # Check if we need to restart the proxy
+        # Check if the proxy needs reconfiguring
         port_changed = new_settings.proxy_port is not None and new_settings.proxy_port != old_settings["proxy_port"]
         
         upstream_changed = (
@@ -58,28 +114,30 @@ async def update_settings(new_settings: SettingsUpdate = Body(...)):
             (new_settings.upstream_proxy_password is not None and new_settings.upstream_proxy_password != old_settings["upstream_proxy_password"])
         )
         
-        # Only restart if port or upstream settings changed
+        # Only the port and upstream settings concern the proxy's listeners
         if port_changed or upstream_changed:
-            logger.info("Restarting proxy due to configuration changes")
             try:
-                restart_proxy()
+                await apply_proxy_settings()
             except Exception as e:
-                logger.error(f"Error restarting proxy: {e}")
+                logger.error(f"Error applying proxy settings: {e}")
                 # Try to restore old settings
                 for key, value in old_settings.items():
                     if hasattr(settings, key):
                         setattr(settings, key, value)
+                # The new scope was already pushed; push the old one back too
+                if scope_changed:
+                    await publish_scope()
                 
-                # Try to restart with old settings
+                # Try to go back to the old settings
                 try:
-                    restart_proxy()
+                    await apply_proxy_settings()
                 except Exception as restore_error:
                     logger.error(f"Failed to restore proxy with old settings: {restore_error}")
                     raise HTTPException(status_code=500, detail="Failed to update proxy settings and restore failed")
                 
                 raise HTTPException(status_code=500, detail=str(e))
         else:
-            logger.info("No proxy restart needed")
+            logger.info("No proxy reconfiguration needed")
         
         return await get_settings()
         
@@ -0,0 +1,211 @@
+"""
+Capture scope rules, compiled once into a fast matcher.
+
+Rules are the strings from ``settings.filter_rules``, one per line in the UI:
+
+    example.com              the host exactly
+    *.example.com            the host and every subdomain
+    example.com/api          a host (or *.host) restricted to a path prefix
+    api-*.example.com        any other host glob
+    path:/api/v1             a path prefix on any host (globs allowed)
+    method:GET,POST          request methods
+    type:json, type:image/*  response Content-Type (substring, or a type/* family)
+    regex:^https://.*\\.io/   a regular expression searched in the full URL
+    !<any rule above>        exclude instead of include
+
+A flow is in scope if it matches any include rule (or there are none) and no
+exclude rule. Host rules live in a trie keyed by reversed host labels, path
+prefixes are a tuple for ``str.startswith``, and every glob and regex rule is
+folded into one combined regex, so checking a flow costs a handful of
+dictionary lookups no matter how many rules there are.
+"""
+
+import fnmatch
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Flow store meta key holding the scope as {"enabled": ..., "rules": [...]}
+SCOPE_META_KEY = "scope"
+
+_PREFIXES = ("host:", "path:", "method:", "type:", "regex:")
+_TRANSLATED = re.compile(r"\(\?s:(.*)\)\\[Zz]$", re.DOTALL)
+
+
+class _HostTrie:
+    """Host -> path prefixes, keyed by reversed labels (com -> example -> api)."""
+
+    def __init__(self):
+        self.root: Dict[str, Any] = {}
+
+    def add(self, host: str, path_prefix: str, wildcard: bool):
+        node = self.root
+        for label in reversed(host.split(".")):
+            node = node.setdefault(label, {})
+        node.setdefault("*" if wildcard else "=", []).append(path_prefix)
+
+    def __bool__(self) -> bool:
+        return bool(self.root)
+
+    def match(self, host: str, path: str) -> bool:
+        node = self.root
+        labels = host.split(".")
+        for index in range(len(labels) - 1, -1, -1):
+            node = node.get(labels[index])
+            if node is None:
+                return False
+            prefixes = list(node.get("*", ()))
+            if index == 0:
+                prefixes.extend(node.get("=", ()))
+            if prefixes and path.startswith(tuple(prefixes)):
+                return True
+        return False
+
+
+def _glob_regex(pattern: str) -> str:
+    # fnmatch.translate wraps its output as (?s:...)\Z; unwrap it for embedding
+    return _TRANSLATED.match(fnmatch.translate(pattern)).group(1)
+
+
+class RuleSet:
+    """One side (include or exclude) of the scope, compiled."""
+
+    def __init__(self):
+        self.hosts = _HostTrie()
+        self.path_prefixes: Tuple[str, ...] = ()
+        self.methods = frozenset()
+        self.content_types: Tuple[str, ...] = ()
+        self.url_regex: Optional[re.Pattern] = None
+        self.path_regex: Optional[re.Pattern] = None
+
+    @property
+    def has_request_rules(self) -> bool:
+        return bool(self.hosts or self.path_prefixes or self.methods or self.url_regex or self.path_regex)
+
+    @property
+    def has_type_rules(self) -> bool:
+        return bool(self.content_types)
+
+    def match_request(self, host: str, path: str, method: str, url: Optional[str]) -> bool:
+        if self.methods and method.upper() in self.methods:
+            return True
+        if self.path_prefixes and path.startswith(self.path_prefixes):
+            return True
+        if self.hosts and self.hosts.match(host.lower(), path):
+            return True
+        if self.path_regex is not None and self.path_regex.match(path):
+            return True
+        if self.url_regex is not None and url is not None and self.url_regex.search(url):
+            return True
+        return False
+
+    def match_type(self, content_type: Optional[str]) -> bool:
+        if not self.content_types or not content_type:
+            return False
+        content_type = content_type.lower()
+        return any(pattern in content_type for pattern in self.content_types)
+
+
+def _compile_side(rules: List[str]) -> RuleSet:
+    compiled = RuleSet()
+    path_prefixes, methods, content_types = [], set(), []
+    url_patterns, path_patterns = [], []
+
+    for rule in rules:
+        kind, value = "host", rule
+        for prefix in _PREFIXES:
+            if rule.lower().startswith(prefix):
+                kind, value = prefix[:-1], rule[len(prefix):].strip()
+                break
+        if not value:
+            raise ValueError(f"Empty scope rule: {rule!r}")
+
+        if kind == "method":
+            methods.update(m.strip().upper() for m in value.split(",") if m.strip())
+        elif kind == "type":
+            for pattern in value.split(","):
+                pattern = pattern.strip().lower()
+                content_types.append(pattern[:-1] if pattern.endswith("/*") else pattern)
+        elif kind == "regex":
+            try:
+                re.compile(value)
+            except re.error as e:
+                raise ValueError(f"Invalid regex in scope rule {rule!r}: {e}")
+            url_patterns.append(value)
+        elif kind == "path":
+            if any(c in value for c in "*?["):
+                path_patterns.append(_glob_regex(value))
+            else:
+                path_prefixes.append(value)
+        else:
+            host, slash, path = value.partition("/")
+            host = host.lower()
+            path = slash + path
+            wildcard = host.startswith("*.")
+            if wildcard:
+                host = host[2:]
+            if any(c in host for c in "*?[") or any(c in path for c in "*?["):
+                # Globs past the leading label go to the combined regex, matched on host + path
+                host_glob = ("*." if wildcard else "") + host
+                url_patterns.append(
+                    r"^[a-z][a-z0-9+.-]*://(?:[^/@]*@)?" + _glob_regex(host_glob) + r"(?::\d+)?"
+                    + (_glob_regex(path) if path else r"(?:[/?#]|$)")
+                )
+                continue
+            compiled.hosts.add(host, path, wildcard)
+            if wildcard:
+                # *.example.com also covers example.com itself
+                compiled.hosts.add(host, path, False)
+
+    compiled.path_prefixes = tuple(path_prefixes)
+    compiled.methods = frozenset(methods)
+    compiled.content_types = tuple(content_types)
+    if url_patterns:
+        compiled.url_regex = re.compile("|".join(f"(?:{p})" for p in url_patterns), re.IGNORECASE)
+    if path_patterns:
+        compiled.path_regex = re.compile("|".join(f"(?:{p})" for p in path_patterns) + r"\Z")
+    return compiled
+
+
+class Scope:
+    def __init__(self, rules: List[str]):
+        self.rules = [rule.strip() for rule in rules if rule and rule.strip()]
+        self.include = _compile_side([r for r in self.rules if not r.startswith("!")])
+        self.exclude = _compile_side([r[1:].strip() for r in self.rules if r.startswith("!")])
+        self.needs_url = self.include.url_regex is not None or self.exclude.url_regex is not None
+        self._include_any = self.include.has_request_rules or self.include.has_type_rules
+
+    def check_request(self, host: str, path: str, method: str, url: Optional[str] = None) -> Optional[bool]:
+        """Decide from the request alone.
+
+        Returns True or False, or None when only the response Content-Type can
+        decide (include rules that are all ``type:`` rules).
+        """
+        path = path.split("?", 1)[0] or "/"
+        if self.exclude.has_request_rules and self.exclude.match_request(host, path, method, url):
+            return False
+        if not self._include_any:
+            return True
+        if self.include.has_request_rules and self.include.match_request(host, path, method, url):
+            return True
+        return None if self.include.has_type_rules else False
+
+    def check_response(self, content_type: Optional[str], decided: Optional[bool]) -> bool:
+        """Finish the decision once response headers are in."""
+        if decided is None:
+            decided = self.include.match_type(content_type)
+        return decided and not self.exclude.match_type(content_type)
+
+    @property
+    def needs_response(self) -> bool:
+        return self.exclude.has_type_rules
+
+
+def compile_scope(enabled: bool, rules: List[str]) -> Optional[Scope]:
+    """Compile settings into a matcher; None means everything is in scope.
+
+    Raises ValueError for rules that don't compile.
+    """
+    if not enabled:
+        return None
+    scope = Scope(rules or [])
+    return scope if scope.rules else None
@@ -1,5 +1,7 @@
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from api.flow_store import get_flow_store
+from api.id_allocator import IdAllocator
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -8,17 +10,26 @@ logger = logging.getLogger(__name__)
 proxy_master = None
 proxy_loop = None
 proxy_thread = None
+ipc_server = None  # IpcServer the proxy addon reports to, set in the app lifespan
+compactor = None  # Compactor that reclaims deleted flows, set in the app lifespan
+client_pool = None  # ClientPool the repeater sends through, set in the app lifespan
 proxy_logs: List[Dict[str, Any]] = []
-next_id = 1
+_id_allocator: Optional[IdAllocator] = None
+
+def get_id_allocator() -> IdAllocator:
+    """Return the allocator shared with captured and imported flows."""
+    global _id_allocator
+    if _id_allocator is None:
+        _id_allocator = IdAllocator(get_flow_store())
+    return _id_allocator
 
 def add_to_proxy_history(log_entry: Dict[str, Any]) -> Dict[str, Any]:
-    """Add a log entry to proxy history with next sequential ID"""
-    global next_id, proxy_logs
+    """Add a log entry to proxy history with the next ID from the shared allocator"""
+    global proxy_logs
     try:
-        log_entry["id"] = next_id
+        log_entry["id"] = get_id_allocator().allocate()
         proxy_logs.append(log_entry)
-        logger.debug(f"Added log entry with ID {next_id}: {log_entry}")
-        next_id += 1
+        logger.debug(f"Added log entry with ID {log_entry['id']}: {log_entry}")
         return log_entry
     except Exception as e:
         logger.error(f"Error adding log entry: {e}")
@@ -1,6 +1,7 @@
 import pytest
 from unittest.mock import patch, MagicMock
 from datetime import datetime
+from api.flow_store import FlowStore
 
 # Sample test data with nested structure
 SAMPLE_LOG_ENTRY = {
@@ -52,12 +53,14 @@ SAMPLE_SETTINGS = {
 }
 
 @pytest.fixture
-def mock_history_path():
-    """Mock the history file path"""
-    with patch('api.routes.session_routes.HISTORY_FILE') as mock_path:
-        mock_path.exists = MagicMock(return_value=True)
-        mock_path.parent.mkdir = MagicMock()
-        yield mock_path
+def flow_store(tmp_path):
+    """Point the routes at a flow store in a temporary directory"""
+    store = FlowStore(tmp_path / "flows.db")
+    with patch('api.routes.proxy_routes.get_flow_store', return_value=store), \
+         patch('api.routes.session_routes.get_flow_store', return_value=store), \
+         patch('api.routes.settings_routes.get_flow_store', return_value=store):
+        yield store
+    store.close()
 
 @pytest.fixture
 async def mock_settings():
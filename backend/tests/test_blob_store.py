@@ -0,0 +1,190 @@
+import json
+import sqlite3
+import os
+import pytest
+from api.blob_store import BlobStore
+from api.compactor import Compactor
+from api.flow_store import SCHEMA_VERSION, FlowStore
+from conftest import SAMPLE_LOG_ENTRY
+
+def make_entry(body="same body"):
+    entry = json.loads(json.dumps(SAMPLE_LOG_ENTRY))
+    entry["response"]["content"] = body
+    return entry
+
+def blob_files(store):
+    return [p for p in store.blobs.directory.glob("*/*") if p.is_file()]
+
+def test_identical_bodies_are_stored_once(tmp_path):
+    """Test that repeated bodies share one blob file with a reference count"""
+    store = FlowStore(tmp_path / "flows.db")
+    store.append_many([make_entry() for _ in range(50)])
+
+    # One blob for the shared request body, one for the shared response body
+    assert len(blob_files(store)) == 2
+    stats = store.blob_stats()
+    assert stats["blobs"] == 2
+    assert stats["referenced_bytes"] == 50 * stats["stored_bytes"]
+    assert store.get(50)["response"]["content"] == "same body"
+
+def test_flow_rows_hold_only_references(tmp_path):
+    """Test that flow rows carry hash and size instead of the body"""
+    store = FlowStore(tmp_path / "flows.db")
+    store.append(make_entry("hello"))
+    row = store._connection().execute(
+        "SELECT response_body_hash, response_body_size FROM flows"
+    ).fetchone()
+    assert len(row[0]) == 64
+    assert row[1] == 5
+
+def test_delete_releases_unreferenced_blobs(tmp_path):
+    """Test that a blob is removed only when its last flow is deleted"""
+    store = FlowStore(tmp_path / "flows.db")
+    store.append(make_entry("shared"))
+    store.append(make_entry("shared"))
+    store.append(make_entry("unique"))
+
+    store.delete(3)
+    # Deletes only leave a tombstone; compaction releases the bodies
+    assert len(blob_files(store)) == 3
+    assert store.compact() == {"flows": 1, "blobs": 1, "bytes": len("unique")}
+    assert store.blob_stats()["blobs"] == 2
+    assert len(blob_files(store)) == 2
+
+    store.delete(1)
+    store.compact()
+    assert len(blob_files(store)) == 2
+    store.delete(2)
+    store.compact()
+    assert blob_files(store) == []
+    assert store.blob_stats()["blobs"] == 0
+
+def test_clear_removes_all_blobs(tmp_path):
+    """Test that clearing the store frees every body once compacted"""
+    store = FlowStore(tmp_path / "flows.db")
+    store.append(make_entry("a"))
+    store.append(make_entry("b"))
+    store.clear()
+    assert len(store) == 0
+    Compactor(store).run_once()
+    assert blob_files(store) == []
+    assert store.blob_stats()["blobs"] == 0
+
+def test_failed_replace_keeps_existing_blobs(tmp_path):
+    """Test that blob files are only deleted once the transaction that frees them commits"""
+    store = FlowStore(tmp_path / "flows.db")
+    store.append(make_entry("kept"))
+    before = sorted(blob_files(store))
+
+    imported = [make_entry("imported"), make_entry("imported too")]
+    imported[0]["id"] = imported[1]["id"] = 7
+    with pytest.raises(sqlite3.IntegrityError):
+        store.replace(imported)
+    assert sorted(blob_files(store)) == before
+    assert [p.name for p in store.blobs.directory.iterdir() if p.suffix == ".removed"] == []
+    assert store.get(1)["response"]["content"] == "kept"
+
+    # A freed blob written again in the same transaction survives the commit
+    store.replace([make_entry("kept")])
+    assert sorted(blob_files(store)) == before and store.get(1)["response"]["content"] == "kept"
+
+def test_rolled_back_writes_leave_no_blob_files(tmp_path):
+    """Test that blobs written by a failed batch are removed with it"""
+    store = FlowStore(tmp_path / "flows.db")
+    store.append(make_entry("existing"))
+    before = sorted(blob_files(store))
+    with pytest.raises(sqlite3.Error):
+        store.append_many([make_entry("new"), make_entry("existing")], meta={"bad": object()})
+    assert sorted(blob_files(store)) == before
+    assert store.blob_stats()["blobs"] == 2 and len(store) == 1
+
+def test_upgrades_inline_bodies(tmp_path):
+    """Test that a version 1 database with body tables is moved into blobs"""
+    path = tmp_path / "flows.db"
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE flows (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, method TEXT,
+            url TEXT, host TEXT, path TEXT, status INTEGER, content_length INTEGER,
+            request_headers TEXT, response_headers TEXT, raw_request TEXT);
+        CREATE TABLE request_bodies (flow_id INTEGER PRIMARY KEY, content TEXT);
+        CREATE TABLE response_bodies (flow_id INTEGER PRIMARY KEY, content TEXT);
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value);
+        INSERT INTO meta VALUES ('schema_version', 1);
+        INSERT INTO flows (id, method, url, status, request_headers, response_headers)
+            VALUES (1, 'GET', 'http://example.com', 200, '{}', '{}');
+        INSERT INTO response_bodies VALUES (1, 'legacy body');
+    """)
+    conn.commit()
+    conn.close()
+
+    store = FlowStore(path)
+    assert store.get(1)["response"]["content"] == "legacy body"
+    assert store.get_meta("schema_version") == SCHEMA_VERSION
+    tables = {r[0] for r in store._connection().execute("SELECT name FROM sqlite_master")}
+    assert "response_bodies" not in tables
+    assert store.append(make_entry())["id"] == 2
+
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+def test_compressed_bodies_round_trip(tmp_path, codec):
+    """Test that large bodies are compressed on disk and read back unchanged"""
+    store = FlowStore(tmp_path / "flows.db", compression=codec)
+    body = '{"items": [' + ", ".join(f'{{"id": {i}}}' for i in range(500)) + "]}"
+    store.append(make_entry(body))
+
+    stats = store.blob_stats()
+    assert stats["codecs"][codec] == 1
+    assert stats["disk_bytes"] < stats["stored_bytes"]
+    assert store.get(1)["response"]["content"] == body
+
+def test_small_and_incompressible_bodies_are_stored_raw(tmp_path):
+    """Test that compression is skipped below the threshold or when it doesn't help"""
+    blobs = BlobStore(tmp_path / "blobs", codec="zstd", min_size=64)
+    assert blobs.write("a" * 64, b"tiny") == ("none", 4)
+    noise = os.urandom(4096)
+    assert blobs.write("b" * 64, noise) == ("none", 4096)
+    assert blobs.read("b" * 64) == noise
+    assert blobs.write("c" * 64, b"x" * 4096)[0] == "zstd"
+    assert blobs.read("c" * 64, "zstd") == b"x" * 4096
+
+def test_listing_without_bodies_does_not_read_blobs(tmp_path):
+    """Test that summaries never open or decompress blob files"""
+    store = FlowStore(tmp_path / "flows.db", compression="gzip", compression_min_size=1)
+    store.append(make_entry("x" * 2048))
+    for path in blob_files(store):
+        path.unlink()
+
+    entry = store.entries(include_bodies=False)[0]
+    assert entry["response"]["content"] is None
+    assert entry["response"]["headers"] == {"Content-Type": "text/plain"}
+
+def test_codec_change_keeps_old_blobs_readable(tmp_path):
+    """Test that each blob is read with the codec it was written with"""
+    path = tmp_path / "flows.db"
+    FlowStore(path, compression="gzip").append(make_entry("a" * 4096))
+    store = FlowStore(path, compression="zstd")
+    store.append(make_entry("b" * 4096))
+    assert store.get(1)["response"]["content"] == "a" * 4096
+    assert store.get(2)["response"]["content"] == "b" * 4096
+    assert set(store.blob_stats()["codecs"]) >= {"gzip", "zstd"}
+
+def test_upgrades_uncompressed_blobs(tmp_path):
+    """Test that a version 2 blobs table gains codec and stored size columns"""
+    path = tmp_path / "flows.db"
+    store = FlowStore(path)
+    store.append(make_entry("before upgrade"))
+    conn = store._connection()
+    conn.executescript("""
+        CREATE TABLE blobs_v2 (hash TEXT PRIMARY KEY, size INTEGER NOT NULL, refcount INTEGER NOT NULL);
+        INSERT INTO blobs_v2 SELECT hash, size, refcount FROM blobs;
+        DROP TABLE blobs;
+        ALTER TABLE blobs_v2 RENAME TO blobs;
+        UPDATE meta SET value = 2 WHERE key = 'schema_version';
+    """)
+    store.close()
+
+    store = FlowStore(path, compression="zstd")
+    assert store.get_meta("schema_version") == SCHEMA_VERSION
+    assert store.get(1)["response"]["content"] == "before upgrade"
+    stats = store.blob_stats()
+    assert stats["codecs"] == {"none": 2}
+    assert stats["disk_bytes"] == stats["stored_bytes"]
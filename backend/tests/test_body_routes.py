@@ -0,0 +1,55 @@
+import json
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from api.flow_store import FlowStore
+from api.main import app
+from conftest import SAMPLE_LOG_ENTRY
+
+# Not valid UTF-8, so any text round trip would corrupt it
+BINARY_BODY = bytes(range(256)) * 64
+
+@pytest.fixture(params=["none", "zstd"])
+def client(request, tmp_path):
+    """Client whose flow store holds one flow with a binary response body"""
+    store = FlowStore(tmp_path / "flows.db", compression=request.param, compression_min_size=1)
+    entry = json.loads(json.dumps(SAMPLE_LOG_ENTRY))
+    entry["response"]["headers"] = {"Content-Type": "application/x-protobuf"}
+    entry["response"]["content"] = BINARY_BODY
+    store.append(entry)
+    with patch("api.routes.proxy_routes.get_flow_store", return_value=store):
+        yield TestClient(app)
+    store.close()
+
+def test_response_body_is_byte_exact(client):
+    """Test that binary bodies are served back unchanged with their content type"""
+    response = client.get("/api/proxy/logs/1/response/body")
+    assert response.status_code == 200
+    assert response.content == BINARY_BODY
+    assert response.headers["content-type"] == "application/x-protobuf"
+
+def test_request_body(client):
+    """Test that the request side is served from its own blob"""
+    response = client.get("/api/proxy/logs/1/request/body")
+    assert response.status_code == 200
+    assert response.content == b"test content"
+
+def test_response_body_range(client):
+    """Test that Range requests return only the requested bytes"""
+    response = client.get("/api/proxy/logs/1/response/body", headers={"Range": "bytes=1000-1999"})
+    assert response.status_code == 206
+    assert response.content == BINARY_BODY[1000:2000]
+    assert response.headers["content-range"] == f"bytes 1000-1999/{len(BINARY_BODY)}"
+
+    response = client.get("/api/proxy/logs/1/response/body", headers={"Range": "bytes=-10"})
+    assert response.status_code == 206
+    assert response.content == BINARY_BODY[-10:]
+
+def test_unsatisfiable_range(client):
+    """Test that a range past the end of the body is rejected"""
+    response = client.get("/api/proxy/logs/1/response/body", headers={"Range": "bytes=999999-"})
+    assert response.status_code == 416
+
+def test_missing_log_or_body(client):
+    """Test that unknown flows and flows without a body return 404"""
+    assert client.get("/api/proxy/logs/99/response/body").status_code == 404
@@ -0,0 +1,125 @@
+import gzip
+import hashlib
+import json
+import zlib
+import brotli
+import pytest
+import zstandard
+from api.body_spool import BodySpool
+from api.flow_store import FlowStore
+from conftest import SAMPLE_LOG_ENTRY
+
+def make_entry(content):
+    entry = json.loads(json.dumps(SAMPLE_LOG_ENTRY))
+    entry["response"]["content"] = content
+    return entry
+
+def feed(spool, chunks):
+    for chunk in chunks:
+        assert spool(chunk) == chunk
+    spool(b"")
+
+def test_small_body_stays_in_memory(tmp_path):
+    """Test that bodies under the threshold never touch the spill directory"""
+    spool = BodySpool(tmp_path / "spool", threshold=100)
+    feed(spool, [b"abc", b"def"])
+    assert spool.complete and not spool.spilled
+    assert spool.getvalue() == b"abcdef"
+    assert not (tmp_path / "spool").exists()
+
+def test_large_body_spills_to_disk(tmp_path):
+    """Test that chunks past the threshold go to a file, hashed incrementally"""
+    chunks = [bytes([i]) * 1000 for i in range(10)]
+    spool = BodySpool(tmp_path / "spool", threshold=2500)
+    feed(spool, chunks)
+    assert spool.spilled
+    assert spool.getvalue() == b""
+    assert spool.path.read_bytes() == b"".join(chunks)
+    assert spool.size == 10000
+    assert spool.digest == hashlib.sha256(b"".join(chunks)).hexdigest()
+
+    spool.discard()
+    assert list((tmp_path / "spool").iterdir()) == []
+
+def test_store_adopts_spill_file(tmp_path):
+    """Test that a spilled body becomes a blob without being copied"""
+    store = FlowStore(tmp_path / "flows.db", compression="zstd", preview_size=16)
+    body = b"0123456789" * 1000
+    spool = BodySpool(store.spool_dir, threshold=100)
+    feed(spool, [body[i:i + 512] for i in range(0, len(body), 512)])
+    spill_path = spool.path
+
+    store.append(make_entry(spool))
+    assert not spill_path.exists()
+    ref = store.body_ref(1, "response")
+    assert (ref["codec"], ref["size"]) == ("none", len(body))
+    assert ref["path"].read_bytes() == body
+
+    # A second copy of the same body only takes a reference
+    duplicate = BodySpool(store.spool_dir, threshold=100)
+    feed(duplicate, [body])
+    store.append(make_entry(duplicate))
+    assert not duplicate.path
+    assert store.blob_stats()["blobs"] == 2
+
+def test_large_bodies_are_listed_as_previews(tmp_path):
+    """Test that bodies over the preview size are truncated for display only"""
+    store = FlowStore(tmp_path / "flows.db", compression="gzip", compression_min_size=1, preview_size=16)
+    store.append(make_entry("x" * 4096))
+    response = store.get(1, preview=True)["response"]
+    assert response["content"] == "x" * 16
+    assert response["content_truncated"] is True
+    assert response["content_size"] == 4096
+
+    request = store.get(1, preview=True)["request"]
+    assert request["content"] == "test content"
+    assert "content_truncated" not in request
+
+    [row], _ = store.page("id", False, 10, with_entries=True)
+    assert row["response"]["content"] == "x" * 16 and row["response"]["content_truncated"] is True
+
+    # Full reads (exports, imports) keep the whole body
+    for entry in (store.get(1), store.entries()[0]):
+        assert entry["response"]["content"] == "x" * 4096
+        assert "content_truncated" not in entry["response"]
+
+def test_spilled_gzip_body_is_stored_decoded(tmp_path):
+    """Test that a compressed body over the threshold is decoded like an in-memory one"""
+    from api.proxy_addon import _decode_body
+    store = FlowStore(tmp_path / "flows.db", compression="none")
+    body = b"".join(b"line %d\n" % i for i in range(20000))
+    compressed = gzip.compress(body)
+    spool = BodySpool(store.spool_dir, threshold=1024)
+    feed(spool, [compressed[i:i + 4096] for i in range(0, len(compressed), 4096)])
+    assert spool.spilled and spool.size == len(compressed)
+
+    store.append(make_entry(_decode_body(spool, "gzip")))
+    store.append(make_entry(_decode_body(compressed, "gzip")))
+    spilled, buffered = store.body_ref(1, "response"), store.body_ref(2, "response")
+    assert spilled["path"].read_bytes() == body
+    assert spilled["hash"] == buffered["hash"] == hashlib.sha256(body).hexdigest()
+    assert store.blob_stats()["blobs"] == 2
+    assert list(store.spool_dir.iterdir()) == []
+
+@pytest.mark.parametrize("content_encoding, encode", [
+    ("deflate", lambda data: zlib.compress(data)),
+    ("deflate", lambda data: zlib.compress(data)[2:-4]),
+    ("br", brotli.compress),
+    ("zstd", lambda data: zstandard.ZstdCompressor().compress(data)),
+])
+def test_spilled_bodies_decode_every_supported_encoding(tmp_path, content_encoding, encode):
+    body = b"0123456789" * 1000
+    spool = BodySpool(tmp_path, threshold=10)
+    feed(spool, [encode(body)])
+    decoded = spool.decoded(content_encoding)
+    assert decoded.path.read_bytes() == body and decoded.digest == hashlib.sha256(body).hexdigest()
+    assert spool.path is None
+
+@pytest.mark.parametrize("content_encoding", ["gzip", "compress"])
+def test_undecodable_spilled_body_is_kept_raw(tmp_path, content_encoding):
+    raw = gzip.compress(b"x" * 1000)[:-10] if content_encoding == "gzip" else b"x" * 1000
+    spool = BodySpool(tmp_path, threshold=10)
+    feed(spool, [raw])
+    assert spool.decoded(content_encoding) is spool
+    assert spool.path.read_bytes() == raw
+    assert [path.name for path in tmp_path.iterdir()] == [spool.path.name]
@@ -0,0 +1,78 @@
+import os
+import pytest
+from cryptography import x509
+from mitmproxy.certs import CertStore
+from api.cert_cache import LeafCertCache, leaf_names
+from api.metrics import metrics
+
+@pytest.fixture(scope="module")
+def ca_dir(tmp_path_factory):
+    path = tmp_path_factory.mktemp("ca")
+    CertStore.from_store(path, "mitmproxy", 2048)
+    return path
+
+def certstore(ca_dir):
+    """A fresh store with the same CA, as after a proxy restart"""
+    return CertStore.from_store(ca_dir, "mitmproxy", 2048)
+
+def cached_files(cache):
+    return sorted(name for name in os.listdir(cache.directory) if name.endswith(".pem"))
+
+def test_certificates_survive_a_restart(tmp_path, ca_dir):
+    metrics.reset()
+    first = LeafCertCache(str(tmp_path / "leaf-certs"))
+    store = certstore(ca_dir)
+    first.install(store)
+    generated = store.get_cert("example.com", [x509.DNSName("example.com")])
+    assert len(cached_files(first)) == 1
+    assert metrics.counter("fart_leaf_certs_generated_total") == 1
+
+    second = LeafCertCache(str(tmp_path / "leaf-certs"))
+    store = certstore(ca_dir)
+    second.install(store)
+    loaded = store.get_cert("example.com", [x509.DNSName("example.com")])
+    assert loaded.cert == generated.cert
+    assert loaded.privatekey is store.default_privatekey
+    assert metrics.counter("fart_leaf_certs_loaded_total") == 1
+
+    # Later lookups are served from memory
+    assert store.get_cert("example.com", [x509.DNSName("example.com")]) is loaded
+    assert metrics.counter("fart_leaf_certs_loaded_total") == 1
+
+def test_least_recently_used_certificates_are_evicted(tmp_path, ca_dir):
+    cache = LeafCertCache(str(tmp_path / "leaf-certs"), max_entries=4)
+    cache.install(certstore(ca_dir))
+    for index in range(5):
+        host = f"host{index}.test"
+        cache.store.get_cert(host, [x509.DNSName(host)])
+    assert len(cached_files(cache)) == 3
+
+    cache.install(certstore(ca_dir))
+    hits = metrics.counter("fart_leaf_certs_loaded_total")
+    cache.store.get_cert("host0.test", [x509.DNSName("host0.test")])
+    cache.store.get_cert("host4.test", [x509.DNSName("host4.test")])
+    assert metrics.counter("fart_leaf_certs_loaded_total") == hits + 1
+
+def test_prewarmed_certificate_is_used_on_first_handshake(tmp_path, ca_dir):
+    cache = LeafCertCache(str(tmp_path / "leaf-certs"))
+    cache.install(certstore(ca_dir))
+    assert cache.prewarm(["127.0.0.1:8443", "api.example.test"], upstream_cert=False) == 2
+    assert cache.prewarm(["api.example.test"], upstream_cert=False) == 0
+
+    hits = metrics.counter("fart_leaf_certs_loaded_total")
+    commonname, sans, organization = leaf_names("api.example.test")
+    entry = cache.store.get_cert(commonname, sans, organization)
+    assert entry.cert.cn == "api.example.test"
+    assert metrics.counter("fart_leaf_certs_loaded_total") == hits + 1
+
+def test_a_new_ca_discards_old_certificates(tmp_path, ca_dir, tmp_path_factory):
+    cache = LeafCertCache(str(tmp_path / "leaf-certs"))
+    cache.install(certstore(ca_dir))
+    cache.store.get_cert("example.com", [x509.DNSName("example.com")])
+    old_directory = cache.directory
+
+    other_ca = tmp_path_factory.mktemp("other-ca")
+    cache.install(CertStore.from_store(other_ca, "mitmproxy", 2048))
+    assert cache.directory != old_directory
+    assert not os.path.exists(old_directory)
+    assert cached_files(cache) == []
@@ -0,0 +1,87 @@
+import json
+import time
+import pytest
+from unittest.mock import patch
+from fastapi import HTTPException
+from api.compactor import Compactor
+from api.routes import proxy_routes
+from conftest import SAMPLE_LOG_ENTRY
+
+def make_entry(body):
+    entry = json.loads(json.dumps(SAMPLE_LOG_ENTRY))
+    entry["request"]["content"] = None
+    entry["response"]["content"] = body
+    return entry
+
+def indexed_ids(store):
+    return [row[0] for row in store._connection().execute("SELECT rowid FROM flows_fts ORDER BY rowid")]
+
+@pytest.mark.asyncio
+async def test_bulk_delete_tombstones_then_compacts(flow_store):
+    """Test that deletes are deferred and the compactor releases bodies and index rows"""
+    flow_store.append_many([make_entry(f"body {i}") for i in range(1, 11)])
+    flow_store.append(make_entry("body 1"))
+    view = proxy_routes.get_live_view()
+    assert len(view) == 11
+
+    with patch.object(flow_store.blobs, "remove", side_effect=AssertionError("blob removed")):
+        result = await proxy_routes.delete_proxy_logs(ids=[1, 2], ranges=[(5, 7)], filter_expression="~b 'body 10'")
+    assert result["deleted"] == 6
+    assert [summary["id"] for summary in view.summaries()] == [3, 4, 8, 9, 11]
+    assert flow_store.pending_tombstones() == 6
+    # Still indexed, but no longer found
+    assert len(indexed_ids(flow_store)) == 11
+    assert flow_store.search("body")[0][-1]["id"] == 3
+
+    compactor = Compactor(flow_store, batch_size=4)
+    freed = compactor.run_once()
+    # "body 1" is shared with flow 11, so its blob stays
+    assert freed["flows"] == 6 and freed["blobs"] == 5 and freed["bytes"] >= len("body 2") * 5
+    assert indexed_ids(flow_store) == [3, 4, 8, 9, 11]
+    assert flow_store.get(11)["response"]["content"] == "body 1"
+
+    status = compactor.status()
+    assert status["pending"] == 0 and not status["running"]
+    assert status["flows_compacted"] == 6 and status["last_pass"]["flows"] == 6
+    assert compactor.run_once() == {"flows": 0, "blobs": 0, "bytes": 0}
+
+@pytest.mark.asyncio
+async def test_bulk_delete_needs_a_selection(flow_store):
+    with pytest.raises(HTTPException) as exc:
+        await proxy_routes.delete_proxy_logs()
+    assert exc.value.status_code == 400
+
+def test_compactor_thread_runs_when_notified(flow_store):
+    flow_store.append_many([make_entry("x" * 10000) for _ in range(3)])
+    flow_store.tombstone(ids=[1, 2, 3])
+    compactor = Compactor(flow_store, interval=60)
+    compactor.start()
+    try:
+        compactor.notify()
+        deadline = time.time() + 5
+        while flow_store.pending_tombstones() and time.time() < deadline:
+            time.sleep(0.01)
+        assert flow_store.pending_tombstones() == 0
+    finally:
+        compactor.stop()
+    assert flow_store.blob_stats()["blobs"] == 0
+
+def test_clear_hides_everything_then_compacts(flow_store):
+    """Test that a clear is immediate and the compactor frees what it hid"""
+    flow_store.append_many([make_entry(f"body {i}") for i in range(1, 6)])
+    flow_store.delete(1)
+    with patch.object(flow_store.blobs, "remove", side_effect=AssertionError("blob removed")):
+        floor = flow_store.clear()
+    assert floor == 6
+    assert len(flow_store) == 0 and flow_store.entries() == [] and flow_store.get(2) is None
+    assert flow_store.search("body")[0] == [] and flow_store.pending_tombstones() == 5
+
+    # Flows captured after the clear are unaffected
+    new = flow_store.append(make_entry("body new"))
+    assert [result["id"] for result in flow_store.search("body")[0]] == [new["id"]]
+    assert [summary["id"] for summary in flow_store.summaries()] == [new["id"]]
+
+    freed = Compactor(flow_store, batch_size=2).run_once()
+    assert freed["flows"] == 5 and freed["blobs"] == 5
+    assert indexed_ids(flow_store) == [new["id"]]
+    assert flow_store.blob_stats()["blobs"] == 1 and flow_store.pending_tombstones() == 0
@@ -0,0 +1,121 @@
+import json
+import pytest
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from api.flow_filter import compile_filter
+from api.flow_store import FlowStore
+from api.routes import proxy_routes, session_routes
+from conftest import SAMPLE_LOG_ENTRY
+
+FLOWS = [
+    # method, url, status, size, request headers, response content type, body, minutes ago
+    ("GET", "http://example.com/", 200, 512, {"Cookie": "sid=1"}, "text/html", "welcome page", 90),
+    ("POST", "http://api.example.com/v1/login", 401, 40, {"Authorization": "Bearer x"}, "application/json",
+     '{"error": "bad password"}', 30),
+    ("GET", "http://api.example.com/v2/users?page=2", 200, 20000, {}, "application/json", "[]", 10),
+    ("GET", "http://cdn.other.org/logo.png", 304, None, {}, "image/png", None, 5),
+    ("DELETE", "http://api.example.com/v1/users/7", 500, 0, {"Cookie": "sid=2"}, "text/plain", "oops", 1),
+]
+
+def make_entries():
+    now = datetime.now()
+    entries = []
+    for method, url, status, size, headers, content_type, body, ago in FLOWS:
+        entry = json.loads(json.dumps(SAMPLE_LOG_ENTRY))
+        entry["timestamp"] = (now - timedelta(minutes=ago)).isoformat()
+        entry["content_length"] = size
+        entry["request"].update(method=method, url=url, headers=headers, content=None)
+        entry["response"].update(status_code=status, headers={"Content-Type": content_type}, content=body)
+        entries.append(entry)
+    return entries
+
+@pytest.fixture
+def store(tmp_path):
+    store = FlowStore(tmp_path / "flows.db")
+    store.append_many(make_entries())
+    yield store
+    store.close()
+
+def matching(store, expression):
+    return [entry["id"] for entry in store.entries(include_bodies=False, flow_filter=compile_filter(expression))]
+
+@pytest.mark.parametrize("expression,expected", [
+    ("~m get", [1, 3, 4]),
+    ("~d api.example.com", [2, 3, 5]),
+    ("~d *.example.com", [2, 3, 5]),
+    ("~d regex:other", [4]),
+    ("~p /v1", [2, 5]),
+    ("~p /v*/users*", [3, 5]),
+    ("~p 'regex:^/v\\d/users$'", [3]),
+    ("~u page=\\d", [3]),
+    ("users", [3, 5]),
+    ("~c 200", [1, 3]),
+    ("~c 4xx", [2]),
+    ("~c 300-499", [2, 4]),
+    ("~c >=500", [5]),
+    ("~z >1k", [3]),
+    ("~z 0-512", [1, 2, 5]),
+    ("~after 20m", [3, 4, 5]),
+    ("~before 20m", [1, 2]),
+    ("~h cookie", [1, 5]),
+    ("~hq 'Cookie: sid=2'", [5]),
+    ("~hs authorization", []),
+    ("~t json", [2, 3]),
+    ('~b "bad password"', [2]),
+    ("~m GET & ~c 200", [1, 3]),
+    ("~m GET ~c 200", [1, 3]),
+    ("~c 401 | ~c 500", [2, 5]),
+    ("!~d *.example.com", [1, 4]),
+    ("~d api.example.com & !(~m GET | ~c 500)", [2]),
+    ("!~z >0", [4, 5]),
+])
+def test_filter_expressions(store, expression, expected):
+    assert matching(store, expression) == expected
+
+@pytest.mark.parametrize("expression", [
+    "", "~c", "~c abc", "~z 5q", "~x 1", "(~m GET", "~m GET)", "~u (", "~after yesterday", "~b '!!'", "|",
+])
+def test_malformed_filters_are_rejected(expression):
+    with pytest.raises(ValueError):
+        compile_filter(expression)
+
+def test_indexed_terms_use_indexes(store):
+    """Test that SQLite plans indexable terms as index seeks rather than scans"""
+    conn = store._connection()
+    for expression, index in [("~c 4xx", "idx_flows_status"), ("~m POST", "idx_flows_method"),
+                              ("~p /v1 ~u login", "idx_flows_path"), ("~after 1h", "idx_flows_timestamp")]:
+        flow_filter = compile_filter(expression)
+        plan = " ".join(row[3] for row in conn.execute(
+            f"EXPLAIN QUERY PLAN SELECT id FROM flows WHERE {flow_filter.sql}", flow_filter.params
+        ))
+        assert index in plan, (expression, plan)
+
+def test_relative_times_are_resolved_per_query():
+    """Test that a cached filter still measures spans from when it runs"""
+    flow_filter = compile_filter("~after 20m")
+    assert compile_filter("~after 20m") is flow_filter
+    cutoff = datetime.fromisoformat(flow_filter.params[0])
+    assert abs(datetime.now() - timedelta(minutes=20) - cutoff) < timedelta(seconds=5)
+
+@pytest.mark.asyncio
+async def test_list_export_and_delete_share_the_filter(flow_store):
+    flow_store.append_many(make_entries())
+
+    response = await proxy_routes.get_proxy_log_page(filter_expression="~d api.example.com", sort="status")
+    page = json.loads(response.body)
+    assert [log["id"] for log in page["data"]] == [3, 2, 5] and page["total"] == 3
+
+    exported = await session_routes.export_session("~c 200")
+    assert [log["id"] for log in exported["logs"]] == [1, 3]
+
+    view = proxy_routes.get_live_view()
+    result = await proxy_routes.delete_proxy_logs("~c >=400")
+    assert result["deleted"] == 2
+    assert [entry["id"] for entry in flow_store.entries(include_bodies=False)] == [1, 3, 4]
+    assert [summary["id"] for summary in view.summaries()] == [1, 3, 4]
+
+    for call in (proxy_routes.delete_proxy_logs("~c ("), session_routes.export_session("~q"),
+                 proxy_routes.get_proxy_log_page(filter_expression="~z big")):
+        with pytest.raises(HTTPException) as exc:
+            await call
+        assert exc.value.status_code == 400
@@ -0,0 +1,106 @@
+import json
+import pytest
+from fastapi import HTTPException
+from api.body_spool import BodySpool
+from api.flow_search import compile_query
+from api.flow_store import SCHEMA_VERSION, FlowStore
+from api.routes import proxy_routes
+from conftest import SAMPLE_LOG_ENTRY
+
+def make_entry(url="http://example.com/", body="hello", content_type="text/plain", headers=None):
+    entry = json.loads(json.dumps(SAMPLE_LOG_ENTRY))
+    entry["url"] = entry["request"]["url"] = url
+    entry["request"]["headers"] = headers or {"User-Agent": "Test"}
+    entry["request"]["content"] = None
+    entry["response"]["headers"] = {"Content-Type": content_type}
+    entry["response"]["content"] = body
+    return entry
+
+def ids(store, query, **kwargs):
+    return [match["id"] for match in store.search(query, **kwargs)[0]]
+
+def test_captured_flows_are_searchable(tmp_path):
+    """Test URL, header, body, phrase and prefix matches"""
+    store = FlowStore(tmp_path / "flows.db")
+    store.append_many([
+        make_entry("http://shop.example.com/cart?session_id=abc123", body='{"token": "s3cret-value"}',
+                   content_type="application/json"),
+        make_entry("http://api.example.com/v1/users", body="plain old text",
+                   headers={"Authorization": "Bearer eyJhbGciOi"}),
+        make_entry("http://cdn.example.com/logo.png", body=b"\x89PNG s3cret", content_type="image/png"),
+    ])
+
+    assert ids(store, "abc123") == [1]
+    assert ids(store, "session_id") == [1]
+    assert ids(store, '"old text"') == [2]
+    assert ids(store, '"text old"') == []
+    assert ids(store, "eyJhb*") == [2]
+    assert ids(store, "headers:bearer") == [2]
+    assert ids(store, "url:bearer") == []
+    assert ids(store, "example -cart") == [3, 2]
+    # Binary bodies aren't indexed
+    assert ids(store, "s3cret") == [1]
+
+    match = store.search("s3cret")[0][0]
+    assert "«s3cret»" in match["snippet"]
+
+def test_index_follows_deletes_and_clears(tmp_path):
+    store = FlowStore(tmp_path / "flows.db")
+    store.append_many([make_entry(body="needle") for _ in range(3)])
+    store.delete(2)
+    assert ids(store, "needle") == [3, 1]
+    store.replace([make_entry(body="haystack")])
+    assert ids(store, "needle") == []
+    assert ids(store, "haystack") == [1]
+    store.clear()
+    assert ids(store, "haystack") == []
+
+def test_search_pages_newest_first(tmp_path):
+    store = FlowStore(tmp_path / "flows.db")
+    store.append_many([make_entry(body=f"match {i}") for i in range(5)])
+    first, before = store.search("match", limit=2)
+    assert [m["id"] for m in first] == [5, 4] and before == 4
+    rest, before = store.search("match", limit=10, before=before)
+    assert [m["id"] for m in rest] == [3, 2, 1] and before is None
+
+def test_body_limit_and_spilled_bodies(tmp_path):
+    store = FlowStore(tmp_path / "flows.db", search_body_limit=16)
+    spool = BodySpool(tmp_path / "spool", threshold=4)
+    spool(b"streamed body text")
+    spool(b"")
+    entry = make_entry(body=spool)
+    entry["response"]["headers"] = {}
+    store.append_many([entry, make_entry(body="early words " + "x" * 64 + " late")])
+    assert ids(store, "streamed") == [1]
+    assert ids(store, "early") == [2]
+    assert ids(store, "late") == []
+
+def test_upgrade_indexes_existing_flows(tmp_path):
+    path = tmp_path / "flows.db"
+    store = FlowStore(path)
+    store.append(make_entry(body="stored before the index"))
+    store._connection().executescript("""
+        DROP TABLE flows_fts;
+        UPDATE meta SET value = 4 WHERE key = 'schema_version';
+    """)
+    store.close()
+
+    store = FlowStore(path)
+    assert store.get_meta("schema_version") == SCHEMA_VERSION
+    assert ids(store, '"before the index"') == [1]
+
+def test_queries_are_escaped():
+    assert compile_query('a"b OR c*') == '("a""b" AND "OR" AND "c"*)'
+    assert compile_query("url:x -y") == '(url : "x") NOT "y"'
+    for query in ("", "-only", "***", '"'):
+        with pytest.raises(ValueError):
+            compile_query(query)
+
+@pytest.mark.asyncio
+async def test_search_endpoint(flow_store):
+    flow_store.append(make_entry(body="findme"))
+    result = await proxy_routes.search_proxy_logs("findme")
+    assert [match["id"] for match in result["data"]] == [1] and result["next"] is None
+    with pytest.raises(HTTPException) as exc:
+        await proxy_routes.search_proxy_logs("-findme")
+    assert exc.value.status_code == 400
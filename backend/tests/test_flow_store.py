@@ -0,0 +1,76 @@
+import json
+import threading
+from api.flow_store import FlowStore
+from api.history_log import HistoryLog
+from conftest import SAMPLE_LOG_ENTRY
+
+def make_entry(url="http://example.com/index.html"):
+    entry = json.loads(json.dumps(SAMPLE_LOG_ENTRY))
+    entry["request"]["url"] = url
+    return entry
+
+def test_append_and_read_back(tmp_path):
+    """Test that entries round-trip through the store in storage format"""
+    store = FlowStore(tmp_path / "flows.db")
+    first = store.append(make_entry())
+    second = store.append(make_entry("https://api.example.com/v1/users?id=1"))
+    assert (first["id"], second["id"]) == (1, 2)
+
+    entries = store.entries()
+    assert [e["id"] for e in entries] == [1, 2]
+    assert entries[0]["request"]["headers"] == {"User-Agent": "Test"}
+    assert entries[0]["response"]["content"] == "response content"
+    assert entries[1]["url"] == "https://api.example.com/v1/users?id=1"
+
+def test_indexed_columns(tmp_path):
+    """Test that host and path are extracted into their own columns"""
+    store = FlowStore(tmp_path / "flows.db")
+    store.append(make_entry("https://api.example.com/v1/users?id=1"))
+    row = store._connection().execute("SELECT host, path, status FROM flows").fetchone()
+    assert tuple(row) == ("api.example.com", "/v1/users", 200)
+
+def test_delete_does_not_reuse_ids(tmp_path):
+    """Test that deleting the newest flow never hands its ID out again"""
+    store = FlowStore(tmp_path / "flows.db")
+    store.append(make_entry())
+    store.append(make_entry())
+    assert store.delete(2) is True
+    assert store.delete(2) is False
+    assert store.append(make_entry())["id"] == 3
+    assert store.get(2) is None
+    assert store.get(3)["request"]["content"] == "test content"
+
+def test_concurrent_writers_do_not_lose_entries(tmp_path):
+    """Test that writers on separate connections never overwrite each other"""
+    path = tmp_path / "flows.db"
+    FlowStore(path)
+
+    def writer():
+        store = FlowStore(path)
+        for _ in range(25):
+            store.append(make_entry())
+        store.close()
+
+    threads = [threading.Thread(target=writer) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    ids = [e["id"] for e in FlowStore(path).entries()]
+    assert len(ids) == 100
+    assert len(set(ids)) == 100
+
+def test_migrates_segmented_history(tmp_path):
+    """Test the one-time import of sessions/history and sessions/history.json"""
+    legacy_file = tmp_path / "history.json"
+    legacy_file.write_text(json.dumps([{**make_entry(), "id": 4}]))
+    history_dir = tmp_path / "history"
+    log = HistoryLog(history_dir, legacy_file=legacy_file)
+    log.append(make_entry())
+
+    store = FlowStore(tmp_path / "flows.db", legacy_history_dir=history_dir, legacy_file=legacy_file)
+    assert [e["id"] for e in store.entries()] == [4, 5]
+    assert not history_dir.exists()
+    assert (tmp_path / "history.migrated").exists()
+    assert store.append(make_entry())["id"] == 6
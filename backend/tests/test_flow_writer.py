@@ -0,0 +1,102 @@
+import json
+import threading
+import pytest
+from unittest.mock import MagicMock
+from api.flow_store import FlowStore
+from api.flow_writer import FlowWriter, STATS_META_KEY
+from conftest import SAMPLE_LOG_ENTRY
+
+def make_record():
+    return json.loads(json.dumps(SAMPLE_LOG_ENTRY))
+
+class BlockedStore:
+    """Store whose commits wait until the test releases them"""
+    def __init__(self):
+        self.release = threading.Event()
+        self.batches = []
+
+    def append_many(self, entries, meta=None):
+        self.release.wait(5)
+        self.batches.append(entries)
+        return entries
+
+def test_records_are_committed_in_batches(tmp_path):
+    """Test that queued records land in the store grouped into batches"""
+    store = FlowStore(tmp_path / "flows.db")
+    writer = FlowWriter(store, batch_size=10, flush_interval_ms=50)
+    writer.start()
+    for _ in range(25):
+        assert writer.submit(make_record())
+    assert writer.flush(timeout=5)
+
+    assert len(store) == 25
+    stats = writer.stats()
+    assert stats["written"] == 25
+    assert stats["batches"] < 25
+    assert json.loads(store.get_meta(STATS_META_KEY))["written"] > 0
+    writer.stop()
+
+def test_stop_commits_pending_records(tmp_path):
+    """Test that stopping the writer drains the queue first"""
+    store = FlowStore(tmp_path / "flows.db")
+    writer = FlowWriter(store, batch_size=1000, flush_interval_ms=10000)
+    writer.start()
+    for _ in range(5):
+        writer.submit(make_record())
+    writer.stop()
+    assert len(store) == 5
+
+def test_discard_queued_skips_earlier_records(tmp_path):
+    """Test that records submitted before a discard are never written"""
+    store = FlowStore(tmp_path / "flows.db")
+    writer = FlowWriter(store)
+    for _ in range(3):
+        writer.submit(make_record())
+    writer.discard_queued()
+    writer.submit(make_record())
+    writer.start()
+    writer.stop()
+    assert len(store) == 1
+    assert writer.stats()["discarded"] == 3
+
+def test_drop_flows_policy_never_blocks():
+    """Test that a full queue drops whole flows and counts them"""
+    store = BlockedStore()
+    writer = FlowWriter(store, batch_size=1, queue_size=2, backpressure="drop_flows")
+    writer.start()
+    results = [writer.submit(make_record()) for _ in range(10)]
+    assert results.count(False) >= 7
+    assert writer.stats()["dropped_flows"] == results.count(False)
+    store.release.set()
+    writer.stop()
+
+def test_drop_bodies_policy_strips_content():
+    """Test that bodies are dropped once the queue passes its high-water mark"""
+    store = BlockedStore()
+    writer = FlowWriter(store, batch_size=1, queue_size=4, backpressure="drop_bodies")
+    writer.start()
+    records = [make_record() for _ in range(5)]
+    for record in records:
+        writer.submit(record)
+    assert writer.stats()["dropped_bodies"] >= 1
+    assert records[-1]["response"]["content"] is None
+    assert records[-1]["response"]["body_dropped"] is True
+    store.release.set()
+    writer.stop()
+
+def test_prepare_errors_are_counted(tmp_path):
+    """Test that a record that fails to prepare does not sink the batch"""
+    store = FlowStore(tmp_path / "flows.db")
+    prepare = MagicMock(side_effect=[ValueError("bad"), make_record()])
+    writer = FlowWriter(store, prepare=prepare, batch_size=2)
+    writer.start()
+    writer.submit({})
+    writer.submit({})
+    writer.stop()
+    assert len(store) == 1
+    assert writer.stats()["errors"] == 1
+
+def test_unknown_policy_rejected(tmp_path):
+    """Test that an invalid backpressure policy is refused"""
+    with pytest.raises(ValueError):
+        FlowWriter(MagicMock(), backpressure="spill")
@@ -0,0 +1,71 @@
+import json
+from api.history_log import HistoryLog
+
+def make_entry(url="http://example.com"):
+    return {
+        "id": None,
+        "timestamp": "2024-03-20T10:00:00",
+        "request": {"method": "GET", "url": url, "headers": {}, "content": None},
+        "response": {"status_code": 200, "headers": {}, "content": "x" * 100}
+    }
+
+def test_append_assigns_sequential_ids(tmp_path):
+    """Test that appends assign increasing IDs and are read back in order"""
+    log = HistoryLog(tmp_path / "history")
+    ids = [log.append(make_entry())["id"] for _ in range(5)]
+    assert ids == [1, 2, 3, 4, 5]
+    assert [e["id"] for e in log.entries()] == ids
+
+def test_segments_roll_over(tmp_path):
+    """Test that the active segment is sealed once it exceeds the size limit"""
+    log = HistoryLog(tmp_path / "history", segment_max_bytes=500)
+    for _ in range(10):
+        log.append(make_entry())
+    segments = sorted((tmp_path / "history").glob("segment-*.jsonl"))
+    assert len(segments) > 1
+    assert len(log) == 10
+    assert log.get(7)["id"] == 7
+
+def test_delete_only_rewrites_owning_segment(tmp_path):
+    """Test deleting an entry leaves other segments untouched and never reuses its ID"""
+    log = HistoryLog(tmp_path / "history", segment_max_bytes=500)
+    for _ in range(10):
+        log.append(make_entry())
+    first = sorted((tmp_path / "history").glob("segment-*.jsonl"))[0]
+    before = first.stat().st_mtime_ns
+
+    assert log.delete(10) is True
+    assert log.delete(10) is False
+    assert first.stat().st_mtime_ns == before
+    assert log.append(make_entry())["id"] == 11
+
+def test_second_writer_sees_appends(tmp_path):
+    """Test that two handles on the same directory keep IDs unique"""
+    a = HistoryLog(tmp_path / "history")
+    b = HistoryLog(tmp_path / "history")
+    a.append(make_entry())
+    b.append(make_entry())
+    a.append(make_entry())
+    assert [e["id"] for e in b.entries()] == [1, 2, 3]
+
+def test_torn_line_is_skipped(tmp_path):
+    """Test that a partially written trailing line does not break reads or ID allocation"""
+    log = HistoryLog(tmp_path / "history")
+    log.append(make_entry())
+    segment = next((tmp_path / "history").glob("segment-*.jsonl"))
+    with open(segment, "a") as f:
+        f.write('{"id": 2, "trunc')
+    assert [e["id"] for e in log.entries()] == [1]
+    assert HistoryLog(tmp_path / "history").append(make_entry())["id"] == 2
+    assert [e["id"] for e in log.entries()] == [1, 2]
+
+def test_migrates_legacy_history_file(tmp_path):
+    """Test the one-time import of sessions/history.json"""
+    legacy = tmp_path / "history.json"
+    legacy.write_text(json.dumps([{**make_entry(), "id": 3}, {**make_entry(), "id": 8}]))
+
+    log = HistoryLog(tmp_path / "history", legacy_file=legacy)
+    assert [e["id"] for e in log.entries()] == [3, 8]
+    assert not legacy.exists()
+    assert (tmp_path / "history.json.migrated").exists()
+    assert log.append(make_entry())["id"] == 9
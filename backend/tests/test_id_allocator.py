@@ -0,0 +1,63 @@
+import json
+from unittest.mock import patch
+from api.flow_store import FlowStore
+from api.id_allocator import IdAllocator
+from api import state
+from conftest import SAMPLE_LOG_ENTRY
+
+def make_entry(log_id=None):
+    entry = json.loads(json.dumps(SAMPLE_LOG_ENTRY))
+    entry["id"] = log_id
+    return entry
+
+def test_blocks_are_contiguous_and_disjoint(tmp_path):
+    """Test that separate allocators reserve non-overlapping blocks"""
+    store = FlowStore(tmp_path / "flows.db")
+    a = IdAllocator(store, block_size=10)
+    b = IdAllocator(FlowStore(tmp_path / "flows.db"), block_size=10)
+    ids_a = [a.allocate() for _ in range(3)]
+    ids_b = [b.allocate() for _ in range(3)]
+    assert ids_a == [1, 2, 3]
+    assert ids_b == [11, 12, 13]
+    assert list(a.reserve(5)) == [21, 22, 23, 24, 25]
+
+def test_captured_flows_and_repeater_never_collide(tmp_path):
+    """Test that the flow store and the repeater draw from the same sequence"""
+    store = FlowStore(tmp_path / "flows.db")
+    with patch("api.state.get_flow_store", return_value=store), \
+         patch("api.state._id_allocator", None), \
+         patch("api.state.proxy_logs", []):
+        captured = store.append(make_entry())["id"]
+        repeated = state.add_to_proxy_history({"method": "GET"})["id"]
+        captured_again = store.append_many([make_entry(), make_entry()])
+    assert captured == 1
+    assert repeated == 2
+    assert [e["id"] for e in captured_again] == [3, 4]
+
+def test_import_advances_allocator(tmp_path):
+    """Test that replacing the store with imported IDs never moves the allocator back"""
+    store = FlowStore(tmp_path / "flows.db")
+    for _ in range(3):
+        store.append(make_entry())
+
+    store.replace([make_entry(40)])
+    assert store.append(make_entry())["id"] == 41
+
+    store.replace([make_entry(2)])
+    assert store.append(make_entry())["id"] == 42
+
+def test_allocator_survives_reopen(tmp_path):
+    """Test that reserved IDs are persisted, even when no flow used them"""
+    store = FlowStore(tmp_path / "flows.db")
+    store.reserve_ids(7)
+    store.close()
+    assert FlowStore(tmp_path / "flows.db").append(make_entry())["id"] == 8
+
+def test_seeds_from_existing_flows(tmp_path):
+    """Test that a database created before the allocator continues after its highest ID"""
+    store = FlowStore(tmp_path / "flows.db")
+    store.replace([make_entry(9)])
+    conn = store._connection()
+    conn.execute("DELETE FROM meta WHERE key = 'next_id'")
+    store.close()
+    assert FlowStore(tmp_path / "flows.db").append(make_entry())["id"] == 10
@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import json
+import time
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+from api import state
+from api.client_pool import ClientPool
+from api.config import settings
+from api.intruder import RequestTemplate, TokenBucket, combinations, payload_source
+from api.routes.intruder_routes import AttackRequest, run_attack
+
+def rows(attack_type, template, *specs):
+    factory, total = combinations(attack_type, template, [payload_source(spec) for spec in specs])
+    return list(factory()), total
+
+def test_template_positions_span_url_headers_and_body():
+    template = RequestTemplate("POST", "http://h/§a§?q=§b§", "POST / HTTP/1.1\nX-Id: §c§", "§d§!")
+    assert template.defaults == ["a", "b", "c", "d"]
+    assert template.render(["1", "2", "3", "4"]) == {
+        "url": "http://h/1?q=2", "headers": "POST / HTTP/1.1\nX-Id: 3", "body": "4!"
+    }
+
+def test_attack_types():
+    template = RequestTemplate("GET", "http://h/§x§/§y§", "", "")
+    letters = {"type": "list", "values": ["a", "b"]}
+    numbers = {"type": "numbers", "start": 1, "stop": 3, "format": "{:02d}"}
+
+    sniper, total = rows("sniper", template, letters)
+    assert total == 4 and [values for _, _, values in sniper] == [["a", "y"], ["b", "y"], ["x", "a"], ["x", "b"]]
+    assert [position for position, _, _ in sniper] == [0, 0, 1, 1]
+    ram, total = rows("battering_ram", template, letters)
+    assert total == 2 and [values for _, _, values in ram] == [["a", "a"], ["b", "b"]]
+    pitchfork, total = rows("pitchfork", template, letters, numbers)
+    assert total == 2 and [values for _, _, values in pitchfork] == [["a", "01"], ["b", "02"]]
+    cluster, total = rows("cluster_bomb", template, letters, numbers)
+    assert total == 6 and cluster[:4] == [(None, ["a", "01"], ["a", "01"]), (None, ["a", "02"], ["a", "02"]),
+                                          (None, ["a", "03"], ["a", "03"]), (None, ["b", "01"], ["b", "01"])]
+
+def test_payload_sources_are_streamed(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "intruder_wordlist_dir", str(tmp_path))
+    (tmp_path / "words.txt").write_text("admin\n\nroot\r\n")
+    factory, total = payload_source({"type": "file", "path": "words.txt"})
+    assert total is None and list(factory()) == ["admin", "root"]
+
+    factory, total = payload_source({"type": "brute_force", "charset": "ab", "min_length": 1, "max_length": 2})
+    assert total == 6 and list(factory()) == ["a", "b", "aa", "ab", "ba", "bb"]
+    # A huge space costs nothing until it is iterated
+    factory, total = payload_source({"type": "brute_force", "charset": "abcdefghij", "min_length": 12, "max_length": 12})
+    assert total == 10 ** 12 and next(factory()) == "a" * 12
+
+def test_file_payloads_stay_in_the_wordlist_directory(tmp_path, monkeypatch):
+    wordlists = tmp_path / "wordlists"
+    wordlists.mkdir()
+    (tmp_path / "secret.txt").write_text("password\n")
+    (wordlists / "escape.txt").symlink_to(tmp_path / "secret.txt")
+    monkeypatch.setattr(settings, "intruder_wordlist_dir", str(wordlists))
+    for path in ["../secret.txt", str(tmp_path / "secret.txt"), "/etc/passwd", "escape.txt", "."]:
+        with pytest.raises(ValueError, match="outside the wordlist directory"):
+            payload_source({"type": "file", "path": path})
+    with pytest.raises(ValueError, match="not found"):
+        payload_source({"type": "file", "path": "missing.txt"})
+
+@pytest.mark.parametrize("attack_type, specs, message", [
+    ("sniper", [], "exactly one"),
+    ("pitchfork", [{"type": "list", "values": ["a"]}], "one payload set per position"),
+    ("scatter", [{"type": "list", "values": ["a"]}], "Unknown attack type"),
+])
+def test_invalid_attacks(attack_type, specs, message):
+    template = RequestTemplate("GET", "http://h/§x§/§y§", "", "")
+    with pytest.raises(ValueError, match=message):
+        rows(attack_type, template, *specs)
+    with pytest.raises(ValueError, match="No payload positions"):
+        rows("sniper", RequestTemplate("GET", "http://h/", "", ""), {"type": "list", "values": ["a"]})
+    with pytest.raises(ValueError, match="Unknown payload type"):
+        payload_source({"type": "dictionary"})
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=50, burst=2)
+    started = time.monotonic()
+    for _ in range(7):
+        await bucket.acquire()
+    # Two from the burst, then five at 20ms each
+    assert time.monotonic() - started >= 0.09
+
+@pytest_asyncio.fixture
+async def origin():
+    """Echoes the request path; /flaky answers 503 to its first request"""
+    hits = {}
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                path = head.split(b" ")[1]
+                hits[path] = hits.get(path, 0) + 1
+                if path == b"/flaky" and hits[path] == 1:
+                    writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n")
+                else:
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(path), path))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    yield f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}", hits
+    server.close()
+    await server.wait_closed()
+
+@pytest_asyncio.fixture
+async def client_pool(monkeypatch):
+    pool = ClientPool()
+    monkeypatch.setattr(state, "client_pool", pool)
+    yield pool
+    await pool.close()
+
+async def read_events(response):
+    events = []
+    async for frame in response.body_iterator:
+        event, data = frame.strip().split("\n")
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+@pytest.mark.asyncio
+async def test_attack_streams_results_and_stores_flows(origin, flow_store, client_pool):
+    url, hits = origin
+    attack = AttackRequest(
+        request={"method": "GET", "url": f"{url}/§x§", "headers": "GET / HTTP/1.1\nX-Test: 1", "body": ""},
+        payloads=[{"type": "list", "values": ["a", "flaky", "c"]}],
+        concurrency=2, retries=1, retry_backoff_ms=0
+    )
+    events = await read_events(await run_attack(attack))
+
+    assert events[0] == ("start", {"attack_type": "sniper", "positions": 1, "total": 3})
+    results = {result["payloads"][0]: result for kind, result in events if kind == "result"}
+    assert sorted(results) == ["a", "c", "flaky"]
+    assert results["a"]["status"] == 200 and results["a"]["length"] == 2
+    assert results["a"]["body_sha256"] == hashlib.sha256(b"/a").hexdigest()
+    assert results["flaky"]["status"] == 200 and results["flaky"]["attempts"] == 2 and hits[b"/flaky"] == 2
+    assert events[-1][0] == "done" and events[-1][1]["sent"] == 3 and events[-1][1]["stored"] == 3
+
+    stored = sorted(flow_store.entries(), key=lambda entry: entry["url"])
+    assert [entry["url"] for entry in stored] == [f"{url}/a", f"{url}/c", f"{url}/flaky"]
+    assert stored[0]["request"]["headers"] == {"X-Test": "1"}
+
+@pytest.mark.asyncio
+async def test_attack_reports_unreachable_targets(flow_store, client_pool):
+    attack = AttackRequest(
+        request={"method": "GET", "url": "http://127.0.0.1:1/§x§", "headers": "", "body": ""},
+        payloads=[{"type": "numbers", "start": 1, "stop": 2}]
+    )
+    events = await read_events(await run_attack(attack))
+    results = [result for kind, result in events if kind == "result"]
+    assert len(results) == 2 and all(result["status"] is None and result["error"] for result in results)
+    assert events[-1][1]["errors"] == 2 and events[-1][1]["stored"] == 0
+
+@pytest.mark.asyncio
+async def test_invalid_attack_is_rejected_before_streaming():
+    attack = AttackRequest(
+        request={"method": "GET", "url": "http://h/", "headers": "", "body": ""},
+        payloads=[{"type": "list", "values": ["a"]}]
+    )
+    with pytest.raises(HTTPException) as error:
+        await run_attack(attack)
+    assert error.value.status_code == 400 and "No payload positions" in error.value.detail
+    attack.concurrency = 0
+    with pytest.raises(HTTPException) as error:
+        await run_attack(attack)
+    assert error.value.status_code == 400
@@ -0,0 +1,125 @@
+import asyncio
+import pytest
+import threading
+from api.ipc import IpcClient, IpcServer, LocalIpcClient
+
+async def wait_for(condition, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+@pytest.mark.asyncio
+async def test_messages_flow_both_ways(tmp_path):
+    """Test that client messages reach handlers and broadcasts reach the client"""
+    received, replies = [], []
+    server = IpcServer(tmp_path / "proxy.sock")
+    server.on("metrics", received.append)
+    await server.start()
+    client = IpcClient(server.path, on_message=replies.append, reconnect_interval=0.05)
+    client.start()
+    try:
+        await wait_for(lambda: client.connected and server.clients == 1)
+        assert client.send({"type": "metrics", "process": "proxy", "data": {"counters": []}})
+        client.send({"type": "unknown"})
+        await wait_for(lambda: received)
+        assert received == [{"type": "metrics", "process": "proxy", "data": {"counters": []}}]
+
+        assert await server.broadcast({"type": "control", "action": "ping"}) == 1
+        await wait_for(lambda: replies)
+        assert replies == [{"type": "control", "action": "ping"}]
+    finally:
+        client.stop()
+        await server.stop()
+
+@pytest.mark.asyncio
+async def test_client_drops_messages_until_server_is_up(tmp_path):
+    """Test that sending without a server is a no-op and the client reconnects later"""
+    path = tmp_path / "proxy.sock"
+    client = IpcClient(path, reconnect_interval=0.05)
+    client.start()
+    server = IpcServer(path)
+    try:
+        assert client.send({"type": "metrics"}) is False
+        received = []
+        server.on("metrics", received.append)
+        await server.start()
+        await wait_for(lambda: client.connected)
+        assert client.send({"type": "metrics"})
+        await wait_for(lambda: received)
+    finally:
+        client.stop()
+        await server.stop()
+
+@pytest.mark.asyncio
+async def test_clients_are_greeted_on_connect(tmp_path):
+    """Test that on_connect messages reach each client as it connects"""
+    replies = []
+    server = IpcServer(tmp_path / "proxy.sock")
+    server.on_connect(lambda: {"type": "scope", "enabled": False, "rules": []})
+    server.on_connect(lambda: None)
+    await server.start()
+    client = IpcClient(server.path, on_message=replies.append, reconnect_interval=0.05)
+    client.start()
+    try:
+        await wait_for(lambda: replies)
+        assert replies == [{"type": "scope", "enabled": False, "rules": []}]
+    finally:
+        client.stop()
+        await server.stop()
+
+@pytest.mark.asyncio
+async def test_requests_collect_replies(tmp_path):
+    """Test that a request waits for each client's reply and times out on silent ones"""
+    server = IpcServer(tmp_path / "proxy.sock")
+    await server.start()
+    answering = IpcClient(server.path, reconnect_interval=0.05)
+    answering.on_message = lambda message: answering.send(
+        {"type": "reply", "reply_to": message["id"], "ok": True}
+    )
+    silent = IpcClient(server.path, reconnect_interval=0.05)
+    answering.start()
+    try:
+        await wait_for(lambda: answering.connected and server.clients == 1)
+        replies = await server.request({"type": "options", "options": {}})
+        assert [reply["ok"] for reply in replies] == [True]
+
+        silent.start()
+        await wait_for(lambda: server.clients == 2)
+        replies = await server.request({"type": "options", "options": {}}, timeout=0.2)
+        assert len(replies) == 1
+    finally:
+        answering.stop()
+        silent.stop()
+        await server.stop()
+
+@pytest.mark.asyncio
+async def test_local_client_works_without_a_socket(tmp_path):
+    """Test that an in-process client is greeted, reports, and answers requests like a socket client"""
+    received, messages = [], []
+    server = IpcServer(tmp_path / "proxy.sock")
+    server.on_connect(lambda: {"type": "scope", "enabled": False, "rules": []})
+    server.on("flows", received.append)
+    await server.start()
+    client = LocalIpcClient(server)
+
+    def on_message(message):
+        messages.append(message)
+        if message["type"] == "options":
+            # Replies come from the proxy's own thread
+            threading.Thread(target=client.send, args=({"type": "reply", "reply_to": message["id"], "ok": True},)).start()
+
+    client.on_message = on_message
+    assert not client.send({"type": "flows", "flows": []})
+    client.start()
+    try:
+        await wait_for(lambda: client.connected)
+        assert server.clients == 1 and messages == [{"type": "scope", "enabled": False, "rules": []}]
+        assert client.send({"type": "flows", "flows": [{"id": 1}]})
+        await wait_for(lambda: received)
+        assert received == [{"type": "flows", "flows": [{"id": 1}]}]
+        assert [reply["ok"] for reply in await server.request({"type": "options", "options": {}})] == [True]
+    finally:
+        client.stop()
+        await wait_for(lambda: server.clients == 0)
+        await server.stop()
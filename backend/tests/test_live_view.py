@@ -0,0 +1,183 @@
+import json
+import pytest
+from unittest.mock import patch
+from api.flow_writer import FlowWriter
+from api.live_view import LiveView, flow_summary
+from api.routes import proxy_routes
+from conftest import SAMPLE_LOG_ENTRY
+
+def make_entry(url="http://example.com/"):
+    entry = json.loads(json.dumps(SAMPLE_LOG_ENTRY))
+    entry["url"] = entry["request"]["url"] = url
+    return entry
+
+async def listed_urls():
+    response = await proxy_routes.get_proxy_logs(cursor="")
+    return [log["url"] for log in json.loads(response.body)["data"]]
+
+@pytest.mark.asyncio
+async def test_published_flows_show_up_without_reloading(flow_store):
+    """Test that the list is served from memory and picks up announced flows by ID"""
+    flow_store.append(make_entry("http://a/"))
+    assert await listed_urls() == ["http://a/"]
+
+    published = []
+    writer = FlowWriter(flow_store, on_commit=published.extend)
+    writer.start()
+    writer.submit(make_entry("http://b/"))
+    writer.flush(timeout=5)
+    writer.stop()
+    assert [summary["url"] for summary in map(flow_summary, published)] == ["http://b/"]
+
+    view = proxy_routes.get_live_view()
+    version = view.version
+    with patch.object(flow_store, "entries", side_effect=AssertionError("full reload")):
+        view.add([flow_summary(entry) for entry in published])
+        assert await listed_urls() == ["http://a/", "http://b/"]
+    assert view.version > version
+
+@pytest.mark.asyncio
+async def test_deletes_and_clears_update_the_view(flow_store):
+    """Test that API-side changes are applied to the view directly"""
+    first, second = flow_store.append(make_entry("http://a/")), flow_store.append(make_entry("http://b/"))
+    assert len(proxy_routes.get_live_view()) == 2
+
+    await proxy_routes.delete_proxy_log(first["id"])
+    assert await listed_urls() == ["http://b/"]
+    await proxy_routes.clear_proxy_logs()
+    assert await listed_urls() == []
+
+    # A batch committed before the clear but announced after it stays hidden
+    view = proxy_routes.get_live_view()
+    view.add([flow_summary(second)])
+    assert await listed_urls() == []
+    later = flow_store.append(make_entry("http://c/"))
+    view.add([flow_summary(later)])
+    assert await listed_urls() == ["http://c/"]
+    view.invalidate()
+    assert view.clear_floor == later["id"] and await listed_urls() == ["http://c/"]
+
+def test_view_reloads_after_invalidate(flow_store):
+    """Test that a resync picks up flows that were never announced"""
+    view = LiveView(flow_store)
+    assert view.serialized_entries() == []
+    entry = flow_store.append(make_entry())
+    assert view.serialized_entries() == []
+    view.invalidate()
+    assert [json.loads(log) for log in view.serialized_entries()] == [flow_summary(entry)]
+
+def test_flows_announced_before_first_read_are_loaded_once(flow_store):
+    view = LiveView(flow_store)
+    entry = flow_store.append(make_entry())
+    view.add([flow_summary(entry)])
+    assert view.summaries() == [flow_summary(entry)]
+
+def parse_frame(frame):
+    fields = dict(line.split(": ", 1) for line in frame.strip().split("\n"))
+    return fields["event"], json.loads(fields["data"])
+
+@pytest.mark.asyncio
+async def test_subscribers_get_a_snapshot_then_each_change_once(flow_store):
+    """Test that every subscriber receives the same framed events"""
+    first = flow_store.append(make_entry("http://a/"))
+    view = proxy_routes.get_live_view()
+    one, two = view.subscribe(), view.subscribe(limit=1)
+
+    event, data = parse_frame(await one.get())
+    assert event == "snapshot" and [log["url"] for log in data] == ["http://a/"]
+    assert parse_frame(await two.get())[0] == "snapshot"
+
+    second = flow_store.append(make_entry("http://b/"))
+    view.add([flow_summary(second)])
+    view.remove([first["id"]])
+    frames = [await one.get(), await one.get()]
+    assert frames == [await two.get(), await two.get()]
+    assert parse_frame(frames[0])[0] == "flows"
+    assert [log["url"] for log in parse_frame(frames[0])[1]] == ["http://b/"]
+    assert parse_frame(frames[1]) == ("delete", {"ids": [first["id"]]})
+
+    view.unsubscribe(one)
+    assert await one.get() is None
+    assert view.subscribers == 1
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_is_disconnected(flow_store):
+    view = proxy_routes.get_live_view()
+    subscription = view.subscribe()
+    subscription.max_pending = 2
+    for _ in range(3):
+        view.clear()
+    assert view.subscribers == 0
+    assert subscription.closed
+
+@pytest.mark.asyncio
+async def test_stream_endpoint_sends_snapshot(flow_store):
+    """Test the SSE response framing"""
+    flow_store.append(make_entry("http://a/"))
+    response = await proxy_routes.stream_proxy_logs()
+    assert response.media_type == "text/event-stream"
+    stream = response.body_iterator
+    assert (await stream.__anext__()).startswith("retry:")
+    event, data = parse_frame(await stream.__anext__())
+    assert event == "snapshot" and data[0]["url"] == "http://a/"
+    assert proxy_routes.get_live_view().subscribers == 1
+    await stream.aclose()
+    assert proxy_routes.get_live_view().subscribers == 0
+
+async def get_logs(**kwargs):
+    response = await proxy_routes.get_proxy_logs(**kwargs)
+    return response, (json.loads(response.body) if response.body else None)
+
+@pytest.mark.asyncio
+async def test_cursor_returns_only_changes(flow_store):
+    """Test that a cursor read returns flows added since and IDs deleted since"""
+    first = flow_store.append(make_entry("http://a/"))
+    _, body = await get_logs(cursor="")
+    assert body["delta"] is False and [log["url"] for log in body["data"]] == ["http://a/"]
+    cursor = body["cursor"]
+
+    view = proxy_routes.get_live_view()
+    second = flow_store.append(make_entry("http://b/"))
+    third = flow_store.append(make_entry("http://c/"))
+    view.add([flow_summary(second), flow_summary(third)])
+    flow_store.delete(first["id"])
+    view.remove([first["id"]])
+    flow_store.delete(third["id"])
+    view.remove([third["id"]])
+
+    with patch.object(flow_store, "entries", side_effect=AssertionError("full reload")):
+        _, body = await get_logs(cursor=cursor)
+    assert body["delta"] is True
+    assert [log["url"] for log in body["data"]] == ["http://b/"]
+    assert body["deleted"] == [first["id"], third["id"]]
+
+    _, body = await get_logs(cursor=body["cursor"])
+    assert body["data"] == [] and body["deleted"] == []
+
+@pytest.mark.asyncio
+async def test_stale_cursors_get_the_full_list(flow_store):
+    flow_store.append(make_entry("http://a/"))
+    _, body = await get_logs(cursor="")
+    proxy_routes.get_live_view().invalidate()
+    for cursor in (body["cursor"], "other-1", "garbage"):
+        _, body = await get_logs(cursor=cursor)
+        assert body["delta"] is False and len(body["data"]) == 1
+
+@pytest.mark.asyncio
+async def test_since_id_and_not_modified(flow_store):
+    """Test since_id filtering and 304 for an unchanged list"""
+    first = flow_store.append(make_entry("http://a/"))
+    flow_store.append(make_entry("http://b/"))
+    response, body = await get_logs(since_id=first["id"])
+    assert [log["url"] for log in body["data"]] == ["http://b/"]
+
+    etag = response.headers["etag"]
+    with patch.object(flow_store, "summaries", side_effect=AssertionError("disk read")), \
+            patch.object(flow_store, "entries", side_effect=AssertionError("disk read")):
+        response, _ = await get_logs(if_none_match=etag)
+    assert response.status_code == 304
+
+    proxy_routes.get_live_view().remove([first["id"]])
+    response, _ = await get_logs(if_none_match=etag)
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
@@ -0,0 +1,76 @@
+import pytest
+from unittest.mock import patch
+from api.metrics import ERRORS_METRIC, STAGE_METRIC, MetricsRegistry, MetricsReporter
+from api.routes import metrics_routes
+
+def test_stage_timer_records_histogram_and_errors():
+    """Test that timed stages land in buckets and failures are counted"""
+    registry = MetricsRegistry()
+    with registry.time("logs_read"):
+        pass
+    with pytest.raises(ValueError):
+        with registry.time("logs_read"):
+            raise ValueError("boom")
+
+    text = registry.render()
+    assert f'{STAGE_METRIC}_count{{process="api",stage="logs_read"}} 2' in text
+    assert f'{STAGE_METRIC}_bucket{{process="api",stage="logs_read",le="+Inf"}} 2' in text
+    assert f'{ERRORS_METRIC}{{process="api",stage="logs_read"}} 1' in text
+    assert f"# TYPE {STAGE_METRIC} histogram" in text
+
+def test_histogram_buckets_are_cumulative():
+    """Test that bucket counts include every smaller bucket"""
+    registry = MetricsRegistry()
+    for value in (0.0002, 0.003, 0.003, 7.0):
+        registry.observe(STAGE_METRIC, value, stage="store_write")
+    text = registry.render()
+    assert f'{STAGE_METRIC}_bucket{{process="api",stage="store_write",le="0.00025"}} 1' in text
+    assert f'{STAGE_METRIC}_bucket{{process="api",stage="store_write",le="0.005"}} 3' in text
+    assert f'{STAGE_METRIC}_bucket{{process="api",stage="store_write",le="5.0"}} 3' in text
+    assert f'{STAGE_METRIC}_bucket{{process="api",stage="store_write",le="10.0"}} 4' in text
+
+def test_remote_snapshots_are_labelled_by_process():
+    """Test that a snapshot reported by the proxy renders next to local metrics"""
+    proxy = MetricsRegistry()
+    proxy.inc("fart_flows_written_total", 5)
+    with proxy.time("addon_response"):
+        pass
+
+    api = MetricsRegistry()
+    api.inc("fart_repeater_requests_total")
+    api.update_remote("proxy", proxy.snapshot())
+    text = api.render()
+    assert 'fart_flows_written_total{process="proxy"} 5' in text
+    assert 'fart_repeater_requests_total{process="api"} 1' in text
+    assert f'{STAGE_METRIC}_count{{process="proxy",stage="addon_response"}} 1' in text
+    assert 'fart_metrics_report_age_seconds{process="proxy"}' in text
+    # Each family is declared once
+    assert text.count("# TYPE fart_flows_written_total") == 1
+
+def test_reporter_derives_rates():
+    """Test that the reporter sends snapshots with per-second rates"""
+    registry = MetricsRegistry()
+    sent = []
+    reporter = MetricsReporter(sent.append, "proxy", registry=registry)
+    reporter.report()
+    registry.inc("fart_flows_written_total", 10)
+    registry.inc("fart_bytes_captured_total", 1000)
+    reporter.report()
+
+    assert [m["type"] for m in sent] == ["metrics", "metrics"]
+    gauges = {name: value for name, labels, value in sent[-1]["data"]["gauges"]}
+    assert gauges["fart_flows_per_second"] > 0
+    assert gauges["fart_bytes_per_second"] > gauges["fart_flows_per_second"]
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(flow_store):
+    """Test that /api/metrics serves Prometheus text including store size"""
+    flow_store.append({"request": {"url": "http://example.com", "content": "abc"}, "response": {}})
+    registry = MetricsRegistry()
+    with patch.object(metrics_routes, "get_flow_store", return_value=flow_store), \
+         patch.object(metrics_routes, "metrics", registry):
+        response = await metrics_routes.get_metrics()
+    assert response.media_type.startswith("text/plain")
+    text = response.body.decode()
+    assert "\nfart_store_flows 1\n" in text
+    assert "# TYPE fart_store_body_bytes gauge" in text
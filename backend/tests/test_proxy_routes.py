@@ -1,6 +1,8 @@
 import json
 import pytest
-from unittest.mock import patch, mock_open, MagicMock
+from unittest.mock import patch, MagicMock
+from fastapi import HTTPException
+from api import state
 from api.routes import proxy_routes
 
 # Sample test data
@@ -21,101 +23,168 @@ SAMPLE_LOG_ENTRY = {
 }
 
 @pytest.fixture
-def mock_history_path():
-    """Mock the history file path"""
-    with patch('api.routes.proxy_routes.HISTORY_FILE') as mock_path:
-        mock_path.exists = MagicMock(return_value=True)
-        mock_path.parent.mkdir = MagicMock()
-        yield mock_path
+def mock_flow_store(flow_store):
+    """Flow store pre-populated with the sample entry"""
+    flow_store.replace([SAMPLE_LOG_ENTRY])
+    return flow_store
 
 @pytest.mark.asyncio
-async def test_get_proxy_logs_empty(mock_history_path):
-    """Test getting proxy logs when file doesn't exist"""
-    mock_history_path.exists.return_value = False
-    
+async def test_get_proxy_logs_empty(flow_store):
+    """Test getting proxy logs when history is empty"""
     response = await proxy_routes.get_proxy_logs()
     assert response.media_type == "application/json"
     data = json.loads(response.body)
     assert data == {"data": []}
 
 @pytest.mark.asyncio
-async def test_get_proxy_logs_with_data(mock_history_path):
-    """Test getting proxy logs with existing data"""
-    mock_data = [SAMPLE_LOG_ENTRY]
-    with patch("builtins.open", mock_open(read_data=json.dumps(mock_data))):
-        response = await proxy_routes.get_proxy_logs()
-        assert response.media_type == "application/json"
-        data = json.loads(response.body)["data"]
-        assert len(data) == 1
-        log = data[0]
-        
-        # Verify top-level fields
-        assert log["id"] == 1
-        assert log["method"] == "GET"
-        assert log["url"] == "http://example.com"
-        assert log["status"] == 200
-        
-        # Verify nested request object
-        assert log["request"]["method"] == "GET"
-        assert log["request"]["url"] == "http://example.com"
-        assert log["request"]["headers"] == {"User-Agent": "Test"}
-        assert log["request"]["content"] == "test content"
-        
-        # Verify nested response object
-        assert log["response"]["status_code"] == 200
-        assert log["response"]["headers"] == {"Content-Type": "text/plain"}
-        assert log["response"]["content"] == "response content"
+async def test_get_proxy_logs_with_data(mock_flow_store):
+    """Test that the log list holds summaries and the detail route the full flow"""
+    response = await proxy_routes.get_proxy_logs()
+    assert response.media_type == "application/json"
+    data = json.loads(response.body)["data"]
+    assert len(data) == 1
+    log = data[0]
+
+    # Verify summary fields; no headers or bodies are read for the list
+    assert log["id"] == 1
+    assert log["method"] == "GET"
+    assert log["url"] == "http://example.com"
+    assert log["status"] == 200
+    assert "request" not in log and "response" not in log
+
+    log = await proxy_routes.get_proxy_log(1)
+
+    # Verify nested request object
+    assert log["request"]["method"] == "GET"
+    assert log["request"]["url"] == "http://example.com"
+    assert log["request"]["headers"] == {"User-Agent": "Test"}
+    assert log["request"]["content"] == "test content"
+
+    # Verify nested response object
+    assert log["response"]["status_code"] == 200
+    assert log["response"]["headers"] == {"Content-Type": "text/plain"}
+    assert log["response"]["content"] == "response content"
 
 @pytest.mark.asyncio
-async def test_clear_proxy_logs(mock_history_path):
-    """Test clearing proxy logs"""
-    with patch("builtins.open", mock_open()) as mock_file, \
-         patch("api.routes.proxy_routes.restart_proxy") as mock_restart:
-        response = await proxy_routes.clear_proxy_logs()
-        assert response == {"status": "ok", "message": "Proxy logs cleared"}
-        
-        # Verify file operations
-        mock_history_path.parent.mkdir.assert_called_once()
-        mock_file().write.assert_called_once_with("[]")
-        # Verify proxy restart was called
-        mock_restart.assert_called_once()
+async def test_clear_proxy_logs(mock_flow_store, monkeypatch):
+    """Test clearing proxy logs without restarting the proxy"""
+    sent = []
+
+    class FakeServer:
+        async def broadcast(self, message):
+            sent.append(message)
+            return 1
+
+    monkeypatch.setattr(state, "ipc_server", FakeServer())
+    response = await proxy_routes.clear_proxy_logs()
+    assert response == {"status": "ok", "message": "Proxy logs cleared"}
+
+    # Verify history was emptied and the addon told to drop queued flows
+    assert mock_flow_store.entries() == []
+    assert sent == [{"type": "clear", "floor": 2}]
 
 @pytest.mark.asyncio
-async def test_delete_proxy_log(mock_history_path):
+async def test_delete_proxy_log(mock_flow_store):
     """Test deleting a specific proxy log"""
-    mock_data = [SAMPLE_LOG_ENTRY]
-    with patch("builtins.open", mock_open(read_data=json.dumps(mock_data))) as mock_file:
-        response = await proxy_routes.delete_proxy_log(1)
-        assert response == {"status": "ok", "message": "Log 1 deleted"}
-        
-        # Verify file operations
-        write_call = mock_file().write.call_args[0][0]
-        written_data = json.loads(write_call)
-        assert len(written_data) == 0
+    response = await proxy_routes.delete_proxy_log(1)
+    assert response == {"status": "ok", "message": "Log 1 deleted"}
+    assert len(mock_flow_store.entries()) == 0
 
 @pytest.mark.asyncio
-async def test_delete_nonexistent_log(mock_history_path):
+async def test_delete_nonexistent_log(mock_flow_store):
     """Test deleting a log that doesn't exist"""
-    mock_data = [SAMPLE_LOG_ENTRY]
-    with patch("builtins.open", mock_open(read_data=json.dumps(mock_data))) as mock_file:
-        response = await proxy_routes.delete_proxy_log(999)
-        assert response == {"status": "ok", "message": "Log 999 deleted"}
+    response = await proxy_routes.delete_proxy_log(999)
+    assert response == {"status": "ok", "message": "Log 999 deleted"}
+    assert len(mock_flow_store.entries()) == 1
 
 @pytest.mark.asyncio
-async def test_error_handling(mock_history_path):
+async def test_error_handling(monkeypatch):
     """Test error handling when operations fail"""
-    # Test get logs error
-    mock_history_path.exists.side_effect = Exception("Test error")
-    response = await proxy_routes.get_proxy_logs()
-    assert response.media_type == "application/json"
-    assert json.loads(response.body) == {"data": []}
+    failing_log = MagicMock()
+    # The log list reads summaries (and the clear floor) when the live view loads
+    failing_log.summaries.side_effect = Exception("Test error")
+    failing_log.get_meta.side_effect = Exception("Test error")
+    failing_log.clear.side_effect = Exception("Test error")
+    failing_log.delete.side_effect = Exception("Test error")
+    monkeypatch.setattr(proxy_routes, "_live_view", None)
 
-    # Test clear logs error
-    mock_history_path.parent.mkdir.side_effect = Exception("Test error")
-    response = await proxy_routes.clear_proxy_logs()
-    assert response == {"status": "error", "message": "Test error"}
+    with patch("api.routes.proxy_routes.get_flow_store", return_value=failing_log), \
+         patch.object(proxy_routes.logger, "error") as log_error:
+        # Test get logs error
+        response = await proxy_routes.get_proxy_logs()
+        assert response.media_type == "application/json"
+        assert json.loads(response.body) == {"data": []}
+        assert failing_log.summaries.called
+        assert "Error reading proxy logs" in log_error.call_args.args[0]
 
-    # Test delete log error
-    mock_history_path.exists.side_effect = Exception("Test error")
-    response = await proxy_routes.delete_proxy_log(1)
-    assert response == {"status": "error", "message": "Test error"}
+        # Test clear logs error
+        response = await proxy_routes.clear_proxy_logs()
+        assert response == {"status": "error", "message": "Test error"}
+
+        # Test delete log error
+        response = await proxy_routes.delete_proxy_log(1)
+        assert response == {"status": "error", "message": "Test error"}
+
+def make_page_entries(statuses):
+    entries = []
+    for index, status in enumerate(statuses, start=1):
+        entry = json.loads(json.dumps(SAMPLE_LOG_ENTRY))
+        entry["id"] = index
+        entry["request"]["url"] = f"http://example.com/{index}"
+        entry["response"]["status_code"] = status
+        entries.append(entry)
+    return entries
+
+async def get_page(**kwargs):
+    response = await proxy_routes.get_proxy_log_page(**kwargs)
+    return json.loads(response.body)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("order", ["asc", "desc"])
+async def test_log_pages_cover_every_flow_once(flow_store, order):
+    """Test keyset pages sorted by a column with repeated values and NULLs"""
+    statuses = [200, None, 404, 200, None, 500, 200, 302]
+    flow_store.replace(make_page_entries(statuses))
+
+    seen, after = [], None
+    while True:
+        page = await get_page(limit=3, sort="status", order=order, after=after)
+        assert page["total"] == len(statuses)
+        assert len(page["data"]) <= 3
+        seen.extend(page["data"])
+        after = page["next"]
+        if after is None:
+            break
+
+    expected = sorted(range(1, len(statuses) + 1), key=lambda i: (statuses[i - 1] is not None, statuses[i - 1] or 0, i))
+    if order == "desc":
+        expected.reverse()
+    assert [log["id"] for log in seen] == expected
+    assert set(seen[0]) == {"id", "timestamp", "method", "url", "status", "content_length"}
+
+@pytest.mark.asyncio
+async def test_log_page_field_projection(flow_store):
+    flow_store.replace(make_page_entries([200, 404]))
+    page = await get_page(fields="status,response", sort="id", order="desc")
+    assert [set(log) for log in page["data"]] == [{"id", "status", "response"}] * 2
+    assert page["data"][0]["response"]["content"] == "response content"
+    assert page["next"] is None
+
+@pytest.mark.asyncio
+async def test_log_page_rejects_bad_arguments(flow_store):
+    flow_store.replace(make_page_entries([200, 404, 500]))
+    page = await get_page(limit=1, sort="status")
+    for kwargs in ({"fields": "password"}, {"sort": "nope"}, {"order": "sideways"},
+                   {"after": "not-a-cursor"}, {"after": page["next"], "sort": "id"}):
+        with pytest.raises(HTTPException) as exc:
+            await proxy_routes.get_proxy_log_page(**kwargs)
+        assert exc.value.status_code == 400
+
+@pytest.mark.asyncio
+async def test_get_single_log(mock_flow_store):
+    log = await proxy_routes.get_proxy_log(1)
+    assert log["request"]["headers"] == {"User-Agent": "Test"}
+    assert log["response"]["content"] == "response content"
+    with pytest.raises(HTTPException) as exc:
+        await proxy_routes.get_proxy_log(999)
+    assert exc.value.status_code == 404
@@ -0,0 +1,66 @@
+import json
+import sys
+import pytest
+from unittest.mock import patch
+from api.flow_writer import worker_stats_key
+from api.metrics import metrics
+from api.proxy_server import ProxyWorker
+from api.routes import proxy_routes
+
+def exiting_worker(tmp_path, code=3):
+    script = f"import os, sys; print('worker', os.environ['FART_PROXY_WORKER']); sys.exit({code})"
+    return ProxyWorker(1, lambda: [sys.executable, "-c", script], str(tmp_path / "mitmproxy.1.log"))
+
+def test_crashing_worker_is_restarted_with_backoff(tmp_path):
+    """Test that a worker that keeps exiting is restarted after growing delays"""
+    worker = exiting_worker(tmp_path)
+    worker.start()
+    worker.process.wait()
+    assert (tmp_path / "mitmproxy.1.log").read_text().startswith("worker 1")
+
+    first_exit = worker.started_at + 1
+    worker.supervise(first_exit)
+    assert worker.restarts == 0 and worker.last_exit_code == 3 and not worker.alive
+    worker.supervise(first_exit + 1.0)
+    assert worker.restarts == 1
+
+    worker.process.wait()
+    second_exit = worker.started_at + 1
+    worker.supervise(second_exit)
+    assert worker.restart_at == pytest.approx(second_exit + 2.0)
+
+    status = worker.status()
+    assert status["worker"] == "proxy-1" and status["index"] == 1 and status["restarts"] == 1
+    worker.stop()
+
+def test_long_running_worker_restarts_immediately(tmp_path):
+    worker = exiting_worker(tmp_path, code=0)
+    worker.start()
+    worker.process.wait()
+    worker.supervise(worker.started_at + 60)
+    assert worker.restarts == 1
+    worker.stop()
+
+@pytest.mark.asyncio
+async def test_worker_status_includes_throughput(flow_store):
+    """Test that each worker's health is merged with what it reported"""
+    statuses = [
+        {"worker": f"proxy-{index}", "index": index, "pid": 100 + index, "alive": index == 0,
+         "uptime": 5.0, "restarts": index, "last_exit_code": None, "log": None}
+        for index in range(2)
+    ]
+    metrics.update_remote("proxy-0", {"counters": [["fart_flows_written_total", {}, 40]],
+                                      "gauges": [["fart_flows_per_second", {}, 12.5],
+                                                 ["fart_capture_queue_depth", {}, 3]]})
+    flow_store.set_meta(worker_stats_key(0), json.dumps({"written": 40}))
+    try:
+        with patch("api.routes.proxy_routes.proxy_workers", return_value=statuses):
+            result = await proxy_routes.get_proxy_workers()
+    finally:
+        metrics.reset()
+
+    first, second = result["workers"]
+    assert first["flows_per_second"] == 12.5 and first["queue_depth"] == 3 and first["flows_written"] == 40
+    assert first["writer"] == {"written": 40} and first["report_age_seconds"] is not None
+    assert second["flows_per_second"] is None and second["writer"] is None and second["restarts"] == 1
+    assert result["alive"] == 1 and result["flows_per_second"] == 12.5
@@ -0,0 +1,87 @@
+import json
+import pytest
+from fastapi import HTTPException
+from api.raw_http import headers_dict, parse_header_block, render_raw_request
+from api.routes import proxy_routes
+from conftest import SAMPLE_LOG_ENTRY
+
+PAIRS = [
+    ["Host", "example.com"],
+    ["Cookie", "a=1"],
+    ["Accept", "*/*"],
+    ["Cookie", "b=2"],
+]
+
+def captured_entry():
+    entry = json.loads(json.dumps(SAMPLE_LOG_ENTRY))
+    entry["method"] = "POST"
+    entry["request"].update({
+        "method": "POST",
+        "url": "https://example.com/api/items?page=2",
+        "http_version": "HTTP/2.0",
+        "headers": PAIRS,
+        "content": '{"name": "x"}',
+    })
+    return entry
+
+def test_render_keeps_method_version_order_and_duplicates():
+    """Test that the request line and headers are rendered as captured"""
+    raw = render_raw_request("POST", "https://example.com/api/items?page=2", "HTTP/2.0", PAIRS, "body")
+    assert raw == (
+        "POST /api/items?page=2 HTTP/2.0\n"
+        "Host: example.com\n"
+        "Cookie: a=1\n"
+        "Accept: */*\n"
+        "Cookie: b=2\n"
+        "\n"
+        "body"
+    )
+
+def test_render_adds_host_when_missing():
+    """Test that HTTP/2 requests without a Host header still show the authority"""
+    raw = render_raw_request("GET", "http://example.com:8080", None, {"Accept": "*/*"})
+    assert raw.splitlines()[:3] == ["GET / HTTP/1.1", "Host: example.com:8080", "Accept: */*"]
+
+def test_headers_dict_joins_duplicates():
+    """Test that the display form merges repeated header names"""
+    assert headers_dict(PAIRS) == {"Host": "example.com", "Cookie": "a=1, b=2", "Accept": "*/*"}
+    assert headers_dict({"A": "1"}) == {"A": "1"}
+
+def test_parse_header_block_skips_request_line_and_junk():
+    """Test that repeater header text parses to ordered pairs"""
+    raw = "GET / HTTP/1.1\nHost: example.com\r\nCookie: a=1\nnot a header\n\nCookie: b=2\nX-Url: http://x:1"
+    assert parse_header_block(raw) == PAIRS[:2] + [["Cookie", "b=2"], ["X-Url", "http://x:1"]]
+    assert parse_header_block("") == []
+
+def test_store_keeps_pairs_and_no_raw_text(flow_store):
+    """Test that captured flows store ordered pairs instead of a rendered request"""
+    flow_store.append(captured_entry())
+    row = flow_store._connection().execute(
+        "SELECT request_headers, raw_request, http_version FROM flows"
+    ).fetchone()
+    assert json.loads(row[0]) == PAIRS
+    assert row[1] is None
+    assert row[2] == "HTTP/2.0"
+    assert flow_store.get(1)["request"]["headers"]["Cookie"] == "a=1, b=2"
+
+@pytest.mark.asyncio
+async def test_raw_request_endpoint(flow_store):
+    """Test that the detail endpoint renders the request on demand"""
+    flow_store.append(captured_entry())
+    response = await proxy_routes.get_proxy_log_raw_request(1)
+    text = response.body.decode()
+    assert text.startswith("POST /api/items?page=2 HTTP/2.0\nHost: example.com\n")
+    assert text.endswith('\n\n{"name": "x"}')
+
+    with pytest.raises(HTTPException) as exc:
+        await proxy_routes.get_proxy_log_raw_request(99)
+    assert exc.value.status_code == 404
+
+@pytest.mark.asyncio
+async def test_imported_raw_request_is_returned_as_is(flow_store):
+    """Test that sessions imported with raw request text keep it"""
+    entry = json.loads(json.dumps(SAMPLE_LOG_ENTRY))
+    entry["request"]["raw_request"] = "GET / HTTP/1.1\nHost: legacy\n\n"
+    flow_store.append(entry)
+    response = await proxy_routes.get_proxy_log_raw_request(1)
+    assert response.body.decode() == "GET / HTTP/1.1\nHost: legacy\n\n"
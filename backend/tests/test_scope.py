@@ -0,0 +1,109 @@
+import json
+import pytest
+from fastapi import HTTPException
+from api import state
+from api.config import settings
+from api.routes import settings_routes
+from api.scope import SCOPE_META_KEY, compile_scope
+from api.routes.settings_routes import SettingsUpdate, get_settings, update_settings
+
+def check(rules, host, path="/", method="GET", url=None):
+    scope = compile_scope(True, rules)
+    return scope.check_request(host, path, method, url or f"https://{host}{path}")
+
+def test_disabled_or_empty_scope_captures_everything():
+    """Test that no matcher is compiled when filtering is off or there are no rules"""
+    assert compile_scope(False, ["example.com"]) is None
+    assert compile_scope(True, ["", "  "]) is None
+
+def test_host_rules():
+    """Test exact hosts, wildcard suffixes and host globs"""
+    rules = ["example.com", "*.test.org", "api-*.svc.io"]
+    assert check(rules, "example.com") is True
+    assert check(rules, "www.example.com") is False
+    assert check(rules, "test.org") is True
+    assert check(rules, "a.b.test.org") is True
+    assert check(rules, "nottest.org") is False
+    assert check(rules, "api-eu.svc.io") is True
+    assert check(rules, "web.svc.io") is False
+    assert check(rules, "EXAMPLE.com") is True
+
+def test_host_with_path_prefix():
+    """Test that a host rule with a path only matches under that path"""
+    rules = ["example.com/api", "*.cdn.net/static/*.js"]
+    assert check(rules, "example.com", "/api/items?x=1") is True
+    assert check(rules, "example.com", "/login") is False
+    assert check(rules, "a.cdn.net", "/static/app.js") is True
+    assert check(rules, "a.cdn.net", "/static/app.css") is False
+
+def test_path_method_and_regex_rules():
+    """Test path prefixes and globs, methods and URL regexes"""
+    assert check(["path:/graphql"], "any.host", "/graphql?op=1") is True
+    assert check(["path:/v*/users"], "any.host", "/v2/users") is True
+    assert check(["path:/v*/users"], "any.host", "/v2/groups") is False
+    assert check(["method:post, put"], "h", method="PUT") is True
+    assert check(["method:POST"], "h", method="GET") is False
+    assert check(["regex:token=\\w+"], "h", "/cb", url="https://h/cb?token=abc") is True
+    assert check(["regex:token=\\w+"], "h", "/cb", url="https://h/cb") is False
+
+def test_excludes_win():
+    """Test that exclude rules drop flows that an include rule matched"""
+    rules = ["*.example.com", "!telemetry.example.com", "!path:/health"]
+    assert check(rules, "app.example.com") is True
+    assert check(rules, "telemetry.example.com") is False
+    assert check(rules, "app.example.com", "/health") is False
+    # Only excludes: everything else is in scope
+    assert check(["!*.google.com"], "example.com") is True
+    assert check(["!*.google.com"], "www.google.com") is False
+
+def test_content_type_rules_are_decided_on_response():
+    """Test that type: rules leave the request pending until response headers arrive"""
+    scope = compile_scope(True, ["type:json", "!type:image/*"])
+    decision = scope.check_request("h", "/", "GET")
+    assert decision is None
+    assert scope.check_response("application/json; charset=utf-8", decision) is True
+    assert scope.check_response("text/html", decision) is False
+    assert scope.needs_response
+    assert scope.check_response("image/png", True) is False
+
+def test_invalid_regex_is_rejected():
+    with pytest.raises(ValueError):
+        compile_scope(True, ["regex:("])
+
+@pytest.fixture
+def scope_settings(flow_store, monkeypatch):
+    monkeypatch.setattr(settings, "enable_filtering", False)
+    monkeypatch.setattr(settings, "filter_rules", [])
+    monkeypatch.setattr(state, "ipc_server", None)
+    yield flow_store
+
+@pytest.mark.asyncio
+async def test_update_settings_persists_and_publishes_scope(scope_settings, monkeypatch):
+    """Test that scope changes are saved and pushed to the addon without a restart"""
+    sent = []
+
+    class FakeServer:
+        async def broadcast(self, message):
+            sent.append(message)
+            return 1
+
+    monkeypatch.setattr(state, "ipc_server", FakeServer())
+    monkeypatch.setattr(settings_routes, "restart_proxy", lambda: pytest.fail("proxy restarted"))
+    result = await update_settings(SettingsUpdate(enable_filtering=True, filter_rules=["*.example.com", " "]))
+
+    assert result["enable_filtering"] is True
+    assert result["filter_rules"] == ["*.example.com"]
+    assert sent == [{"type": "scope", "enabled": True, "rules": ["*.example.com"]}]
+    assert json.loads(scope_settings.get_meta(SCOPE_META_KEY)) == {"enabled": True, "rules": ["*.example.com"]}
+
+    # Restored on the next start
+    settings.enable_filtering, settings.filter_rules = False, []
+    settings_routes.restore_scope_settings()
+    assert (await get_settings())["filter_rules"] == ["*.example.com"]
+
+@pytest.mark.asyncio
+async def test_update_settings_rejects_invalid_rules(scope_settings):
+    with pytest.raises(HTTPException) as exc:
+        await update_settings(SettingsUpdate(enable_filtering=True, filter_rules=["regex:["]))
+    assert exc.value.status_code == 400
+    assert settings.enable_filtering is False
@@ -1,14 +1,13 @@
 import json
 import pytest
-from unittest.mock import patch, mock_open
+from unittest.mock import patch
+from api.flow_store import FlowStore
 from api.routes import session_routes
 from conftest import SAMPLE_LOG_ENTRY, SAMPLE_SETTINGS, assert_dict_subset
 
 @pytest.mark.asyncio
-async def test_export_session_empty(mock_history_path, mock_settings):
+async def test_export_session_empty(flow_store, mock_settings):
     """Test exporting session with no logs"""
-    mock_history_path.exists.return_value = False
-    
     response = await session_routes.export_session()
     assert isinstance(response, dict)
     assert "logs" in response
@@ -17,49 +16,61 @@ async def test_export_session_empty(mock_history_path, mock_settings):
     assert isinstance(response["timestamp"], str)
 
 @pytest.mark.asyncio
-async def test_export_session_with_data(mock_history_path, mock_settings):
+async def test_export_session_with_data(flow_store, mock_settings):
     """Test exporting session with existing logs"""
-    mock_data = [SAMPLE_LOG_ENTRY]
-    with patch("builtins.open", mock_open(read_data=json.dumps(mock_data))):
-        response = await session_routes.export_session()
-        assert isinstance(response, dict)
-        assert len(response["logs"]) == 1
-        log = response["logs"][0]
-        
-        # Verify top-level fields
-        assert log["id"] == 1
-        assert log["method"] == "GET"
-        assert log["url"] == "http://example.com"
-        assert log["status"] == 200
-        
-        # Verify request object
-        assert log["request"]["method"] == "GET"
-        assert log["request"]["url"] == "http://example.com"
-        assert log["request"]["headers"] == {"User-Agent": "Test"}
-        assert log["request"]["content"] == "test content"
-        
-        # Verify response object
-        assert log["response"]["status_code"] == 200
-        assert log["response"]["headers"] == {"Content-Type": "text/plain"}
-        assert log["response"]["content"] == "response content"
-        
-        # Verify settings
-        assert_dict_subset(SAMPLE_SETTINGS, response["settings"])
+    flow_store.replace([SAMPLE_LOG_ENTRY])
+    response = await session_routes.export_session()
+    assert isinstance(response, dict)
+    assert len(response["logs"]) == 1
+    log = response["logs"][0]
+    
+    # Verify top-level fields
+    assert log["id"] == 1
+    assert log["method"] == "GET"
+    assert log["url"] == "http://example.com"
+    assert log["status"] == 200
+    
+    # Verify request object
+    assert log["request"]["method"] == "GET"
+    assert log["request"]["url"] == "http://example.com"
+    assert log["request"]["headers"] == {"User-Agent": "Test"}
+    assert log["request"]["content"] == "test content"
+    
+    # Verify response object
+    assert log["response"]["status_code"] == 200
+    assert log["response"]["headers"] == {"Content-Type": "text/plain"}
+    assert log["response"]["content"] == "response content"
+    
+    # Verify settings
+    assert_dict_subset(SAMPLE_SETTINGS, response["settings"])
 
 @pytest.mark.asyncio
-async def test_export_session_file_error(mock_history_path, mock_settings):
+async def test_export_session_file_error(flow_store, mock_settings):
     """Test handling file read errors during export"""
-    mock_history_path.exists.return_value = True
-    with patch("builtins.open", side_effect=Exception("Read error")):
+    with patch.object(flow_store, "entries", side_effect=Exception("Read error")):
         with pytest.raises(ValueError) as exc_info:
             await session_routes.export_session()
         assert "Failed to read history file" in str(exc_info.value)
 
 @pytest.mark.asyncio
-async def test_export_session_invalid_json(mock_history_path, mock_settings):
-    """Test handling invalid JSON in history file"""
-    mock_history_path.exists.return_value = True
-    with patch("builtins.open", mock_open(read_data="invalid json")):
-        with pytest.raises(ValueError) as exc_info:
-            await session_routes.export_session()
-        assert "Failed to read history file" in str(exc_info.value)
+async def test_export_session_sees_other_writer(flow_store, mock_settings):
+    """Test that flows written through another connection are exported"""
+    other = FlowStore(flow_store.path)
+    other.append(json.loads(json.dumps(SAMPLE_LOG_ENTRY)))
+    other.close()
+
+    response = await session_routes.export_session()
+    assert len(response["logs"]) == 1
+
+@pytest.mark.asyncio
+async def test_export_keeps_bodies_larger_than_the_preview(flow_store, mock_settings):
+    """Test that exporting and re-importing doesn't cut large bodies down to the preview"""
+    flow_store.preview_size = 16
+    entry = json.loads(json.dumps(SAMPLE_LOG_ENTRY))
+    entry["response"]["content"] = "x" * 4096
+    flow_store.replace([entry])
+
+    response = await session_routes.export_session()
+    assert response["logs"][0]["response"]["content"] == "x" * 4096
+    flow_store.replace(response["logs"])
+    assert flow_store.get(1)["response"]["content"] == "x" * 4096
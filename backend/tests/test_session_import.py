@@ -1,8 +1,6 @@
-import json
 import pytest
-from unittest.mock import patch, mock_open, MagicMock
+from unittest.mock import patch
 from datetime import datetime
-from io import StringIO
 from api.routes import session_routes
 from conftest import (
     SAMPLE_LOG_ENTRY,
@@ -10,26 +8,8 @@ from conftest import (
     SAMPLE_SETTINGS
 )
 
-class MockFileContext:
-    def __init__(self, read_data=None):
-        self.read_data = read_data
-        self.written_data = StringIO()
-
-    def __enter__(self):
-        return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        return False
-
-    def read(self):
-        return self.read_data if self.read_data else "[]"
-
-    def write(self, data):
-        self.written_data.write(data)
-        return len(data)
-
 @pytest.mark.asyncio
-async def test_import_session_valid_data_nested(mock_history_path, mock_settings):
+async def test_import_session_valid_data_nested(flow_store, mock_settings):
     """Test importing valid session data with nested structure"""
     import_data = {
         "logs": [SAMPLE_LOG_ENTRY],
@@ -37,26 +17,19 @@ async def test_import_session_valid_data_nested(mock_history_path, mock_settings
         "timestamp": datetime.now().isoformat()
     }
     
-    mock_context = MockFileContext(json.dumps([SAMPLE_LOG_ENTRY]))
-    mock_file = MagicMock(return_value=mock_context)
-    
-    with patch("builtins.open", mock_file), \
-         patch("api.state.proxy_logs", []):
+    with patch("api.state.proxy_logs", []):
         response = await session_routes.import_session(import_data)
         assert response == {"message": "Session imported successfully"}
         
-        # Verify file operations
-        mock_history_path.parent.mkdir.assert_called_once()
-        
         # Verify written data structure
-        written_data = json.loads(mock_context.written_data.getvalue())
+        written_data = flow_store.entries()
         assert len(written_data) == 1
         log = written_data[0]
         assert log["request"]["method"] == "GET"
         assert log["response"]["status_code"] == 200
 
 @pytest.mark.asyncio
-async def test_import_session_valid_data_flat(mock_history_path, mock_settings):
+async def test_import_session_valid_data_flat(flow_store, mock_settings):
     """Test importing valid session data with flat structure"""
     import_data = {
         "logs": [SAMPLE_LOG_ENTRY_FLAT],
@@ -64,19 +37,12 @@ async def test_import_session_valid_data_flat(mock_history_path, mock_settings):
         "timestamp": datetime.now().isoformat()
     }
     
-    mock_context = MockFileContext(json.dumps([SAMPLE_LOG_ENTRY_FLAT]))
-    mock_file = MagicMock(return_value=mock_context)
-    
-    with patch("builtins.open", mock_file), \
-         patch("api.state.proxy_logs", []):
+    with patch("api.state.proxy_logs", []):
         response = await session_routes.import_session(import_data)
         assert response == {"message": "Session imported successfully"}
         
-        # Verify file operations
-        mock_history_path.parent.mkdir.assert_called_once()
-        
         # Verify written data structure is transformed to nested
-        written_data = json.loads(mock_context.written_data.getvalue())
+        written_data = flow_store.entries()
         assert len(written_data) == 1
         log = written_data[0]
         assert log["request"]["method"] == "GET"
@@ -91,7 +57,7 @@ async def test_import_session_invalid_data():
     assert "Invalid session data format" in str(exc_info.value)
 
 @pytest.mark.asyncio
-async def test_import_session_invalid_log_format(mock_history_path):
+async def test_import_session_invalid_log_format(flow_store):
     """Test importing session with invalid log format"""
     invalid_log = {
         "logs": [{
@@ -108,7 +74,7 @@ async def test_import_session_invalid_log_format(mock_history_path):
     assert "Failed to transform log" in str(exc_info.value)
 
 @pytest.mark.asyncio
-async def test_import_session_file_error(mock_history_path):
+async def test_import_session_file_error(flow_store):
     """Test handling file write errors during import"""
     import_data = {
         "logs": [SAMPLE_LOG_ENTRY],
@@ -116,16 +82,13 @@ async def test_import_session_file_error(mock_history_path):
         "timestamp": datetime.now().isoformat()
     }
     
-    def mock_file_error(*args, **kwargs):
-        raise Exception("Write error")
-    
-    with patch("builtins.open", side_effect=mock_file_error):
+    with patch.object(flow_store, "replace", side_effect=Exception("Write error")):
         with pytest.raises(ValueError) as exc_info:
             await session_routes.import_session(import_data)
         assert "Failed to write logs to history file" in str(exc_info.value)
 
 @pytest.mark.asyncio
-async def test_import_session_settings_error(mock_history_path):
+async def test_import_session_settings_error(flow_store):
     """Test handling settings update errors during import"""
     import_data = {
         "logs": [SAMPLE_LOG_ENTRY],
@@ -133,11 +96,7 @@ async def test_import_session_settings_error(mock_history_path):
         "timestamp": datetime.now().isoformat()
     }
     
-    mock_context = MockFileContext(json.dumps([SAMPLE_LOG_ENTRY]))
-    mock_file = MagicMock(return_value=mock_context)
-    
-    with patch("builtins.open", mock_file), \
-         patch("api.state.proxy_logs", []), \
+    with patch("api.state.proxy_logs", []), \
          patch("api.routes.session_routes.update_settings", side_effect=Exception("Settings error")):
         with pytest.raises(ValueError) as exc_info:
             await session_routes.import_session(import_data)
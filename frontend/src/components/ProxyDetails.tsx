@@ -1,9 +1,10 @@
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import { Box, Paper, ButtonGroup, Button, Typography } from '@mui/material';
 import { ViewColumn, ViewStream, Preview, Fullscreen, FullscreenExit } from '@mui/icons-material';
-import { ProxyDetailsProps } from '../types/proxy';
+import { ProxyDetailsProps, ProxyLog } from '../types/proxy';
 import { formatRequest, formatResponse } from '../utils/httpFormatters';
 import { ResizablePanel } from './ResizablePanel';
+import proxyService from '../services/proxyService';
 
 const TextDisplay = ({ label, content }: { label: string; content: string }) => (
   <Box
@@ -89,11 +90,32 @@ const HtmlPreview = ({ content }: { content: string }) => (
   </Box>
 );
 
-export const ProxyDetails: React.FC<ProxyDetailsProps> = ({ log }) => {
+export const ProxyDetails: React.FC<ProxyDetailsProps> = ({ log: summary }) => {
   const [isSideBySide, setIsSideBySide] = useState(true);
   const [isRendering, setIsRendering] = useState(false);
   const [isFullScreen, setIsFullScreen] = useState(false);
   const [splitPosition, setSplitPosition] = useState(50);
+  const [rawRequest, setRawRequest] = useState<string | null>(null);
+  const [detail, setDetail] = useState<ProxyLog | null>(null);
+
+  // The list only carries summaries; headers and bodies are fetched for the flow being viewed,
+  // and the raw request is rendered by the backend the same way
+  const logId = summary?.id;
+  useEffect(() => {
+    setRawRequest(null);
+    setDetail(null);
+    if (logId === undefined) return;
+    let cancelled = false;
+    proxyService.getLog(logId)
+      .then(full => { if (!cancelled) setDetail(full); })
+      .catch(() => { /* show the summary alone */ });
+    proxyService.getRawRequest(logId)
+      .then(raw => { if (!cancelled) setRawRequest(raw); })
+      .catch(() => { /* fall back to formatting it locally */ });
+    return () => { cancelled = true; };
+  }, [logId]);
+
+  const log = detail?.id === logId ? detail : summary;
 
   if (!log) return null;
 
@@ -121,7 +143,7 @@ export const ProxyDetails: React.FC<ProxyDetailsProps> = ({ log }) => {
     <TextDisplay
       key="request"
       label="HTTP Request"
-      content={formatRequest(log)}
+      content={rawRequest ?? formatRequest(log)}
     />
   );
 
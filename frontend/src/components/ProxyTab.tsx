@@ -13,6 +13,7 @@ import { useProxyLogs } from '../hooks/useProxyLogs';
 import { useProxySession } from '../hooks/useProxySession';
 import { useProxyTable } from './ProxyTable/useProxyTable';
 import ProxyNotifications from './ProxyNotifications';
+import proxyService from '../services/proxyService';
 
 interface ProxyTabProps {
   repeaterState: RepeaterStateReturn;
@@ -55,11 +56,13 @@ const ProxyTab: React.FC<ProxyTabProps> = ({ repeaterState, repeaterActions }) =
 
   const [tableState, tableHandlers] = useProxyTable();
 
-  const handleSendToRepeater = useCallback((log: ProxyLog) => {
+  const handleSendToRepeater = useCallback(async (summary: ProxyLog) => {
     try {
       // Stop polling before navigation
       stopPolling();
       
+      // The list holds summaries; the repeater needs the headers and body
+      const log: ProxyLog = await proxyService.getLog(summary.id);
       const repeaterRequest = prepareRepeaterRequest(log);
       const url = new URL(log.url);
       
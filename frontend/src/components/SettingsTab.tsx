@@ -131,7 +131,7 @@ const SettingsTab: React.FC = () => {
                 onChange={handleFilterRulesChange}
                 fullWidth
                 placeholder="Enter filter rules (one per line)"
-                helperText="Example: *.google.com, *.facebook.com"
+                helperText="Only matching flows are captured. Example: *.example.com, example.com/api, method:POST, type:json, regex:..., !*.google.com to exclude"
               />
             )}
 
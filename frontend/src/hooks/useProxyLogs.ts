@@ -13,6 +13,22 @@ export interface ProxyLogsReturn {
   startPolling: () => void;
 }
 
+// Apply added or updated flows from the live stream, keeping ID order
+const mergeLogs = (current: ProxyLog[], updates: ProxyLog[]): ProxyLog[] => {
+  const updated = new Map(updates.map(log => [log.id, log]));
+  const merged = current.map(log => {
+    const update = updated.get(log.id);
+    updated.delete(log.id);
+    return update ?? log;
+  });
+  if (updated.size === 0) return merged;
+  const added = Array.from(updated.values());
+  const lastId = merged.length ? merged[merged.length - 1].id : 0;
+  const inOrder = added.every(log => log.id > lastId);
+  const result = [...merged, ...added];
+  return inOrder ? result : result.sort((a, b) => a.id - b.id);
+};
+
 export const useProxyLogs = (
   setError: (error: string | null) => void,
   setSuccess: (success: string | null) => void,
@@ -23,6 +39,9 @@ export const useProxyLogs = (
   const [isLoading, setIsLoading] = useState(false);
   const abortControllerRef = useRef<AbortController | null>(null);
   const pollingIntervalRef = useRef<NodeJS.Timeout | null>(null);
+  const eventSourceRef = useRef<EventSource | null>(null);
+  // Poll cursor: after the first fetch only changes are downloaded
+  const cursorRef = useRef<string>('');
   const isPollingEnabled = useRef(true);
   const location = useLocation();
   const lastFetchTime = useRef<number>(0);
@@ -65,11 +84,17 @@ export const useProxyLogs = (
       }
 
       setIsLoading(true);
-      const response = await proxyService.getLogs();
+      const response = await proxyService.getLogs(cursorRef.current);
       
       if (isPollingEnabled.current && location.pathname === '/') {
         console.log('Setting logs:', response.data);
-        setLogs(response.data);
+        if (response.delta) {
+          const deleted = response.deleted ?? [];
+          setLogs(prevLogs => mergeLogs(prevLogs, response.data).filter(l => !deleted.includes(l.id)));
+        } else {
+          setLogs(response.data);
+        }
+        cursorRef.current = response.cursor ?? '';
       } else {
         console.log('Skipping log update - polling disabled or route changed');
       }
@@ -118,9 +143,55 @@ export const useProxyLogs = (
     }
   }, [setError, setSuccess, setSelectedLog, selectedLog]);
 
+  const beginPolling = useCallback(() => {
+    // Immediate fetch
+    fetchLogs();
+    // Start interval
+    if (pollingIntervalRef.current) {
+      clearInterval(pollingIntervalRef.current);
+    }
+    pollingIntervalRef.current = setInterval(fetchLogs, 2000);
+    console.log('Polling started');
+  }, [fetchLogs]);
+
+  // Prefer the live stream; returns false where EventSource isn't available
+  const openStream = useCallback((): boolean => {
+    if (typeof window === 'undefined' || typeof window.EventSource === 'undefined') {
+      return false;
+    }
+    let opened = false;
+    const source = proxyService.openLogStream({
+      onOpen: () => {
+        opened = true;
+        console.log('Live log stream connected');
+      },
+      onSnapshot: snapshot => setLogs(snapshot),
+      onFlows: flows => setLogs(prevLogs => mergeLogs(prevLogs, flows)),
+      onDelete: ids => setLogs(prevLogs => prevLogs.filter(l => !ids.includes(l.id))),
+      onError: () => {
+        // Once connected, EventSource reconnects by itself and gets a fresh snapshot.
+        // If it never connected the backend has no stream, so fall back to polling.
+        if (!opened && eventSourceRef.current === source) {
+          console.log('Live log stream unavailable, falling back to polling');
+          source.close();
+          eventSourceRef.current = null;
+          if (isPollingEnabled.current) {
+            beginPolling();
+          }
+        }
+      }
+    });
+    eventSourceRef.current = source;
+    return true;
+  }, [beginPolling]);
+
   const stopPolling = useCallback(() => {
     console.log('Stopping polling');
     isPollingEnabled.current = false;
+    if (eventSourceRef.current) {
+      eventSourceRef.current.close();
+      eventSourceRef.current = null;
+    }
     if (pollingIntervalRef.current) {
       clearInterval(pollingIntervalRef.current);
       pollingIntervalRef.current = null;
@@ -139,16 +210,11 @@ export const useProxyLogs = (
     
     if (!isPollingEnabled.current && location.pathname === '/') {
       isPollingEnabled.current = true;
-      // Immediate fetch
-      fetchLogs();
-      // Start interval
-      if (pollingIntervalRef.current) {
-        clearInterval(pollingIntervalRef.current);
+      if (!openStream()) {
+        beginPolling();
       }
-      pollingIntervalRef.current = setInterval(fetchLogs, 2000);
-      console.log('Polling started');
     }
-  }, [fetchLogs, location.pathname]);
+  }, [openStream, beginPolling, location.pathname]);
 
   // Handle route changes
   useEffect(() => {
@@ -1,37 +1,78 @@
 import { LogEntry, ProxyLog } from './types';
 import loggingService from './loggingService';
-import apiClient from './apiClient';
+import apiClient, { API_BASE_URL } from './apiClient';
+
+export interface LogsResponse {
+  data: ProxyLog[];
+  // Present when a cursor was sent; delta means data holds only changes since it
+  deleted?: number[];
+  cursor?: string;
+  delta?: boolean;
+}
+
+export interface LogStreamHandlers {
+  onOpen: () => void;
+  onSnapshot: (logs: ProxyLog[]) => void;
+  onFlows: (logs: ProxyLog[]) => void;
+  onDelete: (ids: number[]) => void;
+  onError: () => void;
+}
 
 class ProxyService {
-  async getLogs(): Promise<{ data: ProxyLog[] }> {
+  async getLogs(cursor?: string): Promise<LogsResponse> {
     try {
-      const response = await apiClient.get('/proxy/logs');
+      const params = cursor !== undefined ? { cursor } : undefined;
+      const response = await apiClient.get('/proxy/logs', { params });
       const logs: ProxyLog[] = response.data.data;
-
-      // Log each proxy request
-      const logEntries: LogEntry[] = logs.map((log: ProxyLog) => ({
-        id: String(log.id), // Convert number to string for LogEntry
-        timestamp: log.timestamp,
-        type: 'request',
-        source: 'Proxy',
-        message: `${log.method} ${log.url}`,
-        details: {
-          method: log.method,
-          url: log.url,
-          status: log.status,
-          headers: log.request?.headers,
-          content: log.request?.content || undefined // Convert null to undefined
-        }
-      }));
-
-      loggingService.notifyMultiple(logEntries);
-      return { data: logs };
+      this.notifyLogs(logs);
+      return { ...response.data, data: logs };
     } catch (error) {
       console.error('Failed to fetch proxy logs:', error);
       throw error;
     }
   }
 
+  // Live flow list over server-sent events: a snapshot, then only changes
+  openLogStream(handlers: LogStreamHandlers): EventSource {
+    const source = new EventSource(`${API_BASE_URL}/proxy/stream`);
+    const parse = (event: Event) => JSON.parse((event as MessageEvent).data);
+
+    source.onopen = handlers.onOpen;
+    source.onerror = handlers.onError;
+    source.addEventListener('snapshot', event => {
+      const logs: ProxyLog[] = parse(event);
+      this.notifyLogs(logs);
+      handlers.onSnapshot(logs);
+    });
+    source.addEventListener('flows', event => {
+      const logs: ProxyLog[] = parse(event);
+      this.notifyLogs(logs);
+      handlers.onFlows(logs);
+    });
+    source.addEventListener('delete', event => handlers.onDelete(parse(event).ids));
+    return source;
+  }
+
+  private notifyLogs(logs: ProxyLog[]): void {
+    // Log each proxy request
+    const logEntries: LogEntry[] = logs.map((log: ProxyLog) => ({
+      id: String(log.id), // Convert number to string for LogEntry
+      timestamp: log.timestamp,
+      type: 'request',
+      source: 'Proxy',
+      message: `${log.method} ${log.url}`,
+      details: {
+        method: log.method,
+        url: log.url,
+        status: log.status,
+        headers: log.request?.headers,
+        content: log.request?.content || undefined // Convert null to undefined
+      }
+    }));
+
+    loggingService.notifyMultiple(logEntries);
+  }
+
   async clearLogs(): Promise<void> {
     try {
       await apiClient.post('/proxy/clear');
@@ -41,6 +82,26 @@ class ProxyService {
     }
   }
 
+  async getLog(id: number): Promise<ProxyLog> {
+    try {
+      const response = await apiClient.get(`/proxy/logs/${id}`);
+      return response.data;
+    } catch (error) {
+      console.error('Failed to fetch proxy log:', error);
+      throw error;
+    }
+  }
+
+  async getRawRequest(id: number): Promise<string> {
+    try {
+      const response = await apiClient.get(`/proxy/logs/${id}/raw`, { responseType: 'text' });
+      return response.data;
+    } catch (error) {
+      console.error('Failed to fetch raw request:', error);
+      throw error;
+    }
+  }
+
   async deleteLog(id: number): Promise<void> {
     try {
       await apiClient.delete(`/proxy/logs/${id}`);